@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# benchmark of jeeves report and remind runs against simulated Jenkins, Bugzilla, Jira and SMTP servers
+
+import os
+import sys
+import time
+import yaml
+import smtplib
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import jeeves.mail  # noqa: E402
+import jeeves.render  # noqa: E402
+
+from benchmarks.simulator import Dataset, start_servers, stop_servers  # noqa: E402
+from jeeves.common import generate_header  # noqa: E402
+from jeeves.connection import get_jenkins_server  # noqa: E402
+from jeeves.instrumentation import record_run, run_profile  # noqa: E402
+from jeeves.report import run_report  # noqa: E402
+from jeeves.remind import run_remind  # noqa: E402
+
+
+class PlainSMTP(smtplib.SMTP):
+	''' SMTP client skipping STARTTLS, as the simulated SMTP server does not support TLS
+	'''
+
+	def starttls(self, *args, **kwargs):
+		return (220, b'TLS skipped')
+
+
+def generate_config(servers, args):
+	''' takes in running simulated servers and parsed arguments
+		returns jeeves config dict pointing at the simulated servers
+	'''
+	config = {
+		'jenkins_url': servers['jenkins'].base_url,
+		'job_search_fields': 'DFG-bench',
+		'bz_url': servers['bugzilla'].base_url,
+		'jira_url': servers['jira'].base_url,
+		'jira_token': 'token',
+		'certificate': False,
+		'smtp_host': '127.0.0.1:{}'.format(servers['smtp'].server_address[1]),
+		'email_subject': 'Jeeves benchmark',
+		'email_from': 'jeeves@example.com',
+		'email_to': 'report@example.com',
+		'supported_versions': ['13', '16.1', '16.2']
+	}
+	if args.filter:
+		config['filter_param_name'] = 'PUBLISH_TO_POLARION'
+		config['filter_param_value'] = True
+		config['cause_action_class'] = 'timer'
+	for override in args.set:
+		key, value = override.split('=', 1)
+		config[key] = yaml.safe_load(value)
+	return config
+
+
+def run(mode, config, blockers, server, engine, verbose):
+	''' runs jeeves once in given mode
+		returns tuple of wall time in seconds and peak traced memory in bytes
+	'''
+	output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+	tracemalloc.start()
+	start = time.perf_counter()
+	with output, record_run(config, mode):
+		if mode == 'report':
+			header = generate_header(config['job_search_fields'])
+			run_report(config, blockers, False, 'report_template.html', False, False, server, header, engine)
+		else:
+			header = generate_header('blockers.yaml', remind=True)
+			run_remind(config, blockers, server, header, engine)
+	wall_time = time.perf_counter() - start
+	peak_memory = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return wall_time, peak_memory
+
+
+def print_results(mode, run_number, wall_time, peak_memory, servers):
+	print("{} run {}: {:.2f}s wall time, {:.1f} MiB peak traced memory".format(mode, run_number, wall_time, peak_memory / 2 ** 20))
+	print("  phases    " + ', '.join('{} {:.2f}s'.format(name, seconds) for name, seconds in run_profile.to_dict()['phases'].items()))
+	for name, server in servers.items():
+		stats = server.stats
+		unit = 'messages' if name == 'smtp' else 'requests'
+		print("  {:<9} {:>6} {} over {:>4} connections, {:>9.1f} KiB sent".format(
+			name, stats.total(), unit, stats.connections, stats.bytes_sent / 1024
+		))
+		for endpoint, count in sorted(stats.requests.items()):
+			print("    {:<14} {:>6}".format(endpoint, count))
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Benchmark Jeeves against simulated Jenkins, Bugzilla, Jira and SMTP servers')
+	parser.add_argument("--mode", default="both", choices=['report', 'remind', 'both'], help='Run mode(s) to benchmark')
+	parser.add_argument("--engine", default="sync", choices=['sync', 'async'], help='Engine used to fetch data')
+	parser.add_argument("--jobs", default=200, type=int, help='Number of simulated Jenkins jobs')
+	parser.add_argument("--history", default=20, type=int, help='Number of builds per job')
+	parser.add_argument("--filter", default=False, action='store_true', help='Filter builds by parameter and cause action class')
+	parser.add_argument("--filter-every", default=1, type=int, help='Only every n-th build matches the build filters')
+	parser.add_argument("--owners", default=20, type=int, help='Number of job owners for remind mode')
+	parser.add_argument("--latency", default=0.01, type=float, help='Latency in seconds injected into every response')
+	parser.add_argument("--error-every", default=0, type=int, help='Answer every n-th Jenkins request with 503 Service Unavailable')
+	parser.add_argument("--padding", default=20, type=int, help='Number of padding entries in full job and build payloads')
+	parser.add_argument("--runs", default=1, type=int, help='Number of consecutive runs per mode, e.g. to measure warm caches')
+	parser.add_argument("--set", default=[], action='append', help='Override a config field, e.g. --set max_workers=16')
+	parser.add_argument("--verbose", default=False, action='store_true', help='Show output of jeeves runs')
+	args = parser.parse_args()
+
+	dataset = Dataset(
+		num_jobs=args.jobs,
+		history=args.history,
+		filter_every=args.filter_every,
+		num_owners=args.owners,
+		padding=args.padding
+	)
+	servers = start_servers(dataset, latency=args.latency, error_every=args.error_every)
+	config = generate_config(servers, args)
+	server = get_jenkins_server(config)
+
+	# the simulated SMTP server does not support TLS
+	jeeves.mail.SMTP = PlainSMTP
+
+	# run in a scratch directory so archive and cache files do not end up in the repository
+	jeeves.render.TEMPLATES_DIR = os.path.join(ROOT_DIR, 'templates')
+	os.chdir(tempfile.mkdtemp(prefix='jeeves-bench-'))
+	print("Benchmarking {} jobs with {} builds each, {:.0f}ms latency, working directory {}".format(args.jobs, args.history, args.latency * 1000, os.getcwd()))
+
+	try:
+		modes = ['report', 'remind'] if args.mode == 'both' else [args.mode]
+		for mode in modes:
+			for run_number in range(1, args.runs + 1):
+				for simulated_server in servers.values():
+					simulated_server.stats.reset()
+				wall_time, peak_memory = run(mode, config, dataset.blockers(), server, args.engine, args.verbose)
+				print_results(mode, run_number, wall_time, peak_memory, servers)
+	finally:
+		stop_servers(servers)
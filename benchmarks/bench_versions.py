@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# micro-benchmark of OSP version extraction from job names
+
+import os
+import re
+import sys
+import time
+import argparse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from jeeves.jobs import DEFAULT_FILTER_VERSION, get_osp_version, get_osp_versions, match_osp_version  # noqa: E402
+
+JOB_NAME_TEMPLATES = [
+	'DFG-ceph-rhos-{version}_director-rhel-virthost-3cont_2comp_3ceph-ipv4-geneve-monolithic-{i}',
+	'DFG-upgrades-updates-from-13-to-{version}-passed_phase1-HA-ipv4-{i}',
+	'DFG-enterprise-baremetal-{version}_director-3control_2compute-titancluster-{i}',
+	'DFG-all-unified-weekly-multijob-{i}'
+]
+VERSIONS = ['13', '16', '16.1', '16.2']
+
+
+def generate_job_names(num_jobs):
+	''' returns list of num_jobs distinct job names in the style of OSP CI jobs
+	'''
+	return [
+		JOB_NAME_TEMPLATES[i % len(JOB_NAME_TEMPLATES)].format(version=VERSIONS[i % len(VERSIONS)], i=i)
+		for i in range(num_jobs)
+	]
+
+
+def get_osp_version_uncompiled(job_name, filter_version=None):
+	''' baseline implementation formatting and searching the filter_version regex on every call
+	'''
+	if not filter_version:
+		filter_version = DEFAULT_FILTER_VERSION
+	versions = re.findall(r'{filter_version}'.format(filter_version=filter_version), job_name)
+	if not versions:
+		return None
+	return '{:g}'.format(max(map(float, versions)))
+
+
+def measure(label, function, repeat):
+	''' runs function repeat times and prints the best wall time
+	'''
+	timings = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		function()
+		timings.append(time.perf_counter() - start)
+	print("  {:<34} {:>8.1f}ms".format(label, min(timings) * 1000))
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Benchmark OSP version extraction from job names')
+	parser.add_argument("--jobs", default=50000, type=int, help='Number of job names to classify')
+	parser.add_argument("--owners", default=20, type=int, help='Number of times each job is classified, e.g. once per owner in remind mode')
+	parser.add_argument("--repeat", default=5, type=int, help='Number of repetitions, the best is reported')
+	args = parser.parse_args()
+
+	job_names = generate_job_names(args.jobs)
+
+	# make sure every implementation agrees before timing them
+	expected = {job_name: get_osp_version_uncompiled(job_name) for job_name in job_names}
+	assert get_osp_versions(job_names) == expected
+
+	print("Classifying {} job names, {} times each".format(args.jobs, args.owners))
+	measure('uncompiled regex per call', lambda: [get_osp_version_uncompiled(job_name) for job_name in job_names for i in range(args.owners)], args.repeat)
+
+	def cold_batch():
+		match_osp_version.cache_clear()
+		for i in range(args.owners):
+			get_osp_versions(job_names)
+
+	measure('get_osp_versions, cold cache', cold_batch, args.repeat)
+	measure('get_osp_versions, warm cache', lambda: [get_osp_versions(job_names) for i in range(args.owners)], args.repeat)
+	measure('get_osp_version, warm cache', lambda: [get_osp_version(job_name) for job_name in job_names for i in range(args.owners)], args.repeat)
+	print("  {}".format(match_osp_version.cache_info()))
@@ -0,0 +1,409 @@
+# simulated Jenkins, Bugzilla, Jira and SMTP servers used to benchmark jeeves
+
+import json
+import time
+import threading
+import socketserver
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+VERSIONS = ['13', '16.1', '16.2']
+RESULTS = ['SUCCESS', 'SUCCESS', 'FAILURE', 'UNSTABLE', 'SUCCESS', 'ABORTED', 'SUCCESS', 'FAILURE']
+STAGES = ['Provision', 'Undercloud', 'Overcloud', 'Run Tempest Tests']
+EPOCH = 1700000000000
+
+
+def parse_tree(spec):
+	''' takes in Jenkins tree query string, e.g. jobs[name,builds[number]{0,2}]
+		returns dict with field names as keys and (subtree, range) tuples as values
+	'''
+	tree, index = parse_tree_fields(spec, 0)
+	return tree
+
+
+def parse_tree_fields(spec, index):
+	tree = {}
+	while index < len(spec) and spec[index] != ']':
+		if spec[index] == ',':
+			index += 1
+			continue
+		start = index
+		while index < len(spec) and spec[index] not in ',[]{':
+			index += 1
+		name = spec[start:index]
+		subtree = None
+		item_range = None
+		if index < len(spec) and spec[index] == '[':
+			subtree, index = parse_tree_fields(spec, index + 1)
+			index += 1
+		if index < len(spec) and spec[index] == '{':
+			end = spec.index('}', index)
+			bounds = spec[index + 1:end]
+			if ',' in bounds:
+				low, high = bounds.split(',')
+				item_range = (int(low) if low else 0, int(high) if high else None)
+			else:
+				item_range = (int(bounds), int(bounds) + 1)
+			index = end + 1
+		tree[name] = (subtree, item_range)
+	return tree, index
+
+
+def apply_tree(data, tree):
+	''' takes in JSON data and tree returned by parse_tree
+		returns data restricted to the fields and ranges of the tree, like Jenkins does
+	'''
+	if isinstance(data, list):
+		return [apply_tree(item, tree) for item in data]
+	if not isinstance(data, dict):
+		return data
+	result = {}
+	for name, (subtree, item_range) in tree.items():
+		if name not in data:
+			continue
+		value = data[name]
+		if item_range is not None and isinstance(value, list):
+			value = value[item_range[0]:item_range[1]]
+		result[name] = apply_tree(value, subtree) if subtree is not None else value
+	return result
+
+
+class Dataset:
+	''' deterministic CI data served by the simulated servers
+		every job has history builds, the newest of which is the last completed build
+		every filter_every-th build is timer triggered with PUBLISH_TO_POLARION=True
+	'''
+
+	def __init__(self, num_jobs=100, history=20, filter_every=1, num_owners=10, bugs_per_job=1, tickets_per_job=1, padding=20):
+		self.num_jobs = num_jobs
+		self.history = history
+		self.filter_every = filter_every
+		self.num_owners = num_owners
+		self.bugs_per_job = bugs_per_job
+		self.tickets_per_job = tickets_per_job
+		self.padding = padding
+		self.job_names = [
+			'DFG-bench-{:05d}-{}_director-3cont_2comp-ipv4'.format(i, VERSIONS[i % len(VERSIONS)])
+			for i in range(num_jobs)
+		]
+		self.job_index = {job_name: i for i, job_name in enumerate(self.job_names)}
+
+	def job_url(self, base_url, job_name):
+		return '{}/job/{}/'.format(base_url, job_name)
+
+	def build(self, base_url, job_name, number):
+		''' returns full build info dict of given build
+		'''
+		i = self.job_index[job_name]
+		result = RESULTS[(i + number) % len(RESULTS)]
+		matches_filter = number % self.filter_every == 0
+		cause = 'hudson.triggers.TimerTrigger$TimerTriggerCause' if matches_filter else 'hudson.model.Cause$UserIdCause'
+		version = VERSIONS[i % len(VERSIONS)]
+		return {
+			'_class': 'org.jenkinsci.plugins.workflow.job.WorkflowRun',
+			'number': number,
+			'result': result,
+			'building': False,
+			'timestamp': EPOCH + number * 3600000,
+			'url': '{}{}/'.format(self.job_url(base_url, job_name), number),
+			'previousBuild': {'number': number - 1} if number > 1 else None,
+			'actions': [
+				{'_class': 'hudson.model.ParametersAction', 'parameters': [
+					{'name': 'PUBLISH_TO_POLARION', 'value': matches_filter},
+					{'name': 'IR_PROVISION_HOST', 'value': 'host-{}.example.com'.format(i)}
+				]},
+				{'_class': 'hudson.model.CauseAction', 'causes': [{'_class': cause}]},
+				{'_class': 'hudson.tasks.junit.TestResultAction', 'failCount': (i + number) % 4, 'totalCount': 1500},
+				{'_class': 'com.jenkinsci.plugins.badge.action.BadgeSummaryAction', 'html': 'core_puddle: RHOS-{}-RHEL-8-2023{:04d}.n.1<br>'.format(version, number)}
+			],
+			'artifacts': [
+				{'displayPath': 'artifact-{}.log'.format(j), 'fileName': 'artifact-{}.log'.format(j), 'relativePath': 'logs/artifact-{}.log'.format(j)}
+				for j in range(self.padding)
+			]
+		}
+
+	def job(self, base_url, job_name):
+		''' returns full job dict with full build info dicts, newest build first
+		like Jenkins, builds only lists the newest 100 builds while allBuilds lists every build
+		'''
+		builds = [self.build(base_url, job_name, number) for number in range(self.history, 0, -1)]
+		return {
+			'_class': 'org.jenkinsci.plugins.workflow.job.WorkflowJob',
+			'name': job_name,
+			'fullName': job_name,
+			'url': self.job_url(base_url, job_name),
+			'color': 'blue',
+			'builds': builds[:100],
+			'allBuilds': builds,
+			'firstBuild': {'number': 1},
+			'lastCompletedBuild': builds[0] if builds else None,
+			'healthReport': [{'description': 'Build stability: padding', 'score': 60} for j in range(self.padding)]
+		}
+
+	def shallow_job(self, base_url, job_name):
+		''' returns job dict as served for depth=0 requests
+		'''
+		job = self.job(base_url, job_name)
+		job['builds'] = [{'number': build['number'], 'url': build['url']} for build in job['builds']]
+		del job['allBuilds']
+		if job['lastCompletedBuild'] is not None:
+			job['lastCompletedBuild'] = {'number': job['lastCompletedBuild']['number'], 'url': job['lastCompletedBuild']['url']}
+		return job
+
+	def stages(self, job_name, number):
+		i = self.job_index[job_name]
+		failed = STAGES[(i + number) % len(STAGES)]
+		return {'stages': [{'name': stage, 'status': 'FAILED' if stage == failed else 'SUCCESS'} for stage in STAGES]}
+
+	def bug_ids(self, i):
+		return [100000 + (i * self.bugs_per_job + j) % max(1, self.num_jobs // 2) for j in range(self.bugs_per_job)]
+
+	def ticket_ids(self, i):
+		return ['RHOSINFRA-{}'.format(1 + (i * self.tickets_per_job + j) % max(1, self.num_jobs // 2)) for j in range(self.tickets_per_job)]
+
+	def blockers(self):
+		''' returns blockers dict covering every job, with owners assigned round-robin
+		'''
+		return {
+			job_name: {
+				'owners': ['owner{}@example.com'.format(i % self.num_owners)],
+				'bz': self.bug_ids(i),
+				'jira': self.ticket_ids(i),
+				'other': [{'name': 'Runbook', 'url': 'https://example.com/runbook/{}'.format(i)}] if i % 5 == 0 else []
+			}
+			for i, job_name in enumerate(self.job_names)
+		}
+
+
+class Stats:
+	''' thread safe request counters of a simulated server
+	'''
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self.lock:
+			self.requests = {}
+			self.bytes_sent = 0
+			self.connections = 0
+
+	def record_connection(self):
+		with self.lock:
+			self.connections += 1
+
+	def record(self, endpoint, num_bytes):
+		with self.lock:
+			self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+			self.bytes_sent += num_bytes
+
+	def total(self):
+		return sum(self.requests.values())
+
+
+class SimulatedHandler(BaseHTTPRequestHandler):
+	''' base request handler sending JSON responses after the configured latency
+	'''
+	protocol_version = 'HTTP/1.1'
+
+	def setup(self):
+		super().setup()
+		self.server.stats.record_connection()
+
+	def log_message(self, format, *args):
+		pass
+
+	def send_json(self, endpoint, data, status=200, headers=None):
+		body = json.dumps(data).encode('utf-8')
+		time.sleep(self.server.latency)
+		self.server.stats.record(endpoint, len(body))
+		self.send_response(status)
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(body)
+
+	def send_not_found(self, endpoint):
+		self.send_json(endpoint, {'message': 'not found'}, status=404)
+
+	def do_HEAD(self):
+		self.do_GET()
+
+	def do_POST(self):
+		length = int(self.headers.get('Content-Length', 0))
+		self.rfile.read(length)
+		self.send_not_found('POST ' + urlparse(self.path).path)
+
+
+class JenkinsHandler(SimulatedHandler):
+
+	def is_unavailable(self):
+		''' returns True for every error_every-th request, which is answered as if Jenkins was overloaded
+		'''
+		if not self.server.error_every:
+			return False
+		with self.server.stats.lock:
+			self.server.num_requests += 1
+			return self.server.num_requests % self.server.error_every == 0
+
+	def do_GET(self):
+		if self.is_unavailable():
+			return self.send_json('unavailable', {'message': 'service unavailable'}, status=503, headers={'Retry-After': '0'})
+
+		url = urlparse(self.path)
+		path = [unquote(part) for part in url.path.strip('/').split('/') if part]
+		query = parse_qs(url.query)
+		tree = parse_tree(query['tree'][0]) if 'tree' in query else None
+		dataset = self.server.dataset
+		base_url = self.server.base_url
+
+		if path == ['api', 'json']:
+			if tree is not None and 'lastCompletedBuild' in (tree.get('jobs', (None, None))[0] or {}):
+				jobs = [dataset.job(base_url, job_name) for job_name in dataset.job_names]
+				return self.send_json('jobs tree', apply_tree({'jobs': jobs}, tree))
+			jobs = [{'name': job_name, 'url': dataset.job_url(base_url, job_name), 'color': 'blue'} for job_name in dataset.job_names]
+			return self.send_json('job list', {'jobs': jobs})
+
+		if len(path) >= 3 and path[0] == 'job' and path[1] in dataset.job_index:
+			job_name = path[1]
+			rest = path[2:]
+			if rest == ['api', 'json']:
+				if tree is not None:
+					return self.send_json('job tree', apply_tree(dataset.job(base_url, job_name), tree))
+				return self.send_json('job info', dataset.shallow_job(base_url, job_name))
+			if len(rest) >= 2 and rest[0].isdigit() and 1 <= int(rest[0]) <= dataset.history:
+				number = int(rest[0])
+				if rest[1:] == ['api', 'json']:
+					return self.send_json('build info', dataset.build(base_url, job_name, number))
+				if rest[1:] == ['wfapi', 'describe']:
+					return self.send_json('build stages', dataset.stages(job_name, number))
+
+		self.send_not_found('not found')
+
+
+class BugzillaHandler(SimulatedHandler):
+
+	def bugs(self, ids):
+		return [{'id': int(bug_id), 'status': 'NEW', 'summary': 'Simulated bug {}'.format(bug_id)} for bug_id in ids if str(bug_id).isdigit()]
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		query = parse_qs(url.query)
+		if url.path == '/rest/bug':
+			ids = []
+			for value in query.get('id', []):
+				ids.extend(value.split(','))
+			return self.send_json('bugs', {'bugs': self.bugs(ids), 'faults': []})
+		self.send_not_found('not found')
+
+
+class JiraHandler(SimulatedHandler):
+
+	def issue(self, key):
+		return {
+			'id': key.split('-')[-1],
+			'key': key,
+			'self': '{}/rest/api/2/issue/{}'.format(self.server.base_url, key),
+			'fields': {
+				'status': {'self': '{}/rest/api/2/status/3'.format(self.server.base_url), 'name': 'In Progress', 'id': '3'},
+				'summary': 'Simulated ticket {}'.format(key)
+			}
+		}
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		query = parse_qs(url.query)
+		if url.path == '/rest/api/2/serverInfo':
+			return self.send_json('server info', {'baseUrl': self.server.base_url, 'version': '8.20.0', 'versionNumbers': [8, 20, 0], 'deploymentType': 'Server'})
+		if url.path == '/rest/api/2/field':
+			return self.send_json('fields', [])
+		if url.path == '/rest/api/2/search':
+			jql = query.get('jql', [''])[0]
+			keys = [key.strip(' "') for key in jql.split('(', 1)[-1].rstrip(')').split(',')] if '(' in jql else []
+			issues = [self.issue(key) for key in keys if key]
+			return self.send_json('search', {'startAt': 0, 'maxResults': len(issues), 'total': len(issues), 'issues': issues})
+		if url.path.startswith('/rest/api/2/issue/'):
+			return self.send_json('issue', self.issue(url.path.rsplit('/', 1)[-1]))
+		self.send_not_found('not found')
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+	''' minimal SMTP server accepting every message, without TLS support
+	'''
+
+	def handle(self):
+		self.server.stats.record_connection()
+		self.reply('220 simulated ESMTP')
+		while True:
+			line = self.rfile.readline()
+			if not line:
+				return
+			command = line.decode('utf-8', 'replace').strip().upper()
+			if command.startswith('EHLO'):
+				self.wfile.write(b'250-simulated\r\n250 8BITMIME\r\n')
+			elif command.startswith('DATA'):
+				self.reply('354 end data with <CR><LF>.<CR><LF>')
+				num_bytes = 0
+				while True:
+					data = self.rfile.readline()
+					if not data or data == b'.\r\n':
+						break
+					num_bytes += len(data)
+				time.sleep(self.server.latency)
+				self.server.stats.record('message', num_bytes)
+				self.reply('250 OK')
+			elif command.startswith('QUIT'):
+				self.reply('221 bye')
+				return
+			else:
+				self.reply('250 OK')
+
+	def reply(self, line):
+		self.wfile.write((line + '\r\n').encode('utf-8'))
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+
+def start_server(handler, dataset, latency, server_class=ThreadingHTTPServer):
+	''' starts server for given handler on a free local port in a background thread
+		returns the running server, with its url as base_url and its counters as stats
+	'''
+	server = server_class(('127.0.0.1', 0), handler)
+	server.daemon_threads = True
+	server.dataset = dataset
+	server.latency = latency
+	server.stats = Stats()
+	server.base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+	server.error_every = 0
+	server.num_requests = 0
+	threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+	return server
+
+
+def start_servers(dataset, latency=0.0, error_every=0):
+	''' starts simulated Jenkins, Bugzilla, Jira and SMTP servers
+		optionally takes n to answer every n-th Jenkins request with 503 Service Unavailable
+		returns dict of running servers keyed by service name
+	'''
+	servers = {
+		'jenkins': start_server(JenkinsHandler, dataset, latency),
+		'bugzilla': start_server(BugzillaHandler, dataset, latency),
+		'jira': start_server(JiraHandler, dataset, latency),
+		'smtp': start_server(SMTPHandler, dataset, latency, server_class=ThreadingTCPServer)
+	}
+	servers['jenkins'].error_every = error_every
+	return servers
+
+
+def stop_servers(servers):
+	for server in servers.values():
+		server.shutdown()
+		server.server_close()
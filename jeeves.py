@@ -3,12 +3,15 @@
 import os
 import sys
 import yaml
-import jenkins
 import argparse
 
 from jeeves.report import run_report
 from jeeves.remind import run_remind
+from jeeves.serve import run_serve
 from jeeves.common import generate_header, validate_config
+from jeeves.connection import get_jenkins_server, get_job_search_fields
+from jeeves.metrics import export_metrics
+from jeeves.instrumentation import record_run, run_profile
 
 os.environ['PYTHONHTTPSVERIFY'] = '0'
 
@@ -25,9 +28,12 @@ if __name__ == '__main__':
 	parser.add_argument("--template", default="report_template.html", type=str, help='Template HTML file to use (must be in "templates" directory)')
 
 	# set configuration flags
-	parser.add_argument("--mode", default="report", type=str, choices=['report', 'remind'], help='Flag to specify which mode to run Jeeves in')
+	parser.add_argument("--mode", default="report", type=str, choices=['report', 'remind', 'serve'], help='Flag to specify which mode to run Jeeves in')
 	parser.add_argument("--no-email", default=False, action='store_true', help='Flag to not send an email of the report')
 	parser.add_argument("--test-email", default=False, action='store_true', help='Flag to send email to test email address')
+	parser.add_argument("--engine", default="sync", type=str, choices=['sync', 'async'], help='Flag to specify whether to fetch data with worker threads or asyncio (requires aiohttp)')
+	parser.add_argument("--profile", default=False, action='store_true', help='Flag to profile function calls and write the run profile to "profile.json" unless profile_file is configured')
+	parser.add_argument("--refresh-blockers", default=False, action='store_true', help='Flag to revalidate all cached bugs and tickets instead of using those fetched less than bz_cache_ttl or jira_cache_ttl seconds ago')
 
 	# parse arguments
 	args = parser.parse_args()
@@ -38,12 +44,31 @@ if __name__ == '__main__':
 	mode = args.mode
 	no_email = args.no_email
 	test_email = args.test_email
+	engine = args.engine
+	profile = args.profile
+	refresh_blockers = args.refresh_blockers
+
+	# the async engine depends on the optional aiohttp package - if not installed, log and end program execution
+	if engine == 'async':
+		try:
+			import jeeves.aio  # noqa: F401
+		except ImportError as e:
+			print("Error loading async engine, make sure aiohttp is installed: ", e)
+			sys.exit(1)
 
 	# load configuration data - if YAML format is invalid, log and end program execution
 	try:
 		with open(config_file, 'r') as file:
 			config = yaml.safe_load(file)
+
+			# in serve mode emails are only sent if a report or remind schedule is configured
+			if mode == 'serve':
+				no_email = no_email or not (config.get('report_schedule') or config.get('remind_schedule'))
 			validate_config(config, no_email, test_email)
+
+			# cached bugs and tickets are still shown if they cannot be revalidated - see blocker_cache_max_stale config field
+			if refresh_blockers:
+				config['refresh_blockers'] = True
 	except Exception as e:
 		print("Error loading configuration data: ", e)
 		sys.exit(1)
@@ -57,8 +82,9 @@ if __name__ == '__main__':
 		sys.exit(1)
 
 	# connect to jenkins server - if not possible, log and end program execution
+	# if jenkins_instances are configured, reports and reminders connect to each instance instead
 	try:
-		server = jenkins.Jenkins(config['jenkins_url'])
+		server = get_jenkins_server(config) if not config.get('jenkins_instances', None) else None
 	except Exception as e:
 		print("Error connecting to Jenkins server: ", e)
 		sys.exit(1)
@@ -70,12 +96,22 @@ if __name__ == '__main__':
 	# generate header and execute Jeeves in either 'remind' or 'report' mode
 	# if remind, header source should be blocker_file
 	# if report, header source should be job_search_fields
-	if mode == 'report':
-		header = generate_header(config['job_search_fields'], filter_param_name=fpn, filter_param_value=fpv)
-		run_report(config, blockers, preamble_file, template_file, no_email, test_email, server, header)
-	elif mode == 'remind':
-		header = generate_header(blocker_file, filter_param_name=fpn, filter_param_value=fpv, remind=True)
-		run_remind(config, blockers, server, header)
-	else:
-		print("Invalid mode selected: ", mode)
-		sys.exit(1)
+	# in serve mode jeeves keeps running, refreshing the report and reminders on schedule
+	if mode == 'serve':
+		run_serve(config, blocker_file, server, engine, preamble_file, template_file)
+		sys.exit(0)
+
+	# record where the time of the run goes - see profile_file and archive_profile config fields
+	with record_run(config, mode, profile_functions=profile):
+		if mode == 'report':
+			header = generate_header(get_job_search_fields(config), filter_param_name=fpn, filter_param_value=fpv)
+			run_stats = run_report(config, blockers, preamble_file, template_file, no_email, test_email, server, header, engine)
+		elif mode == 'remind':
+			header = generate_header(blocker_file, filter_param_name=fpn, filter_param_value=fpv, remind=True)
+			run_stats = run_remind(config, blockers, server, header, engine)
+		else:
+			print("Invalid mode selected: ", mode)
+			sys.exit(1)
+
+	# export CI health and run metrics for scraping - see metrics_file config field
+	export_metrics(config, mode, run_stats, run_profile.to_dict())
@@ -0,0 +1,301 @@
+# library functions for fetching report data with asyncio, used by the async engine
+# requires the optional aiohttp package
+
+import os
+import ssl
+import time
+import asyncio
+import aiohttp
+
+from urllib.parse import quote
+
+from jeeves.instrumentation import get_trace_config, run_profile
+from jeeves.blockers import DEFAULT_BZ_CACHE_TTL, DEFAULT_JIRA_CACHE_TTL, build_bugs_dict, build_tickets_dict, get_blocker_cache, get_bugs_params, get_bugs_requests, get_bugs_tracker, get_cached_blockers, get_tickets_chunks, get_tickets_jql, get_tickets_tracker, update_cached_blockers, update_cached_bugs
+from jeeves.jobs import DEFAULT_MAX_WORKERS, get_jenkins_job_info_requests, get_jenkins_jobs_tree_requests
+from jeeves.resilience import RETRY_STATUSES, get_jenkins_resilience
+
+DEFAULT_ASYNC_MAX_CONNECTIONS = 32
+DEFAULT_ASYNC_TIMEOUT = 60
+
+
+class AsyncJenkins:
+	''' async client for the subset of the Jenkins API used by jeeves
+		methods mirror those of jenkins.Jenkins, so the *_requests generators in jeeves.jobs can be run against either
+		failed requests are retried according to the given JenkinsResilience and authenticated with the given auth, if any
+		TLS certificates are verified according to get_https_verify_ssl, like the requests of jenkins.Jenkins
+	'''
+
+	def __init__(self, session, url, resilience, auth=None):
+		self.session = session
+		self.server = url.rstrip('/') + '/'
+		self.resilience = resilience
+		self.auth = auth
+		self.ssl = get_https_verify_ssl()
+
+	async def get_json(self, path):
+		attempt = 0
+		while True:
+			self.resilience.check_circuit()
+			try:
+				async with self.session.get(self.server + path, auth=self.auth, ssl=self.ssl) as response:
+					if response.status not in RETRY_STATUSES:
+						self.resilience.record_success()
+						response.raise_for_status()
+						return await response.json(content_type=None)
+					delay = self.resilience.get_retry_delay(attempt, response.headers.get('Retry-After'))
+					if delay is None:
+						self.resilience.record_failure()
+						response.raise_for_status()
+			except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+				delay = self.resilience.get_retry_delay(attempt)
+				if delay is None:
+					self.resilience.record_failure()
+					raise
+			await asyncio.sleep(delay)
+			attempt += 1
+
+	async def get_info(self, item='', query=None):
+		path = quote('/'.join((item, 'api/json')).lstrip('/'))
+		if query:
+			path += query
+		return await self.get_json(path)
+
+	async def get_job_info(self, job_name):
+		return await self.get_json(get_job_path(job_name) + '/api/json?depth=0')
+
+	async def get_build_info(self, job_name, number):
+		return await self.get_json('{}/{}/api/json?depth=0'.format(get_job_path(job_name), number))
+
+	async def get_build_stages(self, job_name, number):
+		try:
+			return await self.get_json('{}/{}/wfapi/describe/'.format(get_job_path(job_name), number))
+		except aiohttp.ClientResponseError as e:
+			# jobs which are not pipelines have no stages
+			if e.status == 404:
+				return None
+			raise
+
+
+def get_job_path(job_name):
+	''' takes in job name, including any folders separated by '/'
+		returns url encoded path of the job relative to the jenkins server url
+	'''
+	return '/'.join('job/' + quote(part) for part in job_name.split('/'))
+
+
+def get_ssl(verify):
+	''' takes in certificate config field - False, True or path of a CA bundle
+		returns matching ssl argument for aiohttp requests
+	'''
+	if verify is False:
+		return False
+	if isinstance(verify, str):
+		return ssl.create_default_context(cafile=verify)
+	return None
+
+
+def get_https_verify_ssl():
+	''' returns ssl argument for aiohttp requests to Jenkins and Bugzilla, which are not verified if PYTHONHTTPSVERIFY is 0
+		as jeeves.py sets it, matching the sync engine - aiohttp verifies certificates regardless of PYTHONHTTPSVERIFY
+	'''
+	return get_ssl(os.environ.get('PYTHONHTTPSVERIFY') != '0')
+
+
+def get_jenkins_auth(config):
+	''' takes in config dict
+		returns aiohttp basic auth for Jenkins requests if jenkins_username is configured, otherwise None
+	'''
+	if config.get('jenkins_username', None):
+		return aiohttp.BasicAuth(config['jenkins_username'], config.get('jenkins_password', None) or '')
+	return None
+
+
+def get_jira_request_options(config):
+	''' takes in config dict
+		returns dict of keyword arguments authenticating aiohttp requests to Jira
+	'''
+	options = {'ssl': get_ssl(config.get('certificate', None))}
+
+	# check for username in config and use basic auth, otherwise use Personal Access Token
+	if config.get('jira_username', None):
+		options['auth'] = aiohttp.BasicAuth(config['jira_username'], config['jira_password'])
+	else:
+		options['headers'] = {'Authorization': 'Bearer {}'.format(config['jira_token'])}
+	return options
+
+
+async def run_requests_async(server, requests):
+	''' takes in AsyncJenkins object and a generator yielding requests, like run_requests in jeeves.jobs
+		awaits the server method of each request, sending its result back into the generator or throwing its exception into it
+		returns value returned by the generator
+	'''
+	result = None
+	error = None
+	try:
+		while True:
+			request = requests.send(result) if error is None else requests.throw(error)
+			try:
+				result = await getattr(server, request[0])(*request[1:])
+				error = None
+			except Exception as e:
+				result = None
+				error = e
+	except StopIteration as stop:
+		return stop.value
+
+
+async def get_jenkins_jobs_info_async(server, job_names, job_infos=None, **kwargs):
+	''' takes in AsyncJenkins object and list of job names
+		optionally takes dict of job infos already fetched and any filter accepted by get_jenkins_job_info_requests
+		returns dict with job names as keys and get_jenkins_job_info results as values
+	'''
+	job_infos = job_infos or {}
+
+	async def fetch(job_name):
+		start = time.perf_counter()
+		jenkins_api_info = await run_requests_async(server, get_jenkins_job_info_requests(job_name, job_info=job_infos.get(job_name), **kwargs))
+		run_profile.record_job(job_name, time.perf_counter() - start)
+		return jenkins_api_info
+
+	results = await asyncio.gather(*[fetch(job_name) for job_name in job_names])
+	return dict(zip(job_names, results))
+
+
+async def get_bugs_dict_async(session, bug_ids, config):
+	''' takes in aiohttp session, set of bug_ids and config dict
+		returns same dictionary as get_bugs_dict, sharing its cache and fetching or revalidating all other bugs with
+		concurrent Bugzilla REST API requests of one chunk each
+	'''
+	bug_ids_to_query = [bug_id for bug_id in bug_ids if bug_id != 0]
+	if len(bug_ids_to_query) == 0:
+		return {}
+
+	cache = get_blocker_cache(config)
+	query_bz_dict, stale = get_cached_blockers(cache, get_bugs_tracker(config), bug_ids_to_query, config.get('bz_cache_ttl', DEFAULT_BZ_CACHE_TTL), config)
+	missing_ids = [bug_id for bug_id in bug_ids_to_query if bug_id not in query_bz_dict and bug_id not in stale]
+	if len(missing_ids) == 0 and len(stale) == 0:
+		return build_bugs_dict(bug_ids, query_bz_dict, config)
+
+	rest_url = config['bz_url'].rstrip('/') + '/rest/bug'
+	headers = {'X-BUGZILLA-API-KEY': config['bz_api_key']} if config.get('bz_api_key', None) else None
+
+	async def get_chunk(chunk, last_change_time):
+		try:
+			async with session.get(rest_url, params=get_bugs_params(chunk, last_change_time), headers=headers, ssl=get_https_verify_ssl()) as response:
+				response.raise_for_status()
+				bugs = (await response.json(content_type=None))['bugs']
+			return chunk, last_change_time, {bug['id']: (bug['status'], bug['summary']) for bug in bugs}
+		except Exception as e:
+			print("Bugzilla API Call Error:", e)
+			return chunk, last_change_time, None
+
+	results = await asyncio.gather(*[get_chunk(chunk, last_change_time) for chunk, last_change_time in get_bugs_requests(missing_ids, stale, config)])
+	query_bz_dict.update(update_cached_bugs(cache, stale, results, config))
+
+	return build_bugs_dict(bug_ids, query_bz_dict, config)
+
+
+async def get_tickets_dict_async(session, ticket_ids, config):
+	''' takes in aiohttp session, set of ticket_ids and config dict
+		returns same dictionary as get_tickets_dict, sharing its cache and fetching all other tickets with concurrent
+		Jira REST API searches - tickets the searches could not return are resolved individually
+	'''
+	ticket_ids = [ticket_id for ticket_id in ticket_ids if ticket_id != 0]
+	if len(ticket_ids) == 0:
+		return {}
+
+	cache = get_blocker_cache(config)
+	keys = [str(ticket_id) for ticket_id in ticket_ids]
+	query_jira_dict, stale = get_cached_blockers(cache, get_tickets_tracker(config), keys, config.get('jira_cache_ttl', DEFAULT_JIRA_CACHE_TTL), config)
+	keys = [key for key in keys if key not in query_jira_dict]
+	if len(keys) == 0:
+		return build_tickets_dict(ticket_ids, query_jira_dict, config)
+
+	api_url = config['jira_url'].rstrip('/') + '/rest/api/2/'
+	options = get_jira_request_options(config)
+
+	async def get_json(url, params):
+		async with session.get(url, params=params, **options) as response:
+			response.raise_for_status()
+			return await response.json(content_type=None)
+
+	async def search_chunk(chunk):
+		params = {'jql': get_tickets_jql(chunk), 'maxResults': len(chunk), 'validateQuery': 'false', 'fields': 'status,summary'}
+		try:
+			issues = (await get_json(api_url + 'search', params))['issues']
+			return {issue['key']: (issue['fields']['status']['name'], issue['fields']['summary']) for issue in issues}
+		except Exception as e:
+			print("Jira API Call Error: ", e)
+			return {}
+
+	async def get_issue(ticket_id):
+		try:
+			issue = await get_json(api_url + 'issue/' + quote(ticket_id), {'fields': 'status,summary'})
+			return {ticket_id: (issue['fields']['status']['name'], issue['fields']['summary'])}
+		except Exception as e:
+			print("Jira API Call Error: ", e)
+			return {}
+
+	fetched_jira_dict = {}
+	for result in await asyncio.gather(*[search_chunk(chunk) for chunk in get_tickets_chunks(keys, config)]):
+		fetched_jira_dict.update(result)
+
+	# fall back to individual requests for tickets missing from search results (e.g. moved or inaccessible tickets)
+	missing_keys = [key for key in keys if key not in fetched_jira_dict]
+	for result in await asyncio.gather(*[get_issue(key) for key in missing_keys]):
+		fetched_jira_dict.update(result)
+
+	query_jira_dict.update(update_cached_blockers(cache, get_tickets_tracker(config), 'tickets', fetched_jira_dict, stale))
+	return build_tickets_dict(ticket_ids, query_jira_dict, config)
+
+
+def get_session(config):
+	''' takes in config dict
+		returns aiohttp session keeping connections alive, with at most async_max_connections open connections in total,
+		max_workers_per_host (or max_workers) per host and async_timeout seconds per request
+		every request is recorded in the run profile
+	'''
+	connector = aiohttp.TCPConnector(
+		limit=int(config.get('async_max_connections', DEFAULT_ASYNC_MAX_CONNECTIONS)),
+		limit_per_host=int(config.get('max_workers_per_host', None) or config.get('max_workers', DEFAULT_MAX_WORKERS))
+	)
+	timeout = aiohttp.ClientTimeout(total=config.get('async_timeout', DEFAULT_ASYNC_TIMEOUT))
+	return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[get_trace_config(config)])
+
+
+def get_jenkins_jobs_tree_async(config, page_size, query, resilience=None):
+	''' takes in config dict, number of jobs to request per page and tree query to request them with
+		optionally takes JenkinsResilience used for Jenkins requests, a new one is created from config otherwise
+		returns list of job info dicts of every top-level job, see get_jenkins_jobs_tree_requests
+	'''
+	resilience = resilience or get_jenkins_resilience(config)
+
+	async def fetch():
+		async with get_session(config) as session:
+			server = AsyncJenkins(session, config['jenkins_url'], resilience, get_jenkins_auth(config))
+			return await run_requests_async(server, get_jenkins_jobs_tree_requests(page_size, query))
+
+	return asyncio.run(fetch())
+
+
+def fetch_all(config, job_names=(), job_infos=None, bug_ids=(), ticket_ids=(), resilience=None, **kwargs):
+	''' takes in config dict
+		optionally takes job names, dict of job infos already fetched and any filter accepted by get_jenkins_job_info_requests
+		optionally takes bug and ticket ids
+		optionally takes JenkinsResilience used for Jenkins requests, a new one is created from config otherwise
+		fetches jobs, bugs and tickets concurrently in one event loop
+		returns tuple of jenkins API infos, bugs and tickets dicts, as returned by get_jenkins_jobs_info, get_bugs_dict and get_tickets_dict
+	'''
+	resilience = resilience or get_jenkins_resilience(config)
+
+	async def fetch():
+		async with get_session(config) as session:
+			# jenkins_url may be missing if jenkins_instances are configured and only bugs and tickets are fetched
+			server = AsyncJenkins(session, config.get('jenkins_url', None) or '', resilience, get_jenkins_auth(config))
+			return await asyncio.gather(
+				get_jenkins_jobs_info_async(server, list(job_names), job_infos, **kwargs),
+				get_bugs_dict_async(session, bug_ids, config),
+				get_tickets_dict_async(session, ticket_ids, config)
+			)
+
+	return tuple(asyncio.run(fetch()))
@@ -1,40 +1,332 @@
 # library functions for handling blocker data
 
-import bugzilla
+import os
+import time
+import sqlite3
+import datetime
+import requests
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 from jira import JIRA
+from requests.adapters import HTTPAdapter
+
+from jeeves.instrumentation import instrument_session
+from jeeves.jobs import DEFAULT_MAX_WORKERS
+
+DEFAULT_JIRA_CHUNK_SIZE = 50
+DEFAULT_BZ_CHUNK_SIZE = 100
+DEFAULT_BZ_CACHE_TTL = 300
+DEFAULT_JIRA_CACHE_TTL = 300
+DEFAULT_BLOCKER_CACHE_MAX_STALE = 86400
+BZ_TIMEOUT = 60
+
+# seconds subtracted from the time bugs were last fetched when asking Bugzilla which of them changed since,
+# so bugs changed just before they were fetched are not missed if the clocks of jeeves and Bugzilla differ
+BZ_CLOCK_SKEW = 300
+
+# number of ids looked up with one query, below the limit of SQLite builds older than 3.32
+SQLITE_MAX_VARIABLES = 900
+
+# open Bugzilla and Jira connections, reused by every run of a long-running jeeves process
+connections = {}
+connections_lock = threading.Lock()
+
+# caches of bug and ticket data, keyed by blocker_cache_file and shared by every run of a long-running jeeves process
+blocker_caches = {}
+blocker_caches_lock = threading.Lock()
+
+
+class BlockerCache:
+	''' thread safe SQLite cache of the status and summary of bugs and tickets, keyed by tracker and id
+		every entry records when it was last fetched or revalidated, so callers decide which entries are fresh
+		the cache is kept in memory unless a file is given, in which case entries are shared by every run of jeeves
+	'''
+
+	def __init__(self, path=':memory:'):
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		self.path = path
+		self.hits = 0
+		self.stale = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		with self.lock, self.connection:
+			self.connection.execute(
+				'CREATE TABLE IF NOT EXISTS blockers ('
+				'tracker TEXT NOT NULL, id TEXT NOT NULL, status TEXT NOT NULL, summary TEXT NOT NULL, '
+				'fetched_at REAL NOT NULL, PRIMARY KEY (tracker, id))'
+			)
+
+	def get_many(self, tracker, ids, max_age):
+		''' takes in tracker, ids and maximum number of seconds since entries were fetched
+			returns dict of (status, summary, fetched_at) tuples of the given ids, keyed by id
+		'''
+		keys = dict((str(entry_id), entry_id) for entry_id in ids)
+		key_list = list(keys)
+		found = {}
+		with self.lock:
+			for i in range(0, len(key_list), SQLITE_MAX_VARIABLES):
+				chunk = key_list[i:i + SQLITE_MAX_VARIABLES]
+				for key, status, summary, fetched_at in self.connection.execute(
+					'SELECT id, status, summary, fetched_at FROM blockers '
+					'WHERE tracker = ? AND fetched_at >= ? AND id IN ({})'.format(', '.join('?' * len(chunk))),
+					[tracker, time.time() - max_age] + chunk
+				):
+					found[keys[key]] = (status, summary, fetched_at)
+		return found
+
+	def set_many(self, tracker, values):
+		''' takes in tracker and dict of (status, summary) tuples keyed by id, storing them as fetched now
+		'''
+		now = time.time()
+		with self.lock, self.connection:
+			self.connection.executemany(
+				'INSERT OR REPLACE INTO blockers (tracker, id, status, summary, fetched_at) VALUES (?, ?, ?, ?, ?)',
+				[(tracker, str(entry_id), status, summary, now) for entry_id, (status, summary) in values.items()]
+			)
+
+	def touch_many(self, tracker, ids):
+		''' takes in tracker and ids of entries which were revalidated unchanged, marking them as fetched now
+		'''
+		now = time.time()
+		with self.lock, self.connection:
+			self.connection.executemany(
+				'UPDATE blockers SET fetched_at = ? WHERE tracker = ? AND id = ?',
+				[(now, tracker, str(entry_id)) for entry_id in ids]
+			)
+
+	def evict(self, max_age):
+		''' removes entries fetched more than max_age seconds ago
+		'''
+		with self.lock, self.connection:
+			self.connection.execute('DELETE FROM blockers WHERE fetched_at < ?', (time.time() - max_age,))
+
+	def record(self, num_hits, num_stale, num_misses):
+		with self.lock:
+			self.hits += num_hits
+			self.stale += num_stale
+			self.misses += num_misses
+
+	def reset_stats(self):
+		''' resets cache hits, stale entries and misses, which are reported per run while the cache is kept for the lifetime of the process
+		'''
+		with self.lock:
+			self.hits = 0
+			self.stale = 0
+			self.misses = 0
+
+	def stats(self):
+		''' returns string summarizing cache hits, stale entries and misses
+		'''
+		return "Blocker cache: {} hits, {} stale, {} misses".format(self.hits, self.stale, self.misses)
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+
+def get_blocker_cache(config):
+	''' takes in config dict
+		returns BlockerCache of the configured blocker_cache_file, or kept in memory if none is configured
+		caches are opened once and reused for the lifetime of the process, evicting entries too old to be shown
+	'''
+	path = config.get('blocker_cache_file', None) or ':memory:'
+	with blocker_caches_lock:
+		if path not in blocker_caches:
+			blocker_caches[path] = BlockerCache(path)
+			blocker_caches[path].evict(config.get('blocker_cache_max_stale', DEFAULT_BLOCKER_CACHE_MAX_STALE))
+		return blocker_caches[path]
+
+
+def get_cached_blockers(cache, tracker, ids, ttl, config):
+	''' takes in BlockerCache, tracker, ids, number of seconds entries stay fresh and config dict
+		returns tuple of dict of the (status, summary) tuples of fresh entries and dict of the (status, summary, fetched_at)
+		tuples of stale entries, which should be revalidated but may still be shown until blocker_cache_max_stale seconds
+		after they were fetched - all entries are stale if refresh_blockers is set
+	'''
+	max_stale = config.get('blocker_cache_max_stale', DEFAULT_BLOCKER_CACHE_MAX_STALE)
+	entries = cache.get_many(tracker, ids, max(ttl, max_stale))
+	now = time.time()
+	fresh = {}
+	stale = {}
+	for entry_id, (status, summary, fetched_at) in entries.items():
+		if now - fetched_at < ttl and not config.get('refresh_blockers', False):
+			fresh[entry_id] = (status, summary)
+		else:
+			stale[entry_id] = (status, summary, fetched_at)
+	cache.record(len(fresh), len(stale), len(ids) - len(entries))
+	return fresh, stale
+
+
+def update_cached_blockers(cache, tracker, name, fetched, stale, unchanged_ids=()):
+	''' takes in BlockerCache, tracker, name of blockers for logging, dict of fetched (status, summary) tuples,
+		dict of stale entries as returned by get_cached_blockers and ids of stale entries revalidated unchanged
+		stores fetched and revalidated entries, returns dict of (status, summary) tuples of fetched and stale entries
+		stale entries which could not be revalidated are kept, so blockers still show their last known status
+	'''
+	cache.set_many(tracker, fetched)
+	cache.touch_many(tracker, unchanged_ids)
+	query_dict = dict(fetched)
+	for entry_id in unchanged_ids:
+		query_dict[entry_id] = stale[entry_id][:2]
+
+	not_revalidated = [entry_id for entry_id in stale if entry_id not in query_dict]
+	if not_revalidated:
+		oldest = min(stale[entry_id][2] for entry_id in not_revalidated)
+		print("Showing {} {} as cached up to {} minutes ago, as they could not be refreshed".format(
+			len(not_revalidated), name, int((time.time() - oldest) // 60)
+		))
+		for entry_id in not_revalidated:
+			query_dict[entry_id] = stale[entry_id][:2]
+	return query_dict
+
+
+def get_connection(key, connect):
+	''' takes in key identifying a connection and function opening it
+		returns open connection for key, opening it if there is none
+	'''
+	with connections_lock:
+		if key not in connections:
+			connections[key] = connect()
+		return connections[key]
+
+
+def close_connections():
+	''' closes all open Bugzilla and Jira connections
+	'''
+	with connections_lock:
+		for key, connection in connections.items():
+			try:
+				connection.close()
+			except Exception as e:
+				print("Error closing {} connection: {}".format(key[0], e))
+		connections.clear()
+
+
+def get_bugzilla_connection(config):
+	''' takes in config dict
+		returns requests session for the Bugzilla REST API, shared by every call with the same bz_url and bz_api_key
+		the session keeps a connection alive per worker thread fetching bugs
+	'''
+	# API connection does not work if '/' present at end of URL string
+	parsed_bz_url = config['bz_url'].rstrip('/')
+
+	def connect():
+		session = requests.Session()
+		if config.get('bz_api_key', None):
+			session.headers['X-BUGZILLA-API-KEY'] = config['bz_api_key']
+		pool_size = max(1, int(config.get('max_workers', DEFAULT_MAX_WORKERS)))
+		session.mount('http://', HTTPAdapter(pool_maxsize=pool_size))
+		session.mount('https://', HTTPAdapter(pool_maxsize=pool_size))
+		return instrument_session(session, 'bugzilla')
+
+	return get_connection(('bugzilla', parsed_bz_url, config.get('bz_api_key', None)), connect)
+
+
+def get_bugs_tracker(config):
+	''' takes in config dict
+		returns key of the bugs of the configured Bugzilla in the blocker cache
+	'''
+	return 'bugzilla ' + config['bz_url'].rstrip('/')
+
+
+def get_bugs_chunks(bug_ids, config):
+	''' takes in list of bug ids and config dict
+		returns list of chunks of at most bz_chunk_size bug ids, each fetched with one request
+	'''
+	chunk_size = config.get('bz_chunk_size', DEFAULT_BZ_CHUNK_SIZE)
+	return [bug_ids[i:i + chunk_size] for i in range(0, len(bug_ids), chunk_size)]
+
+
+def get_bugs_requests(missing_ids, stale, config):
+	''' takes in list of ids of bugs not cached, dict of stale entries as returned by get_cached_blockers and config dict
+		returns list of (chunk, last_change_time) tuples of the requests fetching the bugs
+		stale bugs are revalidated by only asking for those changed since they were fetched, last_change_time is None otherwise
+	'''
+	bug_requests = [(chunk, None) for chunk in get_bugs_chunks(missing_ids, config)]
+	if stale:
+		since = min(fetched_at for status, summary, fetched_at in stale.values()) - BZ_CLOCK_SKEW
+		last_change_time = datetime.datetime.fromtimestamp(since, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+		bug_requests.extend((chunk, last_change_time) for chunk in get_bugs_chunks(list(stale), config))
+	return bug_requests
+
+
+def get_bugs_params(chunk, last_change_time=None):
+	''' takes in list of bug ids and optionally time in ISO 8601 format since which bugs must have changed to be returned
+		returns query parameters of the Bugzilla REST API request fetching status and summary of the bugs
+	'''
+	params = {'id': ','.join(map(str, chunk)), 'include_fields': 'id,status,summary'}
+	if last_change_time is not None:
+		params['last_change_time'] = last_change_time
+	return params
+
+
+def update_cached_bugs(cache, stale, results, config):
+	''' takes in BlockerCache, dict of stale entries as returned by get_cached_blockers, list of (chunk, last_change_time,
+		result) tuples of the requests made, each result a dict of (status, summary) tuples or None if the request failed,
+		and config dict
+		returns dict of (status, summary) tuples of fetched and stale bugs - stale bugs a successful request did not return
+		have not changed since they were fetched
+	'''
+	fetched_bz_dict = {}
+	unchanged_ids = []
+	for chunk, last_change_time, result in results:
+		if result is None:
+			continue
+		fetched_bz_dict.update(result)
+		if last_change_time is not None:
+			unchanged_ids.extend(bug_id for bug_id in chunk if bug_id not in result)
+	return update_cached_blockers(cache, get_bugs_tracker(config), 'bugs', fetched_bz_dict, stale, unchanged_ids)
 
 
 def get_bugs_dict(bug_ids, config):
 	''' takes in set of bug_ids and returns dictionary with
 		bug_ids as keys and API data as values
 		a bug_id value of 0 will be ignored
+		bugs fetched less than bz_cache_ttl seconds ago are taken from the cache, all others are fetched from the
+		Bugzilla REST API in chunks requested concurrently - stale bugs are kept if they could not be revalidated,
+		other bugs of a chunk that could not be fetched are shown by id
 	'''
+	bug_ids_to_query = [bug_id for bug_id in bug_ids if bug_id != 0]
+	if len(bug_ids_to_query) == 0:
+		return {}
 
-	# initialize bug dictionary
-	bug_dict = {}
+	cache = get_blocker_cache(config)
+	query_bz_dict, stale = get_cached_blockers(cache, get_bugs_tracker(config), bug_ids_to_query, config.get('bz_cache_ttl', DEFAULT_BZ_CACHE_TTL), config)
+	missing_ids = [bug_id for bug_id in bug_ids_to_query if bug_id not in query_bz_dict and bug_id not in stale]
+	if len(missing_ids) == 0 and len(stale) == 0:
+		return build_bugs_dict(bug_ids, query_bz_dict, config)
 
-	bug_ids_to_query = [str(bug_id) for bug_id in bug_ids if bug_id != 0]
-	if len(bug_ids_to_query) == 0:
-		return bug_dict
+	rest_url = config['bz_url'].rstrip('/') + '/rest/bug'
+	session = get_bugzilla_connection(config)
 
-	# API connection does not work if '/' present at end of URL string
-	parsed_bz_url = config['bz_url'].rstrip('/')
-	bz_api = bugzilla.Bugzilla(parsed_bz_url)
+	def get_chunk(request):
+		chunk, last_change_time = request
+		try:
+			response = session.get(rest_url, params=get_bugs_params(chunk, last_change_time), timeout=BZ_TIMEOUT)
+			response.raise_for_status()
+			return chunk, last_change_time, {bug['id']: (bug['status'], bug['summary']) for bug in response.json()['bugs']}
+		except Exception as e:
+			print("Bugzilla API Call Error:", e)
+			return chunk, last_change_time, None
 
-	# Amend the quicksearch operation in order to aggregate search of multiple bug IDs from bugzilla
-	quicksearch_bz_url = parsed_bz_url + "/buglist.cgi?quicksearch="
-	bugs_query_url = quicksearch_bz_url + '+'.join(bug_ids_to_query)
-	bz_query = bz_api.url_to_query(bugs_query_url)
-	# Restrict return values to just id, status, and summary
-	bz_query['include_fields'] = ['id', 'status', 'summary']
+	bug_requests = get_bugs_requests(missing_ids, stale, config)
+	with ThreadPoolExecutor(max_workers=max(1, min(int(config.get('max_workers', DEFAULT_MAX_WORKERS)), len(bug_requests)))) as executor:
+		results = list(executor.map(get_chunk, bug_requests))
+	query_bz_dict.update(update_cached_bugs(cache, stale, results, config))
 
-	try:
-		bugs = bz_api.query(bz_query)
-		# Create a dictionary based on returned bug ids
-		query_bz_dict = {bug.id: (bug.status, bug.summary) for bug in bugs}
-	except Exception as e:
-		print("Bugzilla API Call Error:", e)
-		query_bz_dict = {}
+	return build_bugs_dict(bug_ids, query_bz_dict, config)
+
+
+def build_bugs_dict(bug_ids, query_bz_dict, config):
+	''' takes in set of bug_ids and dictionary of (status, summary) tuples returned by Bugzilla with bug ids as keys
+		returns dictionary with bug_ids as keys and bug names and links as values
+		a bug_id value of 0 will be ignored
+	'''
+	bug_dict = {}
 
 	# iterate through bug ids from set
 	for bug_id in bug_ids:
@@ -80,64 +372,138 @@ def get_bugs_set(blockers):
 	return bug_set
 
 
+def get_jira_connection(config):
+	''' takes in config dict
+		returns authenticated JIRA connection, shared by every call with the same Jira server and credentials
+	'''
+	options = {
+		"server": config['jira_url'],
+		"verify": config['certificate']
+	}
+
+	def connect():
+		# check for username in config and use create tuple for basic auth
+		if config.get('jira_username', None):
+			jira = JIRA(basic_auth=(config['jira_username'], config['jira_password']), options=options)
+
+		# try to use Personal Access Token instead
+		else:
+			jira = JIRA(token_auth=config['jira_token'], options=options)
+
+		instrument_session(jira._session, 'jira')
+		return jira
+
+	key = ('jira', config['jira_url'], str(config['certificate']), config.get('jira_username'), config.get('jira_password'), config.get('jira_token'))
+	return get_connection(key, connect)
+
+
+def get_tickets_tracker(config):
+	''' takes in config dict
+		returns key of the tickets of the configured Jira in the blocker cache
+	'''
+	return 'jira ' + config['jira_url'].rstrip('/')
+
+
 def get_tickets_dict(ticket_ids, config):
 	''' takes in set of ticket_ids and returns dictionary with
 		ticket_ids as keys and API data as values
 		a ticket_id with a value of 0 will be ignored
+		tickets fetched less than jira_cache_ttl seconds ago are taken from the cache, all others are resolved
+		in chunks with JQL searches made concurrently over one connection
+		tickets the searches could not return are resolved individually, stale tickets are kept if they could not be resolved
 	'''
 
 	# initialize ticket dictionary
 	ticket_dict = {}
 
-	# check for username in config and use create tuple for basic auth
-	jira_username = config.get('jira_username', None)
-	if jira_username:
-		auth = (config['jira_username'], config['jira_password'])
-	# try to use Personal Access Token instead
-	else:
-		auth = config['jira_token']
-	options = {
-		"server": config['jira_url'],
-		"verify": config['certificate']
-	}
-	jira = None
+	# a ticket_id value of 0 is used as a placeholder, not a valid ticket
+	# skip as there is no API data to be fetched in this case
+	ticket_ids = [ticket_id for ticket_id in ticket_ids if ticket_id != 0]
+	if len(ticket_ids) == 0:
+		return ticket_dict
 
-	# iterate through ticket ids from set
-	for ticket_id in ticket_ids:
+	cache = get_blocker_cache(config)
+	keys = [str(ticket_id) for ticket_id in ticket_ids]
+	query_jira_dict, stale = get_cached_blockers(cache, get_tickets_tracker(config), keys, config.get('jira_cache_ttl', DEFAULT_JIRA_CACHE_TTL), config)
+	keys = [key for key in keys if key not in query_jira_dict]
+	if len(keys) == 0:
+		return build_tickets_dict(ticket_ids, query_jira_dict, config)
 
-		# a ticket_id value of 0 is used as a placeholder, not a valid ticket
-		# skip as there is no API data to be fetched in this case
-		if ticket_id == 0:
-			continue
+	max_workers = max(1, int(config.get('max_workers', DEFAULT_MAX_WORKERS)))
+	fetched_jira_dict = {}
 
-		# get ticket info from jira API
+	def search_chunk(chunk):
 		try:
+			issues = jira.search_issues(get_tickets_jql(chunk), maxResults=len(chunk), validate_query=False, fields='status,summary')
+			return {issue.key: (str(issue.fields.status), issue.fields.summary) for issue in issues}
+		except Exception as e:
+			print("Jira API Call Error: ", e)
+			return {}
 
-			# initialize connection if it has not yet been done (either first iteration or previously failed)
-			if jira is None:
-				if jira_username:
-					jira = JIRA(basic_auth=auth, options=options)
-				else:
-					jira = JIRA(token_auth=auth, options=options)
-
-			issue = jira.issue(ticket_id)
-			ticket_status = '[' + str(issue.fields.status) + ']'
-			ticket_summary = issue.fields.summary
-			ticket_name = ' '.join([ticket_status.upper(), ticket_summary])
+	def get_issue(ticket_id):
+		try:
+			issue = jira.issue(ticket_id, fields='status,summary')
+			return {ticket_id: (str(issue.fields.status), issue.fields.summary)}
 		except Exception as e:
 			print("Jira API Call Error: ", e)
-			ticket_name = ticket_id
-			jira = None
-		finally:
-			ticket_url = config['jira_url'] + "/browse/" + str(ticket_id)
-			ticket_dict[ticket_id] = {
-				'ticket_name': ticket_name,
-				'ticket_url': ticket_url
-			}
-
-	# close Jira connection if open
+			return {}
+
+	# get ticket info from jira API
+	try:
+		jira = get_jira_connection(config)
+	except Exception as e:
+		print("Jira API Call Error: ", e)
+		jira = None
+
 	if jira is not None:
-		jira.close()
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			for result in executor.map(search_chunk, get_tickets_chunks(keys, config)):
+				fetched_jira_dict.update(result)
+
+			# fall back to individual requests for tickets missing from search results (e.g. moved or inaccessible tickets)
+			missing_keys = [key for key in keys if key not in fetched_jira_dict]
+			for result in executor.map(get_issue, missing_keys):
+				fetched_jira_dict.update(result)
+
+	query_jira_dict.update(update_cached_blockers(cache, get_tickets_tracker(config), 'tickets', fetched_jira_dict, stale))
+	return build_tickets_dict(ticket_ids, query_jira_dict, config)
+
+
+def get_tickets_chunks(keys, config):
+	''' takes in list of ticket keys and config dict
+		returns list of chunks of at most jira_chunk_size keys, each resolved with one search
+	'''
+	chunk_size = config.get('jira_chunk_size', DEFAULT_JIRA_CHUNK_SIZE)
+	return [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+
+
+def get_tickets_jql(keys):
+	''' takes in list of ticket keys
+		returns JQL query matching all of the tickets
+	'''
+	return 'key in ({})'.format(','.join('"{}"'.format(key) for key in keys))
+
+
+def build_tickets_dict(ticket_ids, query_jira_dict, config):
+	''' takes in list of ticket_ids and dictionary of (status, summary) tuples returned by Jira with ticket keys as keys
+		returns dictionary with ticket_ids as keys and ticket names and links as values
+	'''
+	ticket_dict = {}
+
+	# iterate through ticket ids from set
+	for ticket_id in ticket_ids:
+		if query_jira_dict.get(str(ticket_id)):
+			ticket_status = '[' + query_jira_dict[str(ticket_id)][0] + ']'
+			ticket_summary = query_jira_dict[str(ticket_id)][1]
+			ticket_name = ' '.join([ticket_status.upper(), ticket_summary])
+		else:
+			ticket_name = ticket_id
+
+		ticket_url = config['jira_url'] + "/browse/" + str(ticket_id)
+		ticket_dict[ticket_id] = {
+			'ticket_name': ticket_name,
+			'ticket_url': ticket_url
+		}
 
 	return ticket_dict
 
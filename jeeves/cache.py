@@ -0,0 +1,112 @@
+# library functions for caching Jenkins build data on disk
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+DEFAULT_CACHE_MAX_AGE_DAYS = 30
+DEFAULT_CACHE_MAX_ENTRIES = 100000
+
+# open build caches, keyed by cache directory
+build_caches = {}
+build_caches_lock = threading.Lock()
+
+
+class BuildCache:
+	''' persistent SQLite cache of Jenkins build data keyed by job name, build number and kind of data
+		only data of finished builds should be stored as it never changes afterwards
+		entries older than max_age_days are evicted, as are the oldest entries beyond max_entries
+	'''
+
+	def __init__(self, cache_dir, max_age_days=DEFAULT_CACHE_MAX_AGE_DAYS, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+		os.makedirs(cache_dir, exist_ok=True)
+		self.path = os.path.join(cache_dir, 'builds.sqlite')
+		self.max_age_days = max_age_days
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(self.path, check_same_thread=False)
+		with self.lock, self.connection:
+			self.connection.execute(
+				'CREATE TABLE IF NOT EXISTS builds ('
+				'job_name TEXT NOT NULL, number INTEGER NOT NULL, kind TEXT NOT NULL, '
+				'data TEXT NOT NULL, fetched_at REAL NOT NULL, '
+				'PRIMARY KEY (job_name, number, kind))'
+			)
+			self.connection.execute('CREATE INDEX IF NOT EXISTS builds_fetched_at ON builds (fetched_at)')
+		self.evict()
+
+	def get(self, job_name, number, kind):
+		''' returns cached data for given build and kind of data or None if not cached
+		'''
+		with self.lock:
+			row = self.connection.execute(
+				'SELECT data FROM builds WHERE job_name = ? AND number = ? AND kind = ?',
+				(job_name, number, kind)
+			).fetchone()
+			if row is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+		return json.loads(row[0])
+
+	def set(self, job_name, number, kind, data):
+		''' stores data for given build and kind of data
+		'''
+		with self.lock, self.connection:
+			self.connection.execute(
+				'INSERT OR REPLACE INTO builds (job_name, number, kind, data, fetched_at) VALUES (?, ?, ?, ?, ?)',
+				(job_name, number, kind, json.dumps(data), time.time())
+			)
+
+	def evict(self):
+		''' removes entries older than max_age_days and the oldest entries beyond max_entries
+		'''
+		with self.lock, self.connection:
+			self.connection.execute(
+				'DELETE FROM builds WHERE fetched_at < ?',
+				(time.time() - self.max_age_days * 86400,)
+			)
+			self.connection.execute(
+				'DELETE FROM builds WHERE rowid IN '
+				'(SELECT rowid FROM builds ORDER BY fetched_at DESC, rowid DESC LIMIT -1 OFFSET ?)',
+				(self.max_entries,)
+			)
+
+	def reset_stats(self):
+		''' resets cache hits and misses, which are reported per run while the cache is kept for the lifetime of the process
+		'''
+		with self.lock:
+			self.hits = 0
+			self.misses = 0
+
+	def stats(self):
+		''' returns string summarizing cache hits and misses
+		'''
+		return "Build cache: {} hits, {} misses".format(self.hits, self.misses)
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+
+def get_build_cache(config):
+	''' takes in config dict
+		returns BuildCache for the configured cache_dir or None if caching is not configured
+		caches are opened once per directory and reused for the lifetime of the process
+	'''
+	cache_dir = config.get('cache_dir', None)
+	if not cache_dir:
+		return None
+
+	with build_caches_lock:
+		if cache_dir not in build_caches:
+			build_caches[cache_dir] = BuildCache(
+				cache_dir,
+				max_age_days=config.get('cache_max_age_days', DEFAULT_CACHE_MAX_AGE_DAYS),
+				max_entries=config.get('cache_max_entries', DEFAULT_CACHE_MAX_ENTRIES)
+			)
+		return build_caches[cache_dir]
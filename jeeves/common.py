@@ -3,6 +3,9 @@
 import os
 import datetime
 
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 
 def generate_header(source, filter_param_name=None, filter_param_value=None, remind=False):
 	''' generates header
@@ -63,6 +66,7 @@ def generate_summary(num_success, num_unstable, num_failure, num_aborted, num_mi
 
 def generate_html_file(htmlcode, remind=False, owner=''):
 	''' generates HTML file from given HTML code
+		HTML code can be a string or an iterable of strings, which are written to the file as they are produced
 		if generating file for reminder, owner should be passed as well
 	'''
 	try:
@@ -76,7 +80,10 @@ def generate_html_file(htmlcode, remind=False, owner=''):
 		datetime.datetime.now()
 	)
 	with open(filename, 'w') as file:
-		file.write(htmlcode)
+		if isinstance(htmlcode, str):
+			file.write(htmlcode)
+		else:
+			file.writelines(htmlcode)
 	return filename
 
 
@@ -95,13 +102,28 @@ def validate_config(config, no_email, test_email):
 
 	# these fields are always required
 	required_fields = [
-		'jenkins_url',
-		'job_search_fields',
 		'bz_url',
 		'jira_url',
 		'certificate'
 	]
 
+	# jenkins fields can be set per instance if jobs are collected from several jenkins instances
+	instances = config.get('jenkins_instances', None)
+	if instances:
+		if not isinstance(instances, list):
+			raise Exception('field "jenkins_instances" must be a list')
+		names = set()
+		for instance in instances:
+			for field in ['jenkins_url', 'job_search_fields']:
+				if instance.get(field, config.get(field)) is None:
+					raise Exception('field "{}" is not defined for jenkins instance {}'.format(field, instance.get('name', len(names) + 1)))
+			name = instance.get('name', urlparse(instance.get('jenkins_url', config.get('jenkins_url'))).netloc)
+			if name in names:
+				raise Exception('jenkins instance name "{}" is not unique'.format(name))
+			names.add(name)
+	else:
+		required_fields.extend(['jenkins_url', 'job_search_fields'])
+
 	# fields only required if user is sending email
 	if not no_email:
 		required_fields.append('smtp_host')
@@ -119,3 +141,15 @@ def validate_config(config, no_email, test_email):
 			raise Exception('field "{}" is not defined'.format(field))
 
 	return None
+
+
+def run_parallel(tasks):
+	''' takes in list of functions taking no arguments
+		returns list of their results, calling them in parallel threads if there is more than one
+		any exception raised by a function is raised again once all functions are done
+	'''
+	if len(tasks) <= 1:
+		return [task() for task in tasks]
+	with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+		futures = [executor.submit(task) for task in tasks]
+	return [future.result() for future in futures]
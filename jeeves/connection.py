@@ -0,0 +1,128 @@
+# library functions for connecting to Jenkins over a tuned HTTP session shared by every run
+
+import os
+import jenkins
+import threading
+
+from urllib.parse import urlparse
+
+from jeeves.jobs import DEFAULT_MAX_WORKERS
+from jeeves.resilience import RetryingAdapter, get_jenkins_resilience
+
+DEFAULT_JENKINS_TIMEOUT = 60
+
+# jenkins server objects of configured jenkins_instances, kept so their connections stay alive between runs of serve mode
+instance_servers = {}
+instance_servers_lock = threading.Lock()
+
+
+def get_pool_size(config):
+	''' takes in config dict
+		returns number of connections to keep alive to Jenkins, one per worker thread fetching jobs
+	'''
+	max_workers = int(config.get('max_workers', DEFAULT_MAX_WORKERS))
+	max_workers_per_host = int(config.get('max_workers_per_host', None) or max_workers)
+	return max(1, min(max_workers, max_workers_per_host))
+
+
+def get_jenkins_server(config):
+	''' takes in config dict
+		returns jenkins server object whose requests share a pool of keep-alive connections sized to the number of
+		worker threads, time out after jenkins_timeout seconds and are retried according to the jenkins_* retry fields
+	'''
+	server = jenkins.Jenkins(
+		config['jenkins_url'],
+		username=config.get('jenkins_username', None),
+		password=config.get('jenkins_password', None),
+		timeout=config.get('jenkins_timeout', DEFAULT_JENKINS_TIMEOUT)
+	)
+	session = server._session
+
+	# responses are already compressed, as requests asks for gzip and deflate encodings by default
+	pool_size = get_pool_size(config)
+	adapter = RetryingAdapter(get_jenkins_resilience(config), pool_connections=1, pool_maxsize=pool_size)
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+	return server
+
+
+def get_pool_stats(server):
+	''' takes in jenkins server object
+		returns string summarizing connections opened and requests made by its HTTP session, or None if it has none
+	'''
+	session = getattr(server, '_session', None)
+	if session is None:
+		return None
+	num_connections = 0
+	num_requests = 0
+	pool_sizes = set()
+	for adapter in set(session.adapters.values()):
+		pool_manager = getattr(adapter, 'poolmanager', None)
+		if pool_manager is None:
+			continue
+		for key in pool_manager.pools.keys():
+			pool = pool_manager.pools[key]
+			num_connections += pool.num_connections
+			num_requests += pool.num_requests
+			pool_sizes.add(adapter._pool_maxsize)
+	return "Jenkins connections: {} opened for {} requests so far (pool size {})".format(
+		num_connections,
+		num_requests,
+		'/'.join(map(str, sorted(pool_sizes))) or 'n/a'
+	)
+
+
+def get_jenkins_instances(config):
+	''' takes in config dict
+		returns list of config dicts of the Jenkins instances to collect jobs from, one per entry of jenkins_instances
+		each entry overrides the top-level fields it sets, such as jenkins_url, job_search_fields, credentials and max_workers
+		state_file and cache_dir are kept apart per instance, as job names may be the same on several instances
+		if jenkins_instances is not configured, the top-level config is the only instance
+	'''
+	instances = config.get('jenkins_instances', None)
+	if not instances:
+		return [config]
+
+	instance_configs = []
+	for instance in instances:
+		instance_config = dict(config)
+		del instance_config['jenkins_instances']
+		instance_config.update(instance)
+		name = instance_config.setdefault('name', urlparse(instance_config['jenkins_url']).netloc)
+		if config.get('state_file', None) and 'state_file' not in instance:
+			root, ext = os.path.splitext(config['state_file'])
+			instance_config['state_file'] = '{}.{}{}'.format(root, name, ext)
+		if config.get('cache_dir', None) and 'cache_dir' not in instance:
+			instance_config['cache_dir'] = os.path.join(config['cache_dir'], name)
+		instance_configs.append(instance_config)
+	return instance_configs
+
+
+def get_instance_servers(config, server):
+	''' takes in config dict and jenkins server object of the top-level jenkins_url, unused if jenkins_instances are configured
+		returns list of tuples of instance config dict and jenkins server object of every Jenkins instance to collect jobs from
+		servers of jenkins_instances are created once and reused for the lifetime of the process
+	'''
+	if not config.get('jenkins_instances', None):
+		return [(config, server)]
+
+	servers = []
+	with instance_servers_lock:
+		for instance_config in get_jenkins_instances(config):
+			key = (instance_config['name'], instance_config['jenkins_url'], instance_config.get('jenkins_username', None))
+			if key not in instance_servers:
+				instance_servers[key] = get_jenkins_server(instance_config)
+			servers.append((instance_config, instance_servers[key]))
+	return servers
+
+
+def get_job_search_fields(config):
+	''' takes in config dict
+		returns job_search_fields to show in the report header, prefixed with the instance name for every jenkins instance
+	'''
+	if not config.get('jenkins_instances', None):
+		return config['job_search_fields']
+	return '; '.join(
+		'{}: {}'.format(instance_config['name'], instance_config['job_search_fields'])
+		for instance_config in get_jenkins_instances(config)
+	)
@@ -0,0 +1,186 @@
+# library functions for storing the results of every report and analysing them across runs
+
+import os
+import time
+import sqlite3
+import datetime
+import threading
+
+DEFAULT_HISTORY_DAYS = 30
+DEFAULT_TREND_DAYS = 14
+MIN_STREAK = 3
+MIN_FLIPS = 3
+NUM_HISTORY_JOBS = 20
+
+# results that count as passing when computing pass rates, streaks and flips
+PASSING_RESULTS = ('SUCCESS',)
+
+# open history stores, keyed by history file
+history_stores = {}
+history_stores_lock = threading.Lock()
+
+
+class HistoryStore:
+	''' persistent SQLite store of the rows of every report, one result per run and job
+		results are indexed by job and by date, so trends, streaks and flaky jobs are computed with aggregate queries
+		over the analysed window only, however many runs are stored
+	'''
+
+	def __init__(self, path):
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		self.path = path
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		with self.lock, self.connection:
+			self.connection.execute(
+				'CREATE TABLE IF NOT EXISTS runs ('
+				'id INTEGER PRIMARY KEY, run_at REAL NOT NULL, day TEXT NOT NULL)'
+			)
+			self.connection.execute('CREATE INDEX IF NOT EXISTS runs_run_at ON runs (run_at)')
+			self.connection.execute(
+				'CREATE TABLE IF NOT EXISTS results ('
+				'run_id INTEGER NOT NULL, run_at REAL NOT NULL, jenkins_instance TEXT NOT NULL, job_name TEXT NOT NULL, '
+				'osp_version TEXT NOT NULL, lcb_num INTEGER, result TEXT NOT NULL, compose TEXT, stage_failure TEXT, '
+				'tempest_tests_failed INTEGER, '
+				'PRIMARY KEY (run_id, jenkins_instance, job_name))'
+			)
+			self.connection.execute('CREATE INDEX IF NOT EXISTS results_job ON results (jenkins_instance, job_name, run_at)')
+			self.connection.execute('CREATE INDEX IF NOT EXISTS results_run_at ON results (run_at)')
+
+	def record(self, rows, run_at=None):
+		''' takes in report rows and optionally the time of the run, defaulting to now
+			stores the result of every row as one run, returns id of the run
+		'''
+		run_at = run_at if run_at is not None else time.time()
+		day = datetime.date.fromtimestamp(run_at).isoformat()
+		with self.lock, self.connection:
+			run_id = self.connection.execute('INSERT INTO runs (run_at, day) VALUES (?, ?)', (run_at, day)).lastrowid
+			self.connection.executemany(
+				'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				[(
+					run_id,
+					run_at,
+					row.get('jenkins_instance', None) or '',
+					row['job_name'],
+					str(row['osp_version']),
+					row['lcb_num'] if isinstance(row['lcb_num'], int) else None,
+					row['lcb_result'],
+					row['compose'],
+					row['stage_name'],
+					row['tempest_tests_failed']
+				) for row in rows]
+			)
+		return run_id
+
+	def get_trends(self, since):
+		''' takes in timestamp from which to analyse runs
+			returns list of (day, osp_version, number of passing jobs, number of jobs) tuples, oldest day first
+			only the last run of each day is counted, so days with several runs weigh the same as any other day
+		'''
+		with self.lock:
+			return self.connection.execute(
+				'SELECT runs.day, results.osp_version, SUM(results.result IN ({})), COUNT(*) '
+				'FROM runs JOIN results ON results.run_id = runs.id '
+				'WHERE runs.id IN (SELECT MAX(id) FROM runs WHERE run_at >= ? GROUP BY day) '
+				'GROUP BY runs.day, results.osp_version '
+				'ORDER BY runs.day'.format(', '.join('?' * len(PASSING_RESULTS))),
+				PASSING_RESULTS + (since,)
+			).fetchall()
+
+	def get_streaks(self, since, min_streak=MIN_STREAK):
+		''' takes in timestamp from which to analyse runs and minimum length of streaks to return
+			returns list of (jenkins_instance, job_name, number of builds, number of the first build) tuples of jobs
+			whose latest builds all failed, counting every build recorded since their last passing build, longest first
+		'''
+		passing = ', '.join('?' * len(PASSING_RESULTS))
+		with self.lock:
+			return self.connection.execute(
+				'WITH last_passing AS ('
+				'SELECT jenkins_instance, job_name, MAX(lcb_num) AS lcb_num FROM results '
+				'WHERE run_at >= ? AND result IN ({0}) GROUP BY jenkins_instance, job_name) '
+				'SELECT results.jenkins_instance, results.job_name, COUNT(DISTINCT results.lcb_num), MIN(results.lcb_num) '
+				'FROM results LEFT JOIN last_passing ON last_passing.jenkins_instance = results.jenkins_instance '
+				'AND last_passing.job_name = results.job_name '
+				'WHERE results.run_at >= ? AND results.lcb_num IS NOT NULL AND results.result NOT IN ({0}) '
+				'AND results.lcb_num > COALESCE(last_passing.lcb_num, 0) '
+				'GROUP BY results.jenkins_instance, results.job_name '
+				'HAVING COUNT(DISTINCT results.lcb_num) >= ? '
+				'ORDER BY COUNT(DISTINCT results.lcb_num) DESC, results.job_name'.format(passing),
+				(since,) + PASSING_RESULTS + (since,) + PASSING_RESULTS + (min_streak,)
+			).fetchall()
+
+	def get_flaky_jobs(self, since, min_flips=MIN_FLIPS):
+		''' takes in timestamp from which to analyse runs and minimum number of flips of flaky jobs
+			returns list of (jenkins_instance, job_name, number of builds, number of flips) tuples of jobs whose builds
+			flipped between passing and not passing at least min_flips times, most flips first
+		'''
+		with self.lock:
+			return self.connection.execute(
+				'WITH builds AS ('
+				'SELECT DISTINCT jenkins_instance, job_name, lcb_num, result IN ({}) AS passed FROM results '
+				'WHERE run_at >= ? AND lcb_num IS NOT NULL), '
+				'flips AS ('
+				'SELECT jenkins_instance, job_name, passed, '
+				'LAG(passed) OVER (PARTITION BY jenkins_instance, job_name ORDER BY lcb_num) AS previous FROM builds) '
+				'SELECT jenkins_instance, job_name, COUNT(*), SUM(previous IS NOT NULL AND passed != previous) FROM flips '
+				'GROUP BY jenkins_instance, job_name '
+				'HAVING SUM(previous IS NOT NULL AND passed != previous) >= ? '
+				'ORDER BY SUM(previous IS NOT NULL AND passed != previous) DESC, job_name'.format(', '.join('?' * len(PASSING_RESULTS))),
+				PASSING_RESULTS + (since, min_flips)
+			).fetchall()
+
+	def analyse(self, rows, days=DEFAULT_HISTORY_DAYS, trend_days=DEFAULT_TREND_DAYS, now=None):
+		''' takes in report rows and number of days to analyse
+			optionally takes number of days to show pass rate trends for and current time
+			returns dict of pass rate trends per OSP version and of failure streaks and flaky jobs among the given rows
+		'''
+		now = now if now is not None else time.time()
+		since = now - days * 86400
+		reported_jobs = set((row.get('jenkins_instance', None) or '', row['job_name']) for row in rows)
+
+		# pass rates in percent per OSP version of the last trend_days days with a run
+		trends = self.get_trends(max(since, now - trend_days * 86400))
+		dates = sorted(set(day for day, osp_version, num_passing, num_jobs in trends))
+		pass_rates = {}
+		for day, osp_version, num_passing, num_jobs in trends:
+			pass_rates.setdefault(osp_version, {})[day] = round(100 * num_passing / num_jobs, 1)
+
+		return {
+			'days': days,
+			'dates': dates,
+			'trends': [
+				{'osp_version': osp_version, 'pass_rates': [pass_rates[osp_version].get(day, None) for day in dates]}
+				for osp_version in sorted(pass_rates, reverse=True)
+			],
+			'streaks': [
+				{'jenkins_instance': instance or None, 'job_name': job_name, 'num_builds': num_builds, 'since_build': since_build}
+				for instance, job_name, num_builds, since_build in self.get_streaks(since)
+				if (instance, job_name) in reported_jobs
+			][:NUM_HISTORY_JOBS],
+			'flaky': [
+				{'jenkins_instance': instance or None, 'job_name': job_name, 'num_builds': num_builds, 'num_flips': num_flips}
+				for instance, job_name, num_builds, num_flips in self.get_flaky_jobs(since)
+				if (instance, job_name) in reported_jobs
+			][:NUM_HISTORY_JOBS]
+		}
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+
+def get_history_store(config):
+	''' takes in config dict
+		returns HistoryStore for the configured history_file or None if no history is kept
+		stores are opened once per file and reused for the lifetime of the process
+	'''
+	history_file = config.get('history_file', None)
+	if not history_file:
+		return None
+
+	with history_stores_lock:
+		if history_file not in history_stores:
+			history_stores[history_file] = HistoryStore(history_file)
+		return history_stores[history_file]
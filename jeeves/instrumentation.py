@@ -0,0 +1,336 @@
+# library functions for recording where the time of a run goes
+
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+NUM_SLOWEST_JOBS = 10
+NUM_PROFILED_FUNCTIONS = 25
+
+
+class RunProfile:
+	''' thread safe record of the phases, requests and jobs of a run
+	'''
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self.lock:
+			self.started_at = time.time()
+			self.phases = {}
+			self.requests = {}
+			self.jobs = {}
+			self.functions = None
+			self.current_phase = None
+
+	def start_phase(self, name):
+		''' takes in name of the phase the run is entering
+			ends the current phase, adding the time spent in it to its total
+		'''
+		with self.lock:
+			self.end_current_phase()
+			self.current_phase = (name, time.perf_counter())
+
+	def end_phase(self):
+		with self.lock:
+			self.end_current_phase()
+
+	def end_current_phase(self):
+		# caller must hold the lock
+		if self.current_phase is not None:
+			name, start = self.current_phase
+			self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+			self.current_phase = None
+
+	def record_request(self, service, endpoint, seconds, num_bytes, error=False):
+		''' takes in name of service and endpoint, latency in seconds, size of response body and whether the request failed
+		'''
+		with self.lock:
+			stats = self.requests.setdefault(service, {}).setdefault(endpoint, {
+				'count': 0,
+				'errors': 0,
+				'seconds': 0.0,
+				'bytes': 0,
+				'buckets': [0] * (len(LATENCY_BUCKETS) + 1)
+			})
+			stats['count'] += 1
+			stats['errors'] += int(error)
+			stats['seconds'] += seconds
+			stats['bytes'] += num_bytes
+			stats['buckets'][get_bucket(seconds)] += 1
+
+	def record_job(self, job_name, seconds):
+		with self.lock:
+			self.jobs[job_name] = seconds
+
+	def to_dict(self):
+		''' returns JSON serializable dict of the run profile
+			latency histograms are cumulative, keyed by bucket upper bound
+		'''
+		with self.lock:
+			services = {}
+			for service, endpoints in self.requests.items():
+				services[service] = {
+					'requests': sum(stats['count'] for stats in endpoints.values()),
+					'errors': sum(stats['errors'] for stats in endpoints.values()),
+					'seconds': round(sum(stats['seconds'] for stats in endpoints.values()), 3),
+					'bytes': sum(stats['bytes'] for stats in endpoints.values()),
+					'endpoints': {
+						endpoint: {
+							'count': stats['count'],
+							'errors': stats['errors'],
+							'seconds': round(stats['seconds'], 3),
+							'bytes': stats['bytes'],
+							'latency_buckets': get_cumulative_buckets(stats['buckets'])
+						}
+						for endpoint, stats in sorted(endpoints.items())
+					}
+				}
+			slowest_jobs = sorted(self.jobs.items(), key=lambda job: job[1], reverse=True)[:NUM_SLOWEST_JOBS]
+			profile = {
+				'started_at': datetime.datetime.fromtimestamp(self.started_at).isoformat(),
+				'seconds': round(time.time() - self.started_at, 3),
+				'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+				'services': services,
+				'slowest_jobs': [{'job_name': job_name, 'seconds': round(seconds, 3)} for job_name, seconds in slowest_jobs]
+			}
+			if self.functions is not None:
+				profile['functions'] = self.functions
+			return profile
+
+	def summary(self):
+		''' returns string summarizing phase durations and requests per service
+		'''
+		profile = self.to_dict()
+		phases = ', '.join('{} {:.2f}s'.format(name, seconds) for name, seconds in profile['phases'].items())
+		services = ', '.join(
+			'{} {} requests ({:.1f} KiB)'.format(service, stats['requests'], stats['bytes'] / 1024)
+			for service, stats in profile['services'].items()
+		)
+		return "Run profile: {:.2f}s total - {} - {}".format(profile['seconds'], phases or 'no phases', services or 'no requests')
+
+
+# profile of the current run, reset by record_run
+run_profile = RunProfile()
+
+
+def get_bucket(seconds):
+	''' returns index of the latency histogram bucket of the given number of seconds
+	'''
+	for i, bound in enumerate(LATENCY_BUCKETS):
+		if seconds <= bound:
+			return i
+	return len(LATENCY_BUCKETS)
+
+
+def get_cumulative_buckets(buckets):
+	''' takes in list of request counts per latency bucket
+		returns dict of cumulative counts keyed by bucket upper bound, the last bucket being '+Inf'
+	'''
+	cumulative = {}
+	total = 0
+	for bound, count in zip(list(map(str, LATENCY_BUCKETS)) + ['+Inf'], buckets):
+		total += count
+		cumulative[bound] = total
+	return cumulative
+
+
+def get_endpoint(url):
+	''' takes in request url
+		returns url path with job names, build numbers and ticket keys replaced by placeholders, e.g. /job/*/N/api/json
+		tree queries are marked, as they return much more data than plain requests to the same path
+	'''
+	parsed_url = urlparse(url)
+	parts = parsed_url.path.split('/')
+	for i, part in enumerate(parts):
+		if i > 0 and parts[i - 1] in ('job', 'issue'):
+			parts[i] = '*'
+		elif part.isdigit():
+			parts[i] = 'N'
+	endpoint = '/'.join(parts)
+	if 'tree=' in parsed_url.query:
+		endpoint += '?tree'
+	return endpoint
+
+
+def instrument_session(session, service):
+	''' takes in requests session and name of the service it talks to
+		records every response received by the session in the run profile
+	'''
+	def record_response(response, **kwargs):
+		# read body now so its size can be recorded, unless the caller streams it
+		num_bytes = len(response.content) if not kwargs.get('stream') else int(response.headers.get('Content-Length', 0))
+		run_profile.record_request(
+			service,
+			get_endpoint(response.url),
+			response.elapsed.total_seconds(),
+			num_bytes,
+			error=response.status_code >= 400
+		)
+
+	hooks = session.hooks.setdefault('response', [])
+	if not any(getattr(hook, 'jeeves_service', None) for hook in hooks):
+		record_response.jeeves_service = service
+		hooks.append(record_response)
+	return session
+
+
+def instrument_jenkins_server(server):
+	''' takes in jenkins server object
+		records every request made by the server in the run profile
+	'''
+	session = getattr(server, '_session', None)
+	if session is not None:
+		instrument_session(session, 'jenkins')
+
+
+def get_trace_config(config):
+	''' takes in config dict
+		returns aiohttp trace config recording every request of an aiohttp session in the run profile
+		services are told apart by the configured jenkins_url, bz_url and jira_url
+	'''
+	import aiohttp
+
+	services = [(config.get(key, None), service) for key, service in [('jenkins_url', 'jenkins'), ('bz_url', 'bugzilla'), ('jira_url', 'jira')]]
+
+	async def on_request_start(session, context, params):
+		context.start = time.perf_counter()
+
+	async def on_request_end(session, context, params):
+		url = str(params.url)
+		service = next((service for prefix, service in services if prefix and url.startswith(prefix.rstrip('/'))), urlparse(url).netloc)
+		run_profile.record_request(
+			service,
+			get_endpoint(url),
+			time.perf_counter() - context.start,
+			params.response.content_length or 0,
+			error=params.response.status >= 400
+		)
+
+	trace_config = aiohttp.TraceConfig()
+	trace_config.on_request_start.append(on_request_start)
+	trace_config.on_request_end.append(on_request_end)
+	return trace_config
+
+
+class ThreadProfilers:
+	''' cProfile profilers of the calling thread and of every thread started while they are enabled
+		cProfile only sees the thread it is enabled in, so each worker thread, e.g. of the thread pools fetching jobs,
+		bugs and tickets, enables its own profiler as soon as it starts running
+	'''
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.profilers = []
+
+	def start_thread(self, frame, event, arg):
+		# installed by threading.setprofile, so called on the first event of every new thread, which replaces it
+		profiler = cProfile.Profile()
+		try:
+			profiler.enable()
+		except ValueError:
+			# since python 3.12 profilers see every thread, so the profiler of the calling thread already covers this one
+			return
+		with self.lock:
+			self.profilers.append(profiler)
+
+	def enable(self):
+		self.start_thread(None, 'call', None)
+		threading.setprofile(self.start_thread)
+
+	def disable(self):
+		threading.setprofile(None)
+		with self.lock:
+			profilers = list(self.profilers)
+		for profiler in profilers:
+			profiler.disable()
+		return profilers
+
+
+@contextmanager
+def record_run(config, mode, profile_functions=False):
+	''' context manager recording the run profile of a run of given mode
+		optionally profiles all function calls made in its block with cProfile, including those of worker threads,
+		adding the hottest to the run profile
+		on exit logs a summary and writes the run profile as JSON to profile_file and, if archive_profile is set, to the archive directory
+	'''
+	run_profile.reset()
+	profilers = ThreadProfilers() if profile_functions else None
+	if profilers is not None:
+		profilers.enable()
+	try:
+		yield run_profile
+	finally:
+		run_profile.end_phase()
+		if profilers is not None:
+			run_profile.functions = get_profiled_functions(profilers.disable())
+		print(run_profile.summary())
+		try:
+			for filename in get_profile_filenames(config, mode, profile_functions):
+				write_run_profile(filename, mode)
+				print("Run profile written to {}".format(filename))
+		except Exception as e:
+			print("Error writing run profile: {}".format(e))
+
+
+def get_profiled_functions(profilers):
+	''' takes in list of disabled cProfile profilers, one per profiled thread
+		returns list of the functions with the highest cumulative time across all threads
+	'''
+	stats = pstats.Stats(stream=io.StringIO())
+	for profiler in profilers:
+		try:
+			stats.add(profiler)
+		except TypeError:
+			# profiler of a thread which made no profiled calls
+			continue
+	functions = []
+	for (filename, line, name), (calls, primitive_calls, total_time, cumulative_time, callers) in stats.stats.items():
+		functions.append({
+			'function': '{}:{}({})'.format(filename, line, name),
+			'calls': calls,
+			'total_seconds': round(total_time, 4),
+			'cumulative_seconds': round(cumulative_time, 4)
+		})
+	functions.sort(key=lambda function: function['cumulative_seconds'], reverse=True)
+	return functions[:NUM_PROFILED_FUNCTIONS]
+
+
+def get_profile_filenames(config, mode, profile_functions=False):
+	''' takes in config dict and run mode
+		returns list of files the run profile should be written to
+	'''
+	filenames = []
+	if config.get('profile_file', None):
+		filenames.append(config['profile_file'])
+	elif profile_functions:
+		filenames.append('profile.json')
+	if config.get('archive_profile', False):
+		filenames.append('./archive/profile_{}_{:%Y-%m-%d_%H-%M-%S}.json'.format(mode, datetime.datetime.now()))
+	return filenames
+
+
+def write_run_profile(filename, mode):
+	''' takes in name of file and run mode
+		writes the current run profile to the file as JSON
+	'''
+	directory = os.path.dirname(filename)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	profile = {'mode': mode}
+	profile.update(run_profile.to_dict())
+	with open(filename, 'w') as file:
+		json.dump(profile, file, indent=2)
@@ -1,7 +1,15 @@
 # library functions for handling job data
 
 import re
+import time
 import datetime
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from jeeves.instrumentation import run_profile
 
 CAUSE_ACTION_CLASS = {
 	'timer': 'hudson.triggers.TimerTrigger$TimerTriggerCause',
@@ -9,6 +17,43 @@ CAUSE_ACTION_CLASS = {
 	'upstream': 'hudson.model.Cause$UpstreamCause'
 }
 
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_BULK_PAGE_SIZE = 500
+DEFAULT_HISTORY_PAGE_SIZE = 25
+DEFAULT_OSP_VERSION_CACHE_SIZE = 65536
+DEFAULT_STREAK_WINDOW = 50
+
+# regex matching OSP versions in job names, used if filter_version is not configured
+DEFAULT_FILTER_VERSION = r'1{1}[0,3,6]{1}\.{1}\d{1}|1{1}[0,3,6]{1}(?=\D+)'
+
+# fields of each build action used by get_jenkins_job_info
+BUILD_ACTIONS_TREE = 'actions[_class,parameters[name,value],causes[_class],failCount,html]'
+
+# tree query fetching every job along with the payload of its last completed build
+# only the first two builds are requested as they are just used to detect jobs with no completed build
+JOBS_TREE_QUERY = '?tree=jobs[name,url,builds[number]{{0,2}},lastCompletedBuild[number,result,timestamp,url,' + BUILD_ACTIONS_TREE + ']]{{{start},{end}}}'
+
+# tree query listing every job with just the number of its last completed build, used to detect jobs with new builds
+JOBS_SUMMARY_TREE_QUERY = '?tree=jobs[name,url,lastCompletedBuild[number]]{{{start},{end}}}'
+
+# tree query fetching a page of a job's build history, newest build first
+# allBuilds is paged rather than builds, which Jenkins limits to the newest 100 builds
+BUILDS_TREE_QUERY = '?tree=allBuilds[number,result,building,timestamp,url,' + BUILD_ACTIONS_TREE + ']{{{start},{end}}}'
+
+# tree query fetching a window of a job's most recent builds with just their results, used to compute failure streaks
+# build actions are only requested if builds are filtered
+STREAK_TREE_QUERY = '?tree=allBuilds[number,result,building,timestamp,url{actions}]{{0,{window}}}'
+
+# row fields derived from the stages of failed builds, which take an extra request per failed build to fetch
+STAGE_FIELDS = ('stage_name', 'stage_urls')
+
+# row fields derived from the recent builds of jobs not passing, which take an extra request per job not passing to fetch
+STREAK_FIELDS = ('failure_streak', 'last_success_num', 'last_success_url', 'last_success_days_ago')
+
+# semaphores capping concurrent requests per host, keyed by host and limit and shared by all worker pools
+host_semaphores = {}
+host_semaphores_lock = threading.Lock()
+
 
 def get_stage_failure(build_stages):
 	''' takes in build stages dict
@@ -32,92 +77,327 @@ def generate_failure_stage_log_urls(config, err_stage, job_url, lcb_num):
 	return stage_urls
 
 
-def get_jenkins_job_info(server, job_name, filter_param_name=None, filter_param_value=None, cause_action_class=None):
+def get_build_actions_info(build_actions):
+	''' takes in list of build actions
+		returns tuple of build parameters, build cause class and number of failed tempest tests
+		build parameters default to an empty list, cause to an empty string and failed tests to None
+	'''
+	build_parameters = []
+	build_cause = ''
+	tempest_tests_failed = None
+	for action in build_actions:
+		if action.get('_class') in ['com.tikal.jenkins.plugins.multijob.MultiJobParametersAction', 'hudson.model.ParametersAction']:
+			build_parameters = action['parameters']
+		elif action.get('_class') in ['hudson.model.CauseAction']:
+			build_cause = action['causes'][0].get('_class', '')
+		elif action.get('_class') == 'hudson.tasks.junit.TestResultAction':
+			tempest_tests_failed = action['failCount']
+	return build_parameters, build_cause, tempest_tests_failed
+
+
+def build_matches_filter(build_parameters, build_cause, filter_param_name=None, filter_param_value=None, cause_action_class=None):
+	''' takes in build parameters and build cause class
+		optionally takes name and value of jenkins param and cause action class to filter builds by
+		returns True if build satisfies any of the given filters, False otherwise
+	'''
+	if cause_action_class is not None:
+		if CAUSE_ACTION_CLASS[cause_action_class] == build_cause:
+			return True
+	if filter_param_name is not None and filter_param_value is not None:
+		api_param_values = [param.get('value') for param in build_parameters if filter_param_name == param.get('name', '')]
+		if api_param_values and str(api_param_values[0]).lower() == str(filter_param_value).lower():
+			return True
+	return False
+
+
+def get_composes(build_actions):
+	''' takes in list of build actions
+		returns tuple of compose and second compose found in 'core_puddle' actions
+	'''
+	composes = [str(action['html']).split('core_puddle:')[1].split('<')[0].strip() for action in build_actions if 'core_puddle' in (action.get('html') or '')]
+
+	# No composes could be found; likely a failed job where the 'core_puddle' var was never calculated
+	if composes == []:
+		return "Could not find compose", None
+
+	# Two composes found - job is likely Update or Upgrade
+	elif len(composes) == 2:
+		return composes[0], composes[1]
+
+	# One compose found
+	return composes[0], None
+
+
+def run_requests(server, requests):
+	''' takes in jenkins server object and a generator yielding requests as tuples of server method name and arguments
+		calls the server method of each request, sending its result back into the generator or throwing its exception into it
+		returns value returned by the generator
+		the *_requests generators below hold all logic of fetching job data without doing any I/O themselves,
+		so the same logic is shared by the synchronous server object and the async engine in jeeves.aio
+	'''
+	result = None
+	error = None
+	try:
+		while True:
+			request = requests.send(result) if error is None else requests.throw(error)
+			try:
+				result = getattr(server, request[0])(*request[1:])
+				error = None
+			except Exception as e:
+				result = None
+				error = e
+	except StopIteration as stop:
+		return stop.value
+
+
+def get_build_info_requests(job_name, number, cache=None):
+	''' takes in job name and build number
+		optionally takes BuildCache to read from and store finished builds in
+		yields requests for run_requests and returns build info dict
+	'''
+	if cache is not None:
+		build_info = cache.get(job_name, number, 'build_info')
+		if build_info is not None:
+			return build_info
+
+	build_info = yield ('get_build_info', job_name, number)
+	if cache is not None and not build_info.get('building') and build_info.get('result') is not None:
+		cache.set(job_name, number, 'build_info', build_info)
+	return build_info
+
+
+def get_build_info(server, job_name, number, cache=None):
+	''' takes in jenkins server object, job name and build number
+		optionally takes BuildCache to read from and store finished builds in
+		returns build info dict
+	'''
+	return run_requests(server, get_build_info_requests(job_name, number, cache))
+
+
+def get_build_stages_requests(job_name, number, cache=None):
+	''' takes in job name and number of a finished build
+		optionally takes BuildCache to read from and store build stages in
+		yields requests for run_requests and returns build stages dict
+	'''
+	if cache is not None:
+		build_stages = cache.get(job_name, number, 'build_stages')
+		if build_stages is not None:
+			return build_stages
+
+	build_stages = yield ('get_build_stages', job_name, number)
+	if cache is not None and build_stages is not None:
+		cache.set(job_name, number, 'build_stages', build_stages)
+	return build_stages
+
+
+def get_build_stages(server, job_name, number, cache=None):
+	''' takes in jenkins server object, job name and number of a finished build
+		optionally takes BuildCache to read from and store build stages in
+		returns build stages dict
+	'''
+	return run_requests(server, get_build_stages_requests(job_name, number, cache))
+
+
+def get_build_days_ago(build_time):
+	''' takes in build timestamp in milliseconds
+		returns number of whole days since the build
+	'''
+	return (datetime.datetime.now() - datetime.datetime.fromtimestamp(build_time / 1000)).days
+
+
+def get_job_item(job_name):
+	''' takes in job name, including any folders separated by '/'
+		returns path of the job relative to the jenkins server url
+	'''
+	return '/'.join('job/' + part for part in job_name.split('/'))
+
+
+def get_filtered_build_requests(job_name, before, filter_param_name=None, filter_param_value=None, cause_action_class=None, page_size=DEFAULT_HISTORY_PAGE_SIZE, max_depth=None):
+	''' takes in job name and a build number
+		optionally takes name and value of jenkins param and cause action class to filter builds by
+		scans completed builds older than the given build number in pages of page_size builds
+		filters are evaluated locally against the actions of each build in the page
+		yields requests for run_requests and returns info dict of the newest matching build
+		raises exception if no build matches within the job history or the first max_depth completed builds
+	'''
+	start = 0
+	depth = 0
+	while True:
+		builds = (yield (
+			'get_info',
+			get_job_item(job_name),
+			BUILDS_TREE_QUERY.format(start=start, end=start + page_size)
+		)).get('allBuilds', [])
+
+		for build_info in builds:
+			if build_info['number'] >= before or build_info.get('building') or build_info.get('result') is None:
+				continue
+			if max_depth is not None and depth >= max_depth:
+				raise Exception("No filter match")
+			depth += 1
+			build_parameters, build_cause, tempest_tests_failed = get_build_actions_info(build_info.get('actions', []))
+			if build_matches_filter(build_parameters, build_cause, filter_param_name, filter_param_value, cause_action_class):
+				return build_info
+
+		if len(builds) < page_size:
+			raise Exception("No filter match")
+		start += page_size
+
+
+def get_filtered_build(server, job_name, before, filter_param_name=None, filter_param_value=None, cause_action_class=None, page_size=DEFAULT_HISTORY_PAGE_SIZE, max_depth=None):
+	''' takes in jenkins server object, job name and a build number
+		optionally takes name and value of jenkins param and cause action class to filter builds by
+		returns info dict of the newest matching build older than the given build number, see get_filtered_build_requests
+		raises exception if no build matches within the job history or the first max_depth completed builds
+	'''
+	return run_requests(server, get_filtered_build_requests(
+		job_name,
+		before,
+		filter_param_name=filter_param_name,
+		filter_param_value=filter_param_value,
+		cause_action_class=cause_action_class,
+		page_size=page_size,
+		max_depth=max_depth
+	))
+
+
+def get_failure_streak_requests(job_name, lcb_num, filter_param_name=None, filter_param_value=None, cause_action_class=None, window=DEFAULT_STREAK_WINDOW):
+	''' takes in job name and number of its last completed build
+		optionally takes name and value of jenkins param and cause action class to filter builds by
+		optionally takes number of most recent builds to scan
+		fetches the window of recent builds with a single request, ignoring builds newer than the given build,
+		running builds and builds not matching the filters
+		yields requests for run_requests and returns tuple of the number of builds not passing since the last passing build
+		and info dict of the last passing build, which is None if there is none within the window
+	'''
+	filtered = (filter_param_name is not None and filter_param_value is not None) or cause_action_class is not None
+	builds = (yield (
+		'get_info',
+		get_job_item(job_name),
+		STREAK_TREE_QUERY.format(actions=',' + BUILD_ACTIONS_TREE if filtered else '', window=window)
+	)).get('allBuilds', [])
+
+	failure_streak = 0
+	for build_info in builds:
+		if build_info['number'] > lcb_num or build_info.get('building') or build_info.get('result') is None:
+			continue
+		if filtered:
+			build_parameters, build_cause, tempest_tests_failed = get_build_actions_info(build_info.get('actions', []))
+			if not build_matches_filter(build_parameters, build_cause, filter_param_name, filter_param_value, cause_action_class):
+				continue
+		if build_info['result'] == 'SUCCESS':
+			return failure_streak, build_info
+		failure_streak += 1
+	return failure_streak, None
+
+
+def get_jenkins_job_info(server, job_name, **kwargs):
 	''' takes in jenkins server object and job name
+		optionally takes any filter, job info, cache and history option accepted by get_jenkins_job_info_requests
+		returns dict of API info for given job if success
+		returns False if failure
+	'''
+	return run_requests(server, get_jenkins_job_info_requests(job_name, **kwargs))
+
+
+def get_jenkins_job_info_requests(job_name, filter_param_name=None, filter_param_value=None, cause_action_class=None, job_info=None, cache=None, history_page_size=DEFAULT_HISTORY_PAGE_SIZE, history_max_depth=None, fetch_stages=True, fetch_streaks=False, streak_window=DEFAULT_STREAK_WINDOW):
+	''' takes in job name
 		optionally takes name and value of jenkins param to filter builds by
+		optionally takes job info already fetched by get_jenkins_jobs_tree to avoid refetching the job and its last completed build
+		job info from a job listing lacking the builds of the job is ignored and the job is fetched again
+		optionally takes BuildCache used for finished builds and their stages
+		optionally takes page size and maximum depth of the build history scanned for builds matching the filters
+		if fetch_stages is false the stages of failed builds are not fetched and stage_failure is always 'N/A'
+		if fetch_streaks is true the last streak_window builds of jobs not passing are fetched to find their last passing build,
+		otherwise failure_streak and last_success_* fields are only known for passing jobs
+		yields requests for run_requests
 		returns dict of API info for given job if success
 		returns False if failure
 	'''
 
 	# set default value for job_info for cased exception handling
+	prefetched_job_info = job_info
 	job_info = {}
 
 	try:
-		job_info = server.get_job_info(job_name)
+		if prefetched_job_info and 'builds' in prefetched_job_info and 'lastCompletedBuild' in prefetched_job_info:
+			job_info = prefetched_job_info
+		else:
+			job_info = yield ('get_job_info', job_name)
 		job_url = job_info['url']
 		lcb_num = job_info['lastCompletedBuild']['number']
-		tempest_tests_failed = None
 		stage_failure = 'N/A'
-		build_info = server.get_build_info(job_name, lcb_num)
 
+		# bulk tree query includes last completed build payload, otherwise fetch it
+		if 'actions' in job_info['lastCompletedBuild']:
+			build_info = job_info['lastCompletedBuild']
+		else:
+			build_info = yield from get_build_info_requests(job_name, lcb_num, cache)
 		build_actions = build_info['actions']
-		for action in build_actions:
-			if action.get('_class') in ['com.tikal.jenkins.plugins.multijob.MultiJobParametersAction', 'hudson.model.ParametersAction']:
-				build_parameters = action['parameters']
-			elif action.get('_class') in ['hudson.model.CauseAction']:
-				build_cause = action['causes'][0].get('_class', '')
-			elif action.get('_class') == 'hudson.tasks.junit.TestResultAction':
-				tempest_tests_failed = action['failCount']
+		build_parameters, build_cause, tempest_tests_failed = get_build_actions_info(build_actions)
 
 		# if desired, get last completed build with custom parameter and value or desired cause action class
 		if ((filter_param_name is not None and filter_param_value is not None) or cause_action_class is not None):
-			while True:
-				if cause_action_class is not None:
-					if CAUSE_ACTION_CLASS[cause_action_class] == build_cause:
-						break
-				if filter_param_name is not None:
-					api_param_value = [param['value'] for param in build_parameters if filter_param_name == param.get('name', '')][0]
-					if str(api_param_value).lower() == str(filter_param_value).lower():
-						break
-				if build_info['previousBuild'] is None:
-					raise Exception("No filter match")
-				lcb_num = build_info['previousBuild']['number']
-				build_info = server.get_build_info(job_name, lcb_num)
-				build_actions = build_info['actions']
-				for action in build_actions:
-					if action.get('_class') in ['com.tikal.jenkins.plugins.multijob.MultiJobParametersAction', 'hudson.model.ParametersAction']:
-						build_parameters = action['parameters']
-					elif action.get('_class') in ['hudson.model.CauseAction']:
-						build_cause = action['causes'][0].get('_class', '')
-					elif action.get('_class') == 'hudson.tasks.junit.TestResultAction':
-						tempest_tests_failed = action['failCount']
+			if not build_matches_filter(build_parameters, build_cause, filter_param_name, filter_param_value, cause_action_class):
+				build_info = yield from get_filtered_build_requests(
+					job_name,
+					lcb_num,
+					filter_param_name=filter_param_name,
+					filter_param_value=filter_param_value,
+					cause_action_class=cause_action_class,
+					page_size=history_page_size,
+					max_depth=history_max_depth
+				)
+				lcb_num = build_info['number']
+				build_actions = build_info.get('actions', [])
+				build_parameters, build_cause, tempest_tests_failed = get_build_actions_info(build_actions)
 
 		build_time = build_info.get('timestamp')
-		build_days_ago = (datetime.datetime.now() - datetime.datetime.fromtimestamp(build_time / 1000)).days
+		build_days_ago = get_build_days_ago(build_time)
 		lcb_url = build_info['url']
 		lcb_result = build_info['result']
-		composes = [str(action['html']).split('core_puddle:')[1].split('<')[0].strip() for action in build_actions if 'core_puddle' in action.get('html', '')]
-		if lcb_result == 'FAILURE':
-			build_stages = server.get_build_stages(job_name, lcb_num)
+		compose, second_compose = get_composes(build_actions)
+		if lcb_result == 'FAILURE' and fetch_stages:
+			build_stages = yield from get_build_stages_requests(job_name, lcb_num, cache)
 			stage_failure = get_stage_failure(build_stages)
 
-		# No composes could be found; likely a failed job where the 'core_puddle' var was never calculated
-		if composes == []:
-			compose = "Could not find compose"
-			second_compose = None
-		# Two composes found - job is likely Update or Upgrade
-		elif len(composes) == 2:
-			compose = composes[0]
-			second_compose = composes[1]
-		# One compose found
-		else:
-			compose = composes[0]
-			second_compose = None
+		# a passing job has no failure streak, otherwise count the builds not passing since its last passing build
+		failure_streak = None
+		last_success = None
+		if lcb_result == 'SUCCESS':
+			failure_streak = 0
+			last_success = build_info
+		elif fetch_streaks:
+			try:
+				failure_streak, last_success = yield from get_failure_streak_requests(
+					job_name,
+					lcb_num,
+					filter_param_name=filter_param_name,
+					filter_param_value=filter_param_value,
+					cause_action_class=cause_action_class,
+					window=streak_window
+				)
+			except Exception as e:
+				print("Error fetching recent builds of job {}: {}".format(job_name, e))
 
 	except Exception as e:
 
 		# No "Last Completed Build" found
 		# Checks for len <= 1 as running builds are included in the below query
 		# or check for filter exclusion
-		if len(job_info.get('builds')) <= 1 or str(e) == "No filter match":
+		# job info is empty if the job itself could not be fetched
+		if (job_info.get('builds') is not None and len(job_info['builds']) <= 1) or str(e) == "No filter match":
 			lcb_num = None
 			lcb_url = None
+			build_time = None
 			compose = "N/A"
 			second_compose = None
 			build_days_ago = "N/A"
 			lcb_result = "NO_KNOWN_BUILDS"
 			stage_failure = 'N/A'
 			tempest_tests_failed = None
+			failure_streak = None
+			last_success = None
 
 		# Unknown error, skip job
 		else:
@@ -132,43 +412,158 @@ def get_jenkins_job_info(server, job_name, filter_param_name=None, filter_param_
 		'second_compose': second_compose,
 		'lcb_result': lcb_result,
 		'build_days_ago': build_days_ago,
+		'lcb_timestamp': build_time,
 		'tempest_tests_failed': tempest_tests_failed,
-		'stage_failure': stage_failure
+		'stage_failure': stage_failure,
+		'failure_streak': failure_streak,
+		'last_success_num': last_success['number'] if last_success else None,
+		'last_success_url': last_success['url'] if last_success else None,
+		'last_success_timestamp': last_success['timestamp'] if last_success else None,
+		'last_success_days_ago': get_build_days_ago(last_success['timestamp']) if last_success else None
 	}
 	return jenkins_api_info
 
 
-def get_jenkins_jobs(server, job_search_fields, supported_versions):
+def get_host_semaphore(url, limit):
+	''' takes in a url and a concurrency limit
+		returns semaphore shared by every request made to the host of the given url with the same limit
+		so a changed limit, e.g. of another instance on the same host or a reloaded config, is always applied
+	'''
+	key = (urlparse(url).netloc, limit)
+	with host_semaphores_lock:
+		if key not in host_semaphores:
+			host_semaphores[key] = threading.BoundedSemaphore(limit)
+		return host_semaphores[key]
+
+
+def get_jenkins_jobs_info(server, job_names, max_workers=DEFAULT_MAX_WORKERS, max_workers_per_host=None, job_infos=None, **kwargs):
+	''' takes in jenkins server object and list of job names
+		optionally takes size of worker pool, per-host concurrency cap and any filter accepted by get_jenkins_job_info
+		optionally takes dict of job infos already fetched by get_jenkins_jobs_tree with job names as keys
+		fetches API info for all jobs concurrently
+		returns dict with job names as keys and get_jenkins_job_info results as values
+	'''
+	max_workers = max(1, int(max_workers))
+	semaphore = get_host_semaphore(getattr(server, 'server', ''), int(max_workers_per_host or max_workers))
+	job_infos = job_infos or {}
+
+	def fetch(job_name):
+		with semaphore:
+			start = time.perf_counter()
+			jenkins_api_info = get_jenkins_job_info(server, job_name, job_info=job_infos.get(job_name), **kwargs)
+			run_profile.record_job(job_name, time.perf_counter() - start)
+			return jenkins_api_info
+
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		return dict(zip(job_names, executor.map(fetch, job_names)))
+
+
+def get_jenkins_jobs_tree_requests(page_size=DEFAULT_BULK_PAGE_SIZE, query=JOBS_TREE_QUERY):
+	''' optionally takes number of jobs to request per page and tree query to request them with
+		fetches every top-level job along with its last completed build via paginated tree queries
+		yields requests for run_requests and returns list of job info dicts
+	'''
+	jobs = []
+	start = 0
+	while True:
+		page = (yield ('get_info', '', query.format(start=start, end=start + page_size))).get('jobs', [])
+		jobs.extend(page)
+		if len(page) < page_size:
+			return jobs
+		start += page_size
+
+
+def get_jenkins_jobs_tree(server, page_size=DEFAULT_BULK_PAGE_SIZE, query=JOBS_TREE_QUERY):
+	''' takes in jenkins server object
+		optionally takes number of jobs to request per page and tree query to request them with
+		returns list of job info dicts of every top-level job, see get_jenkins_jobs_tree_requests
+	'''
+	return run_requests(server, get_jenkins_jobs_tree_requests(page_size, query))
+
+
+def get_job_name_matcher(fields):
+	''' takes in list of job search field regex strings
+		returns function telling whether a job name matches any of the fields, using a single compiled alternation
+		fields that are not valid regex are logged and skipped
+	'''
+	patterns = []
+	for field in fields:
+		try:
+			re.compile(field)
+			patterns.append(field)
+		except re.error as e:
+			print("Error compiling regex: {} - skipping this search field...".format(e))
+
+	if not patterns:
+		return lambda job_name: False
+
+	# fields can only be combined if their groups do not clash, e.g. duplicate group names
+	try:
+		return re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns)).search
+	except re.error:
+		regexes = [re.compile(pattern) for pattern in patterns]
+		return lambda job_name: any(regex.search(job_name) for regex in regexes)
+
+
+def get_supported_version_matcher(supported_versions):
+	''' takes in list of supported version strings
+		returns compiled regex search function telling whether a job name contains any supported version
+	'''
+	versions = sorted(set(map(str, supported_versions)), key=len, reverse=True)
+	if not versions:
+		return lambda job_name: False
+	return re.compile('|'.join(map(re.escape, versions))).search
+
+
+def get_jenkins_jobs(server, job_search_fields, supported_versions, bulk=False, page_size=DEFAULT_BULK_PAGE_SIZE, all_jobs=None):
 	''' takes in a Jenkins server object, job_search_fields string, and supported_versions list
-		returns list of jobs with given search field as part of their name
+		optionally takes bulk flag to also fetch the last completed build of every job with the job list
+		optionally takes list of all jobs already listed by get_jenkins_jobs_tree to match search fields against instead
+		the job list is fetched once and matched against all search fields in a single pass
+		returns list of jobs with given search field as part of their name, each job appearing once
 	'''
 
 	# parse list of search fields
 	fields = job_search_fields.split(',') if not type(job_search_fields) is list else job_search_fields
-	fields_length = len(fields)
 
 	# remove spacing from strings
-	for i in range(fields_length):
-		fields[i] = fields[i].strip(' ')
+	fields = [field.strip(' ') for field in fields]
 
-	# check for fields that contain valid regex
-	relevant_jobs = []
-	for field in fields:
-		try:
+	# fetch the job list once - in bulk mode this includes the last completed build of each job
+	if all_jobs is None:
+		all_jobs = get_jenkins_jobs_tree(server, page_size, query=JOBS_TREE_QUERY if bulk else JOBS_SUMMARY_TREE_QUERY)
 
-			# fetch all jobs from server that match the given regex or search
-			all_jobs = server.get_job_info_regex(field)
+	matches_field = get_job_name_matcher(fields)
+	matches_version = get_supported_version_matcher(supported_versions)
 
-			# parse out all jobs that do not contain any search field and/or are not a supported version
-			for job in all_jobs:
-				job_name = job['name']
-				if any(supported_version in job_name for supported_version in supported_versions):
-					relevant_jobs.append(job)
+	# parse out all jobs that do not contain any search field and/or are not a supported version
+	relevant_jobs = {}
+	for job in all_jobs:
+		job_name = job['name']
+		if job_name not in relevant_jobs and matches_field(job_name) and matches_version(job_name):
+			relevant_jobs[job_name] = job
 
-		except Exception as e:
-			print("Error compiling regex: {} - skipping this search field...".format(e))
+	return list(relevant_jobs.values())
 
-	return relevant_jobs
+
+@lru_cache(maxsize=32)
+def get_filter_version_regex(filter_version):
+	''' takes in filter_version regex string
+		returns compiled regex, so each configured pattern is only compiled once per process
+	'''
+	return re.compile(filter_version)
+
+
+@lru_cache(maxsize=DEFAULT_OSP_VERSION_CACHE_SIZE)
+def match_osp_version(job_name, filter_version):
+	''' takes in job name and filter_version regex string
+		returns highest osp version found in job name as a string or None if no version is found
+		results are cached, as the same job names are classified on every run
+	'''
+	versions = get_filter_version_regex(filter_version).findall(job_name)
+	if not versions:
+		return None
+	return '{:g}'.format(max(map(float, versions)))
 
 
 def get_osp_version(job_name, filter_version=None):
@@ -176,18 +571,13 @@ def get_osp_version(job_name, filter_version=None):
 		if multiple versions detected, the highest number is considered osp version
 		returns osp version as a string or None if no version is found
 	'''
+	return match_osp_version(job_name, filter_version or DEFAULT_FILTER_VERSION)
 
-	if not filter_version or filter_version is None:
-		filter_version = r'1{1}[0,3,6]{1}\.{1}\d{1}|1{1}[0,3,6]{1}(?=\D+)'
 
-	versions = re.findall(
-		r'{filter_version}'.format(filter_version=filter_version),
-		job_name
-	)
-
-	if not versions:
-		return None
-
-	versions_f = map(float, versions)
-	max_value = max(versions_f)
-	return '{:g}'.format(max_value)
+def get_osp_versions(job_names, filter_version=None):
+	''' takes in list of job names
+		optionally takes filter_version regex string
+		returns dict with job names as keys and osp version strings or None as values
+	'''
+	filter_version = filter_version or DEFAULT_FILTER_VERSION
+	return {job_name: match_osp_version(job_name, filter_version) for job_name in job_names}
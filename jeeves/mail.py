@@ -0,0 +1,148 @@
+# library functions for delivering email
+
+from concurrent.futures import ThreadPoolExecutor
+from smtplib import SMTP, SMTPException, SMTPServerDisconnected
+
+DEFAULT_SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+DEFAULT_SMTP_WORKERS = 1
+
+
+def open_smtp_connection(config):
+	''' takes in config dict
+		returns SMTP session with TLS started, logged in if smtp_username is configured
+	'''
+	smtp = SMTP(config['smtp_host'])
+	try:
+		track_data_sent(smtp)
+
+		# start TLS for security
+		smtp.starttls()
+
+		# use ehlo or helo if needed
+		smtp.ehlo_or_helo_if_needed()
+
+		if config.get('smtp_username', None):
+			smtp.login(config['smtp_username'], config['smtp_password'])
+	except Exception:
+		close_smtp_connection(smtp)
+		raise
+	return smtp
+
+
+def track_data_sent(smtp):
+	''' takes in SMTP session
+		wraps its DATA command, so smtp.data_sent tells whether a message was handed over to the mail server
+		once it was, the server may have accepted the message even if the connection dropped before its reply
+	'''
+	send_data = smtp.data
+
+	def data(msg):
+		smtp.data_sent = True
+		return send_data(msg)
+
+	smtp.data = data
+	smtp.data_sent = False
+
+
+def is_connection_error(e):
+	''' returns True if exception is a dropped or failed connection to the mail server
+		rather than a reply of the server, such as a refused sender or recipient, which would fail again if retried
+	'''
+	return isinstance(e, SMTPServerDisconnected) or (isinstance(e, OSError) and not isinstance(e, SMTPException))
+
+
+def close_smtp_connection(smtp):
+	''' closes given SMTP session, ignoring errors from sessions that are already broken
+	'''
+	try:
+		smtp.quit()
+	except Exception:
+		smtp.close()
+
+
+def send_messages(config, messages, max_messages_per_connection=DEFAULT_SMTP_MAX_MESSAGES_PER_CONNECTION):
+	''' takes in config dict and list of (message, recipients) tuples
+		sends messages in order over one SMTP session, reconnecting after max_messages_per_connection
+		messages whose connection failed before they were handed over to the mail server are retried once over a new session
+		any other error is recorded as a failure without resending, so no message is ever delivered twice
+		returns list of delivery results in the same order as the messages
+	'''
+	results = []
+	smtp = None
+	num_sent = 0
+	for msg, recipients in messages:
+		for attempt in range(2):
+			data_sent = False
+			try:
+				if smtp is None or num_sent >= max_messages_per_connection:
+					if smtp is not None:
+						close_smtp_connection(smtp)
+					smtp = None
+					smtp = open_smtp_connection(config)
+					num_sent = 0
+				smtp.data_sent = False
+				refused = smtp.sendmail(msg['From'], recipients, msg.as_string())
+				num_sent += 1
+				result = {'recipients': recipients, 'refused': refused, 'error': None}
+				break
+			except Exception as e:
+				if smtp is not None:
+					data_sent = smtp.data_sent
+					close_smtp_connection(smtp)
+				smtp = None
+				result = {'recipients': recipients, 'refused': {}, 'error': e}
+				if not is_connection_error(e) or data_sent:
+					break
+		results.append(result)
+
+	if smtp is not None:
+		close_smtp_connection(smtp)
+	return results
+
+
+def send_emails(config, messages):
+	''' takes in config dict and list of (message, recipients) tuples
+		sends messages over up to smtp_workers concurrent SMTP sessions which are reused for many messages
+		logs a per-recipient delivery summary
+		returns list of delivery results in the same order as the messages
+		each result is a dict with recipients, refused recipients and error (None if the mail server accepted the message)
+	'''
+	if len(messages) == 0:
+		return []
+
+	max_messages_per_connection = max(1, int(config.get('smtp_max_messages_per_connection', DEFAULT_SMTP_MAX_MESSAGES_PER_CONNECTION)))
+	num_workers = min(max(1, int(config.get('smtp_workers', DEFAULT_SMTP_WORKERS))), len(messages))
+
+	# split messages round-robin between workers, each sending its share over its own session
+	shares = [list(range(len(messages)))[i::num_workers] for i in range(num_workers)]
+	with ThreadPoolExecutor(max_workers=num_workers) as executor:
+		share_results = executor.map(
+			lambda share: send_messages(config, [messages[i] for i in share], max_messages_per_connection),
+			shares
+		)
+		results = [None] * len(messages)
+		for share, share_result in zip(shares, share_results):
+			for i, result in zip(share, share_result):
+				results[i] = result
+
+	print_delivery_summary(results)
+	return results
+
+
+def is_delivered(result):
+	''' returns True if mail server accepted the message for all of its recipients
+	'''
+	return result['error'] is None and result['refused'] == {}
+
+
+def print_delivery_summary(results):
+	''' logs number of messages accepted by the mail server and any recipient that could not be delivered to
+	'''
+	num_delivered = len([result for result in results if is_delivered(result)])
+	print("Email delivery summary: {}/{} messages accepted by mail server".format(num_delivered, len(results)))
+	for result in results:
+		for recipient in result['recipients']:
+			if result['error'] is not None:
+				print("  {}: failed ({})".format(recipient, result['error']))
+			elif recipient in result['refused']:
+				print("  {}: refused {}".format(recipient, result['refused'][recipient]))
@@ -0,0 +1,152 @@
+# library functions for exporting CI health and run metrics in the OpenMetrics text format
+
+import os
+import datetime
+
+# results of last completed builds counted in reports, in the order they are exported
+RESULTS = ('success', 'unstable', 'failure', 'aborted', 'missing', 'error')
+
+
+def escape_label_value(value):
+	''' takes in label value
+		returns value escaped for use in the OpenMetrics text format
+	'''
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample(name, labels, value):
+	''' takes in metric sample name, dict of labels and value
+		returns sample line in the OpenMetrics text format
+	'''
+	if labels:
+		name += '{' + ','.join('{}="{}"'.format(label, escape_label_value(label_value)) for label, label_value in labels.items()) + '}'
+	if isinstance(value, float):
+		value = repr(round(value, 6))
+	return '{} {}'.format(name, value)
+
+
+class MetricFamilies:
+	''' ordered collection of metric families, each with its type, help text and samples
+	'''
+
+	def __init__(self):
+		self.families = {}
+
+	def add(self, name, metric_type, help_text, value, suffix='', **labels):
+		''' takes in metric family name, type, help text and a sample value with its optional name suffix and labels
+		'''
+		family = self.families.setdefault(name, {'type': metric_type, 'help': help_text, 'samples': []})
+		family['samples'].append(format_sample(name + suffix, labels, value))
+
+	def add_histogram(self, name, help_text, cumulative_buckets, count, seconds, **labels):
+		''' takes in histogram name, help text, dict of cumulative counts keyed by bucket upper bound, total count and sum
+		'''
+		for bound, bucket_count in cumulative_buckets.items():
+			self.add(name, 'histogram', help_text, bucket_count, suffix='_bucket', le=bound, **labels)
+		self.add(name, 'histogram', help_text, count, suffix='_count', **labels)
+		self.add(name, 'histogram', help_text, float(seconds), suffix='_sum', **labels)
+
+	def generate(self):
+		''' returns all metric families in the OpenMetrics text format
+		'''
+		lines = []
+		for name, family in self.families.items():
+			lines.append('# TYPE {} {}'.format(name, family['type']))
+			lines.append('# HELP {} {}'.format(name, family['help']))
+			lines.extend(family['samples'])
+		lines.append('# EOF')
+		return '\n'.join(lines) + '\n'
+
+
+def add_report_metrics(metrics, report_stats):
+	''' takes in MetricFamilies and CI health stats returned by run_report
+	'''
+	for result in RESULTS:
+		metrics.add('jeeves_jobs', 'gauge', 'Number of reported jobs by result of their last completed build', report_stats['results'][result], result=result)
+	for version, results in sorted(report_stats['results_per_version'].items()):
+		for result in RESULTS:
+			metrics.add('jeeves_version_jobs', 'gauge', 'Number of reported jobs by OSP version and result of their last completed build', results[result], osp_version=version, result=result)
+	metrics.add('jeeves_covered_jobs', 'gauge', 'Number of reported jobs not passing which have blockers on file', report_stats['num_covered'])
+	metrics.add('jeeves_blocker_coverage_ratio', 'gauge', 'Ratio of reported jobs not passing which have blockers on file', float(report_stats['coverage']))
+	for kind in ('total', 'unique'):
+		metrics.add('jeeves_blocker_bugs', 'gauge', 'Number of blocker bugs of reported jobs', report_stats['bugs'][kind], kind=kind)
+	for kind in ('total', 'unique'):
+		metrics.add('jeeves_blocker_tickets', 'gauge', 'Number of blocker tickets of reported jobs', report_stats['tickets'][kind], kind=kind)
+	metrics.add('jeeves_dropped_jobs', 'gauge', 'Number of jobs which could not be fetched from Jenkins', report_stats['num_dropped'])
+
+
+def add_remind_metrics(metrics, remind_stats):
+	''' takes in MetricFamilies and stats returned by run_remind
+	'''
+	metrics.add('jeeves_owners', 'gauge', 'Number of job owners in the blockers file', remind_stats['num_owners'])
+	metrics.add('jeeves_failing_owned_jobs', 'gauge', 'Number of owned jobs not passing', remind_stats['num_failing_jobs'])
+	metrics.add('jeeves_reminders', 'gauge', 'Number of reminders sent', remind_stats['num_reminders'])
+	metrics.add('jeeves_delivered_reminders', 'gauge', 'Number of reminders accepted by the mail server', remind_stats['num_delivered'])
+
+
+def add_profile_metrics(metrics, mode, profile):
+	''' takes in MetricFamilies, run mode and run profile dict as returned by RunProfile.to_dict
+	'''
+	finished_at = datetime.datetime.fromisoformat(profile['started_at']).timestamp() + profile['seconds']
+	metrics.add('jeeves_last_run_timestamp_seconds', 'gauge', 'Time the last run of jeeves finished', float(finished_at), mode=mode)
+	metrics.add('jeeves_run_duration_seconds', 'gauge', 'Duration of the last run of jeeves', float(profile['seconds']), mode=mode)
+	for name, seconds in profile['phases'].items():
+		metrics.add('jeeves_phase_duration_seconds', 'gauge', 'Time spent in each phase of the last run of jeeves', float(seconds), mode=mode, phase=name)
+	for service, service_stats in sorted(profile['services'].items()):
+		for endpoint, stats in service_stats['endpoints'].items():
+			labels = {'mode': mode, 'service': service, 'endpoint': endpoint}
+			metrics.add('jeeves_api_requests', 'gauge', 'Number of API requests made by the last run of jeeves', stats['count'], **labels)
+			metrics.add('jeeves_api_errors', 'gauge', 'Number of API requests answered with an error status in the last run of jeeves', stats['errors'], **labels)
+			metrics.add('jeeves_api_received_bytes', 'gauge', 'Number of bytes of API responses received by the last run of jeeves', stats['bytes'], **labels)
+			metrics.add_histogram(
+				'jeeves_api_request_duration_seconds',
+				'Latency of API requests made by the last run of jeeves',
+				stats['latency_buckets'],
+				stats['count'],
+				stats['seconds'],
+				**labels
+			)
+
+
+def generate_metrics(runs):
+	''' takes in dict of runs keyed by run mode, each a tuple of the stats returned by run_report or run_remind
+		(None if the run ended early) and the run profile dict
+		returns metrics of the runs in the OpenMetrics text format
+	'''
+	metrics = MetricFamilies()
+	for mode, (run_stats, profile) in runs.items():
+		if run_stats is not None:
+			if mode == 'report':
+				add_report_metrics(metrics, run_stats)
+			else:
+				add_remind_metrics(metrics, run_stats)
+	for mode, (run_stats, profile) in runs.items():
+		add_profile_metrics(metrics, mode, profile)
+	return metrics.generate()
+
+
+def write_metrics_file(metrics_file, metrics):
+	''' takes in path of metrics file and metrics text
+		writes metrics to a temporary file first, so collectors such as node_exporter never read a partially written file
+	'''
+	metrics_dir = os.path.dirname(metrics_file)
+	if metrics_dir:
+		os.makedirs(metrics_dir, exist_ok=True)
+	tmp_file = metrics_file + '.tmp'
+	with open(tmp_file, 'w') as file:
+		file.write(metrics)
+	os.replace(tmp_file, metrics_file)
+
+
+def export_metrics(config, mode, run_stats, profile):
+	''' takes in config dict, run mode, stats returned by run_report or run_remind and run profile dict
+		writes metrics of the run to metrics_file if configured, replacing any {mode} placeholder with the run mode
+	'''
+	if not config.get('metrics_file', None):
+		return
+	metrics_file = config['metrics_file'].replace('{mode}', mode)
+	try:
+		write_metrics_file(metrics_file, generate_metrics({mode: (run_stats, profile)}))
+		print("Metrics written to {}".format(metrics_file))
+	except Exception as e:
+		print("Error writing metrics file {}: {}".format(metrics_file, e))
@@ -1,23 +1,91 @@
-import jinja2
-
+from functools import partial
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from smtplib import SMTP
-
-from jeeves.common import generate_html_file
-from jeeves.jobs import get_jenkins_job_info, get_osp_version, generate_failure_stage_log_urls
-from jeeves.blockers import get_bugs_dict, get_tickets_dict, get_other_blockers
-
-
-def run_remind(config, blockers, server, header):
 
-	# get list of all owners in blocker file
+from jeeves.cache import get_build_cache
+from jeeves.connection import get_instance_servers, get_pool_stats
+from jeeves.common import generate_html_file, run_parallel
+from jeeves.instrumentation import instrument_jenkins_server, run_profile
+from jeeves.mail import is_delivered, send_emails
+from jeeves.resilience import get_jenkins_resilience, install_jenkins_resilience
+from jeeves.render import get_fetch_options, get_render_stats, get_template, get_template_fields, render_template, reset_render_stats
+from jeeves.jobs import DEFAULT_BULK_PAGE_SIZE, DEFAULT_HISTORY_PAGE_SIZE, DEFAULT_MAX_WORKERS, JOBS_SUMMARY_TREE_QUERY, get_jenkins_jobs_info, get_jenkins_jobs_tree, get_osp_versions, generate_failure_stage_log_urls
+from jeeves.blockers import get_blocker_cache, get_bugs_dict, get_bugs_set, get_tickets_dict, get_tickets_set, get_other_blockers
+
+
+def list_owned_jobs(instance, engine='sync'):
+	''' takes in dict of a jenkins instance with its config, server, resilience and owned_jobs, and engine
+		lists all jobs of the instance with a single lightweight request, keeping only the owned jobs it has in owned_jobs
+		if the listing fails, the instance is treated as having no jobs
+	'''
+	config = instance['config']
+	page_size = config.get('bulk_page_size', DEFAULT_BULK_PAGE_SIZE)
+	try:
+		if engine == 'async':
+			from jeeves import aio
+			all_jobs = aio.get_jenkins_jobs_tree_async(config, page_size, JOBS_SUMMARY_TREE_QUERY, instance['resilience'])
+		else:
+			all_jobs = get_jenkins_jobs_tree(instance['server'], page_size, JOBS_SUMMARY_TREE_QUERY)
+	except Exception as e:
+		print("{}Error listing Jenkins jobs: {} - skipping this instance...".format(instance['log_prefix'], e))
+		all_jobs = []
+	job_names = set(job['name'] for job in all_jobs)
+	instance['owned_jobs'] = [job_name for job_name in instance['owned_jobs'] if job_name in job_names]
+	print("{}Found {} owned jobs".format(instance['log_prefix'], len(instance['owned_jobs'])))
+
+
+def fetch_owned_jobs(instance, fetch_options, engine='sync'):
+	''' takes in dict of a jenkins instance with its config, server, resilience and owned_jobs, dict of fetch options and engine
+		returns dict with owned job names as keys and get_jenkins_job_info results as values
+	'''
+	config = instance['config']
+	server = instance['server']
+	resilience = instance['resilience']
+	cache = get_build_cache(config)
+	job_kwargs = {
+		'filter_param_name': config.get('filter_param_name', None),
+		'filter_param_value': config.get('filter_param_value', None),
+		'cause_action_class': config.get('cause_action_class', None),
+		'cache': cache,
+		'history_page_size': config.get('history_page_size', DEFAULT_HISTORY_PAGE_SIZE),
+		'history_max_depth': config.get('history_max_depth', None)
+	}
+	job_kwargs.update(fetch_options)
+	if engine == 'async':
+		from jeeves import aio
+		jenkins_api_infos = aio.fetch_all(config, instance['owned_jobs'], resilience=resilience, **job_kwargs)[0]
+	else:
+		jenkins_api_infos = get_jenkins_jobs_info(
+			server,
+			instance['owned_jobs'],
+			max_workers=config.get('max_workers', DEFAULT_MAX_WORKERS),
+			max_workers_per_host=config.get('max_workers_per_host', None),
+			**job_kwargs
+		)
+	if cache is not None:
+		print(instance['log_prefix'] + cache.stats())
+	print(instance['log_prefix'] + resilience.stats())
+	pool_stats = get_pool_stats(server)
+	if pool_stats is not None:
+		print(instance['log_prefix'] + pool_stats)
+	return jenkins_api_infos
+
+
+def run_remind(config, blockers, server, header, engine='sync', no_email=False):
+
+	# the async engine depends on the optional aiohttp package
+	if engine == 'async':
+		from jeeves import aio
+
+	# get list of all owners and owned jobs in blocker file
 	owner_list = []
+	owned_jobs = []
 	for job in blockers:
 		owners = blockers[job].get('owners', False)
 		if not owners:
 			continue
 		owner_list.extend(owners)
+		owned_jobs.append(job)
 
 	# exit if no owners are found for any jobs in blockers file
 	if owner_list == []:
@@ -25,104 +93,154 @@ def run_remind(config, blockers, server, header):
 		return None
 
 	# fetch optional config options, return None if not present
-	fpn = config.get('filter_param_name', None)
-	fpv = config.get('filter_param_value', None)
-	cac = config.get('cause_action_class', None)
 	filter_version = config.get('filter_version')
 
-	# find each job with no blockers including the owner and send email with agg'd list
+	# owned jobs are fetched from every configured jenkins instance in parallel - see jenkins_instances config field
+	# retry failed jenkins requests of each instance, backing off if it is overloaded
+	instances = []
+	for instance_config, instance_server in get_instance_servers(config, server):
+		resilience = get_jenkins_resilience(instance_config)
+		install_jenkins_resilience(instance_server, resilience)
+		instrument_jenkins_server(instance_server)
+
+		# caches are kept for the lifetime of the process, but their stats are reported per run
+		cache = get_build_cache(instance_config)
+		if cache is not None:
+			cache.reset_stats()
+		name = instance_config.get('name', None)
+		instances.append({
+			'name': name,
+			'config': instance_config,
+			'server': instance_server,
+			'resilience': resilience,
+			'log_prefix': '[{}] '.format(name) if name is not None else '',
+			'owned_jobs': owned_jobs
+		})
+
+	get_blocker_cache(config).reset_stats()
+
+	# with several jenkins instances, each owned job is only fetched from the instances it is listed by
+	if len(instances) > 1:
+		run_profile.start_phase('list jobs')
+		run_parallel([partial(list_owned_jobs, instance, engine) for instance in instances])
+
+	# get job info from jenkins API once for every owned job - values will be False if an unmanageable error occured
+	fetch_options = get_fetch_options(config, get_template_fields(config, 'remind_template.html'))
+	run_profile.start_phase('fetch jobs')
+	jenkins_api_infos = {}
+	for instance, instance_api_infos in zip(instances, run_parallel([partial(fetch_owned_jobs, instance, fetch_options, engine) for instance in instances])):
+		for job_name, jenkins_api_info in instance_api_infos.items():
+			jenkins_api_infos[(instance['name'], job_name)] = jenkins_api_info
+
+	# only care about jobs jeeves collected good jenkins API info for and without SUCCESS status
+	# jobs are keyed by name of their jenkins instance, which is None with a single instance, and job name
+	failing_jobs = {
+		key: jenkins_api_info for key, jenkins_api_info in jenkins_api_infos.items()
+		if jenkins_api_info and jenkins_api_info['lcb_result'] != "SUCCESS"
+	}
+
+	# get all bugs and tickets of failing jobs in one pass
+	run_profile.start_phase('fetch blockers')
+	failing_blockers = {job_name: blockers[job_name] for name, job_name in failing_jobs}
+	if engine == 'async':
+		all_bugs_dict, all_tickets_dict = aio.fetch_all(config, bug_ids=get_bugs_set(failing_blockers), ticket_ids=get_tickets_set(failing_blockers))[1:]
+	else:
+		all_bugs_dict = get_bugs_dict(get_bugs_set(failing_blockers), config)
+		all_tickets_dict = get_tickets_dict(get_tickets_set(failing_blockers), config)
+	print(get_blocker_cache(config).stats())
+
+	# build row for each failing job once, shared by all of its owners
+	run_profile.start_phase('build rows')
+	job_rows = {}
+	instance_configs = {instance['name']: instance['config'] for instance in instances}
+	osp_versions = get_osp_versions(set(job_name for name, job_name in failing_jobs), filter_version)
+	for (name, job_name), jenkins_api_info in failing_jobs.items():
+		osp_version = osp_versions[job_name]
+
+		# get all related bugs to job
+		try:
+			bug_ids = blockers[job_name]['bz']
+			if 0 in bug_ids:
+				bug_ids.remove(0)
+			bugs = list(map(all_bugs_dict.get, bug_ids))
+		except Exception as e:
+			print("Error fetching bugs for job {}: {}".format(job_name, e))
+			bugs = []
+
+		# get all related tickets to job
+		try:
+			ticket_ids = blockers[job_name]['jira']
+			if 0 in ticket_ids:
+				ticket_ids.remove(0)
+			tickets = list(map(all_tickets_dict.get, ticket_ids))
+		except Exception as e:
+			print("Error fetching ticket for job {}: {}".format(job_name, e))
+			tickets = []
+
+		# get any "other" artifact for job
+		try:
+			other = get_other_blockers(blockers, job_name)
+		except Exception as e:
+			print("Error fetching other blockers for job {}: {}".format(job_name, e))
+			other = []
+
+		# check if row contains any valid blockers for reporting
+		blocker_bool = True
+		if (len(bugs) == 0) and (len(tickets) == 0) and (len(other) == 0):
+			blocker_bool = False
+
+		# check if row contains build number information if blocker is added
+		builds = None
+		if blocker_bool and job_name in blockers and 'builds' in blockers[job_name]:
+			builds = blockers[job_name]['builds']
+
+		stage_urls = []
+		if jenkins_api_info['stage_failure'] != 'N/A':
+			stage_urls = generate_failure_stage_log_urls(
+				instance_configs[name],
+				jenkins_api_info['stage_failure'],
+				jenkins_api_info['job_url'],
+				jenkins_api_info['lcb_num']
+			)
+
+		# build row
+		job_rows[(name, job_name)] = {
+			'osp_version': osp_version,
+			'jenkins_instance': name,
+			'job_name': job_name,
+			'build_days_ago': jenkins_api_info['build_days_ago'],
+			'job_url': jenkins_api_info['job_url'],
+			'lcb_num': jenkins_api_info['lcb_num'],
+			'lcb_url': jenkins_api_info['lcb_url'],
+			'compose': jenkins_api_info['compose'],
+			'second_compose': jenkins_api_info['second_compose'],
+			'lcb_result': jenkins_api_info['lcb_result'],
+			'blocker_bool': blocker_bool,
+			'bugs': bugs,
+			'tickets': tickets,
+			'other': other,
+			'builds': builds,
+			'tempest_tests_failed': jenkins_api_info['tempest_tests_failed'],
+			'tempest_tests_url': jenkins_api_info['job_url'] + str(jenkins_api_info['lcb_num']) + '/testReport',
+			'stage_name': jenkins_api_info['stage_failure'],
+			'stage_urls': stage_urls,
+			'failure_streak': jenkins_api_info.get('failure_streak'),
+			'last_success_num': jenkins_api_info.get('last_success_num'),
+			'last_success_url': jenkins_api_info.get('last_success_url'),
+			'last_success_days_ago': jenkins_api_info.get('last_success_days_ago')
+		}
+
+	# find each job with no blockers including the owner and build email with agg'd list
+	run_profile.start_phase('render')
 	owner_set = set(owner_list)
+	reminders = []
+	template = get_template(config, 'remind_template.html')
+	reset_render_stats()
 	for owner in owner_set:
-		rows = []
-		for job_name in blockers:
-			owners = blockers[job_name].get('owners', [])
-			osp_version = get_osp_version(job_name, filter_version)
-
-			# skip if current owner is not owner of this job
-			if owner not in owners:
-				continue
-
-			# get job info from jenkins API - will return False if an unmanageable error occured
-			jenkins_api_info = get_jenkins_job_info(server, job_name, filter_param_name=fpn, filter_param_value=fpv, cause_action_class=cac)
-
-			# if jeeves was unable to collect any good jenkins API info, skip job
-			if jenkins_api_info:
-
-				# only care about jobs without SUCCESS status
-				if jenkins_api_info['lcb_result'] != "SUCCESS":
-
-					# get all related bugs to job
-					try:
-						bug_ids = blockers[job_name]['bz']
-						if 0 in bug_ids:
-							bug_ids.remove(0)
-						bugs_dict = get_bugs_dict(bug_ids, config)
-						bugs = list(map(bugs_dict.get, bug_ids))
-					except Exception as e:
-						print("Error fetching bugs for job {}: {}".format(job_name, e))
-						bugs = []
-
-					# get all related tickets to job
-					try:
-						ticket_ids = blockers[job_name]['jira']
-						if 0 in ticket_ids:
-							ticket_ids.remove(0)
-						tickets_dict = get_tickets_dict(ticket_ids, config)
-						tickets = list(map(tickets_dict.get, ticket_ids))
-					except Exception as e:
-						print("Error fetching ticket for job {}: {}".format(job_name, e))
-						tickets = []
-
-					# get any "other" artifact for job
-					try:
-						other = get_other_blockers(blockers, job_name)
-					except Exception as e:
-						print("Error fetching other blockers for job {}: {}".format(job_name, e))
-						other = []
-
-					# check if row contains any valid blockers for reporting
-					blocker_bool = True
-					if (len(bugs) == 0) and (len(tickets) == 0) and (len(other) == 0):
-						blocker_bool = False
-
-					# check if row contains build number information if blocker is added
-					builds = None
-					if blocker_bool and job_name in blockers and 'builds' in blockers[job_name]:
-						builds = blockers[job_name]['builds']
-
-					stage_urls = []
-					if jenkins_api_info['stage_failure'] != 'N/A':
-						stage_urls = generate_failure_stage_log_urls(
-							config,
-							jenkins_api_info['stage_failure'],
-							jenkins_api_info['job_url'],
-							jenkins_api_info['lcb_num']
-						)
-
-					# build row
-					row = {
-						'osp_version': osp_version,
-						'job_name': job_name,
-						'build_days_ago': jenkins_api_info['build_days_ago'],
-						'job_url': jenkins_api_info['job_url'],
-						'lcb_num': jenkins_api_info['lcb_num'],
-						'lcb_url': jenkins_api_info['lcb_url'],
-						'compose': jenkins_api_info['compose'],
-						'second_compose': jenkins_api_info['second_compose'],
-						'lcb_result': jenkins_api_info['lcb_result'],
-						'blocker_bool': blocker_bool,
-						'bugs': bugs,
-						'tickets': tickets,
-						'other': other,
-						'builds': builds,
-						'tempest_tests_failed': jenkins_api_info['tempest_tests_failed'],
-						'tempest_tests_url': jenkins_api_info['job_url'] + str(jenkins_api_info['lcb_num']) + '/testReport',
-						'stage_name': jenkins_api_info['stage_failure'],
-						'stage_urls': stage_urls
-					}
-
-					# append row to rows
-					rows.append(row)
+		rows = [
+			job_rows[(instance['name'], job_name)] for instance in instances for job_name in owned_jobs
+			if (instance['name'], job_name) in job_rows and owner in blockers[job_name]['owners']
+		]
 
 		# if no rows were generated, owner has all passing jobs
 		if rows != []:
@@ -130,47 +248,50 @@ def run_remind(config, blockers, server, header):
 			# sort rows by descending OSP version
 			rows = sorted(rows, key=lambda row: row['osp_version'], reverse=True)
 
-			# initialize jinja2 vars
-			loader = jinja2.FileSystemLoader('./templates')
-			env = jinja2.Environment(loader=loader)
-			template = env.get_template('remind_template.html')
-
 			# generate HTML report
-			htmlcode = template.render(
+			htmlcode = render_template(
+				template,
 				header=header,
 				owner=owner,
 				rows=rows
 			)
 
-			# construct email
-			msg = MIMEMultipart()
-			msg['From'] = config['email_from']
-			msg['Subject'] = "Jeeves Reminder for {}".format(owner)
-			msg['To'] = owner
-			msg.attach(MIMEText(htmlcode, 'html'))
-
-			# create SMTP session - if jeeves is unable to do so an HTML file will be generated
-			try:
-				with SMTP(config['smtp_host']) as smtp:
-
-					# start TLS for security
-					smtp.starttls()
-
-					# use ehlo or helo if needed
-					smtp.ehlo_or_helo_if_needed()
+			# construct email, unless reminders are not sent
+			msg = None
+			if not no_email:
+				msg = MIMEMultipart()
+				msg['From'] = config['email_from']
+				msg['Subject'] = "Jeeves Reminder for {}".format(owner)
+				msg['To'] = owner
+				msg.attach(MIMEText(htmlcode, 'html'))
+			reminders.append((owner, htmlcode, msg))
 
-					# send email to all addresses
-					response = smtp.sendmail(msg['From'], msg['To'], msg.as_string())
+		else:
+			print("Owner {} has all passing jobs!".format(owner))
 
-					# log success if all recipients recieved reminder, otherwise raise exception
-					if response == {}:
-						print("Reminder for {} successfully accepted by mail server for delivery".format(owner))
-					else:
-						raise Exception("Mail server cannot deliver reminder to following recipients: {}".format(response))
+	print(get_render_stats())
 
-			except Exception as e:
-				print("Error sending email reminder: {}\nHTML file generated".format(e))
-				generate_html_file(htmlcode, remind=True, owner=owner)
+	# send all reminders over shared SMTP sessions - if jeeves is unable to deliver a reminder an HTML file will be generated
+	# if "no email" flag has been passed, reminders are only rendered, e.g. to be served by serve mode
+	run_profile.start_phase('send email')
+	results = send_emails(config, [(msg, [owner]) for owner, htmlcode, msg in reminders]) if not no_email else []
+	num_delivered = 0
+	for (owner, htmlcode, msg), result in zip(reminders, results):
 
+		# log success if recipient recieved reminder, otherwise generate HTML file
+		if is_delivered(result):
+			num_delivered += 1
+			print("Reminder for {} successfully accepted by mail server for delivery".format(owner))
 		else:
-			print("Owner {} has all passing jobs!".format(owner))
+			error = result['error'] or "Mail server cannot deliver reminder to following recipients: {}".format(result['refused'])
+			print("Error sending email reminder: {}\nHTML file generated".format(error))
+			generate_html_file(htmlcode, remind=True, owner=owner)
+
+	# return stats for export as metrics, along with the reminders themselves
+	return {
+		'reminders': {owner: htmlcode for owner, htmlcode, msg in reminders},
+		'num_owners': len(owner_set),
+		'num_failing_jobs': len(failing_jobs),
+		'num_reminders': len(reminders),
+		'num_delivered': num_delivered
+	}
@@ -0,0 +1,203 @@
+# library functions for rendering HTML templates
+
+import os
+import time
+import jinja2
+import threading
+
+from functools import lru_cache
+from jinja2 import meta, nodes
+
+from jeeves.jobs import DEFAULT_STREAK_WINDOW, STAGE_FIELDS, STREAK_FIELDS
+
+TEMPLATES_DIR = './templates'
+DEFAULT_FRAGMENT_CACHE_SIZE = 4096
+
+# names under which templates and their macros refer to report and reminder rows
+ROW_NAMES = ('row', 'rows')
+
+# attributes and filters exposing every field of a dict, whichever fields a template names
+DICT_ATTRIBUTES = ('items', 'keys', 'values')
+DICT_FILTERS = ('dictsort', 'pprint', 'tojson')
+
+# jinja2 environments, keyed by bytecode cache directory
+environments = {}
+environments_lock = threading.Lock()
+
+# timing of renders since the last call to reset_render_stats
+render_stats = {'renders': 0, 'seconds': 0.0}
+
+
+def get_environment(config):
+	''' takes in config dict
+		returns jinja2 environment shared by every render in the process, so each template is compiled once
+		if template_cache_dir is configured compiled templates are also cached on disk for later runs
+	'''
+	cache_dir = config.get('template_cache_dir', None)
+	with environments_lock:
+		if cache_dir not in environments:
+			bytecode_cache = None
+			if cache_dir:
+				os.makedirs(cache_dir, exist_ok=True)
+				bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+			env = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATES_DIR), bytecode_cache=bytecode_cache)
+			env.globals['cached_blockers'] = lambda row: render_blockers(env, get_blockers_key(row))
+			environments[cache_dir] = env
+		return environments[cache_dir]
+
+
+def get_template(config, template_file):
+	''' takes in config dict and name of template file in templates directory
+		returns compiled template
+	'''
+	return get_environment(config).get_template(template_file)
+
+
+def get_template_fields(config, template_file):
+	''' takes in config dict and name of template file in templates directory
+		returns set of attribute and item names the template, or any template it imports, includes or extends, may access
+		string constants count as item names, as they can be used to access items through subscripts or filters
+		returns None if the fields cannot be determined because the template accesses the fields of a row with a
+		variable subscript or iterates over them - rows are named by ROW_NAMES or loop variables over rows
+	'''
+	env = get_environment(config)
+	fields = set()
+	pending = [template_file]
+	seen = set()
+	try:
+		while pending:
+			name = pending.pop()
+			if name in seen:
+				continue
+			seen.add(name)
+			ast = env.parse(env.loader.get_source(env, name)[0])
+			row_names = set(ROW_NAMES)
+			for node in ast.find_all(nodes.For):
+				if is_row_node(node.iter, row_names):
+					targets = [node.target] if isinstance(node.target, nodes.Name) else node.target.find_all(nodes.Name)
+					row_names.update(target.name for target in targets)
+			for node in ast.find_all((nodes.Getattr, nodes.Getitem, nodes.Filter, nodes.Const)):
+				if isinstance(node, nodes.Getattr):
+					if node.attr in DICT_ATTRIBUTES and is_row_node(node.node, row_names):
+						return None
+					fields.add(node.attr)
+				elif isinstance(node, nodes.Getitem):
+					if not isinstance(node.arg, nodes.Const) and is_row_node(node.node, row_names):
+						return None
+				elif isinstance(node, nodes.Filter):
+					if node.name in DICT_FILTERS and is_row_node(node.node, row_names):
+						return None
+				elif isinstance(node.value, str):
+					fields.add(node.value)
+			for referenced_template in meta.find_referenced_templates(ast):
+				if referenced_template is None:
+					return None
+				pending.append(referenced_template)
+	except Exception as e:
+		print("Error analyzing template file {}: {} - fetching all fields".format(template_file, e))
+		return None
+	return fields
+
+
+def is_row_node(node, row_names):
+	''' takes in jinja2 expression node and set of names referring to rows
+		returns True if the expression is a row or list of rows, possibly passed through filters
+	'''
+	while isinstance(node, nodes.Filter) and node.node is not None:
+		node = node.node
+	return isinstance(node, nodes.Name) and node.name in row_names
+
+
+def uses_fields(template_fields, fields):
+	''' takes in set of template fields as returned by get_template_fields and collection of field names
+		returns True if the template may access any of the fields
+	'''
+	return template_fields is None or any(field in template_fields for field in fields)
+
+
+def get_fetch_options(config, template_fields):
+	''' takes in config dict and set of template fields as returned by get_template_fields
+		returns dict of keyword arguments of get_jenkins_job_info_requests fetching only the optional job data the template may show
+	'''
+	return {
+		'fetch_stages': uses_fields(template_fields, STAGE_FIELDS),
+		'fetch_streaks': uses_fields(template_fields, STREAK_FIELDS),
+		'streak_window': config.get('streak_window', DEFAULT_STREAK_WINDOW)
+	}
+
+
+def get_blockers_key(row):
+	''' takes in row dict
+		returns hashable tuple of all row fields used by the blockers macro
+	'''
+	return (
+		row['job_url'],
+		tuple(row['builds']) if row['builds'] is not None else None,
+		tuple((bug['bug_name'], bug['bug_url']) for bug in row['bugs']),
+		tuple((ticket['ticket_name'], ticket['ticket_url']) for ticket in row['tickets']),
+		tuple((other['other_name'], other['other_url']) for other in row['other'])
+	)
+
+
+@lru_cache(maxsize=DEFAULT_FRAGMENT_CACHE_SIZE)
+def render_blockers(env, blockers_key):
+	''' takes in jinja2 environment and tuple returned by get_blockers_key
+		returns blockers macro from macros.html rendered for the given fields
+		results are cached, so rows with identical blockers are only rendered once
+	'''
+	job_url, builds, bugs, tickets, other = blockers_key
+	row = {
+		'job_url': job_url,
+		'builds': list(builds) if builds is not None else None,
+		'bugs': [{'bug_name': name, 'bug_url': url} for name, url in bugs],
+		'tickets': [{'ticket_name': name, 'ticket_url': url} for name, url in tickets],
+		'other': [{'other_name': name, 'other_url': url} for name, url in other]
+	}
+	return env.get_template('macros.html').module.blockers(row)
+
+
+def render_template(template, **context):
+	''' takes in compiled template and its context
+		returns rendered HTML code, adding the time taken to render_stats
+	'''
+	start = time.perf_counter()
+	htmlcode = template.render(**context)
+	render_stats['renders'] += 1
+	render_stats['seconds'] += time.perf_counter() - start
+	return htmlcode
+
+
+def generate_template(template, **context):
+	''' takes in compiled template and its context
+		yields rendered HTML code in chunks as it is produced, so a report which is only archived is written to its file
+		without being held in memory as one string
+		adds the time taken to render_stats once all chunks have been consumed
+	'''
+	seconds = 0.0
+	start = time.perf_counter()
+	for chunk in template.generate(**context):
+		seconds += time.perf_counter() - start
+		yield chunk
+		start = time.perf_counter()
+	render_stats['renders'] += 1
+	render_stats['seconds'] += seconds
+
+
+def reset_render_stats():
+	''' resets render timing and clears cached blocker fragments
+	'''
+	render_stats['renders'] = 0
+	render_stats['seconds'] = 0.0
+	render_blockers.cache_clear()
+
+
+def get_render_stats():
+	''' returns string summarizing renders since the last call to reset_render_stats
+	'''
+	fragments = render_blockers.cache_info()
+	return "Rendered {} templates in {:.2f}s ({} cached blocker fragments reused, {} rendered)".format(
+		render_stats['renders'],
+		render_stats['seconds'],
+		fragments.hits,
+		fragments.misses
+	)
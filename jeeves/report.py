@@ -1,26 +1,195 @@
 import sys
 import json
-import jinja2
+
+from functools import partial
 
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from smtplib import SMTP
 from urllib.parse import quote
 
-from jeeves.common import generate_html_file, generate_summary, percent
-from jeeves.jobs import get_jenkins_job_info, get_jenkins_jobs, get_osp_version, generate_failure_stage_log_urls
-from jeeves.blockers import get_bugs_dict, get_bugs_set, get_tickets_dict, get_tickets_set, get_other_blockers, has_blockers
-
-
-def run_report(config, blockers, preamble_file, template_file, no_email, test_email, server, header):
+from jeeves.cache import get_build_cache
+from jeeves.connection import get_instance_servers, get_pool_stats
+from jeeves.common import generate_html_file, generate_summary, percent, run_parallel
+from jeeves.history import DEFAULT_HISTORY_DAYS, get_history_store
+from jeeves.instrumentation import instrument_jenkins_server, run_profile
+from jeeves.mail import send_emails
+from jeeves.render import generate_template, get_fetch_options, get_render_stats, get_template, get_template_fields, render_template, reset_render_stats
+from jeeves.resilience import get_jenkins_resilience, install_jenkins_resilience
+from jeeves.state import get_last_completed_build, get_saved_job_info, load_state, save_state, set_saved_job_info
+from jeeves.jobs import DEFAULT_BULK_PAGE_SIZE, DEFAULT_HISTORY_PAGE_SIZE, DEFAULT_MAX_WORKERS, JOBS_SUMMARY_TREE_QUERY, JOBS_TREE_QUERY, get_jenkins_jobs_info, get_jenkins_jobs, get_jenkins_jobs_tree, get_osp_versions, generate_failure_stage_log_urls
+from jeeves.blockers import get_blocker_cache, get_bugs_dict, get_bugs_set, get_tickets_dict, get_tickets_set, get_other_blockers, has_blockers
+
+
+def list_instance_jobs(instance, fetch_options, engine='sync'):
+	''' takes in dict of a jenkins instance with its config, server and resilience, dict of fetch options and engine
+		fetch options are keyword arguments of get_jenkins_job_info_requests telling which extra data to fetch
+		lists relevant jobs of the instance and their OSP versions, reusing saved job info in incremental mode
+		adds jobs, job_versions, state, last_completed_builds and jenkins_api_infos to the instance dict
+	'''
+	config = instance['config']
+	server = instance['server']
 
 	# get supported versions from config or use default one
 	supported_versions = list(map(str, config.get('supported_versions', ['13', '16.1', '16.2'])))
-	# fetch all relevant jobs
-	jobs = get_jenkins_jobs(server, config['job_search_fields'], supported_versions)
+
+	# in incremental mode jobs are listed with just the number of their last completed build
+	# and only jobs that completed a build since the state file was saved are fetched in full
+	state_file = config.get('state_file', None)
+	incremental = bool(state_file) and config.get('incremental', False)
+	page_size = config.get('bulk_page_size', DEFAULT_BULK_PAGE_SIZE)
+	bulk = config.get('bulk_fetch', False) and not incremental
+
+	# fetch all relevant jobs with a single job listing - in bulk mode this includes the last completed build of each job
+	# if the listing fails, log and treat the instance as having no jobs, so other instances are still reported
+	query = JOBS_TREE_QUERY if bulk else JOBS_SUMMARY_TREE_QUERY
+	try:
+		if engine == 'async':
+			from jeeves import aio
+			all_jobs = aio.get_jenkins_jobs_tree_async(config, page_size, query, instance['resilience'])
+		else:
+			all_jobs = get_jenkins_jobs_tree(server, page_size, query)
+	except Exception as e:
+		print("{}Error listing Jenkins jobs: {} - skipping this instance...".format(instance['log_prefix'], e))
+		all_jobs = []
+	jobs = get_jenkins_jobs(server, config['job_search_fields'], supported_versions, all_jobs=all_jobs)
+
+	# get osp version of every job, skipping any where no OSP version could be found
+	job_versions = []
+	osp_versions = get_osp_versions([job['name'] for job in jobs], config.get('filter_version'))
+	for job in jobs:
+		job_name = job['name']
+		osp_version = osp_versions[job_name]
+		if osp_version is None:
+			print('{}No OSP version could be found in job {}. Skipping...'.format(instance['log_prefix'], job_name))
+			continue
+		job_versions.append((job_name, osp_version))
+
+	# reuse saved job info of jobs that have not completed a build since the last run
+	filters = {
+		'filter_param_name': config.get('filter_param_name', None),
+		'filter_param_value': config.get('filter_param_value', None),
+		'cause_action_class': config.get('cause_action_class', None)
+	}
+	filters.update(fetch_options)
+	state = load_state(state_file, filters) if state_file else None
+	last_completed_builds = {job['name']: get_last_completed_build(job) for job in jobs}
+	jenkins_api_infos = {}
+	if incremental:
+		for job_name, osp_version in job_versions:
+			jenkins_api_info = get_saved_job_info(state, job_name, last_completed_builds[job_name])
+			if jenkins_api_info is not None:
+				jenkins_api_infos[job_name] = jenkins_api_info
+		print("{}Incremental mode: reusing {} unchanged jobs, fetching {}".format(instance['log_prefix'], len(jenkins_api_infos), len(job_versions) - len(jenkins_api_infos)))
+
+	instance.update({
+		'jobs': jobs,
+		'job_versions': job_versions,
+		'state': state,
+		'last_completed_builds': last_completed_builds,
+		'jenkins_api_infos': jenkins_api_infos
+	})
+
+
+def fetch_instance_jobs(instance, fetch_options, engine='sync'):
+	''' takes in dict of a jenkins instance as updated by list_instance_jobs, dict of fetch options and engine
+		gets job info from jenkins API for all jobs of the instance not reused from the state file concurrently
+		values will be False if an unmanageable error occured
+		adds fetched job infos to jenkins_api_infos and jobs that could not be fetched to dropped_jobs of the instance dict
+	'''
+	config = instance['config']
+	server = instance['server']
+	resilience = instance['resilience']
+	cache = get_build_cache(config)
+	jenkins_api_infos = instance['jenkins_api_infos']
+
+	job_names = [job_name for job_name, osp_version in instance['job_versions'] if job_name not in jenkins_api_infos]
+	job_kwargs = {
+		'job_infos': {job['name']: job for job in instance['jobs']},
+		'filter_param_name': config.get('filter_param_name', None),
+		'filter_param_value': config.get('filter_param_value', None),
+		'cause_action_class': config.get('cause_action_class', None),
+		'cache': cache,
+		'history_page_size': config.get('history_page_size', DEFAULT_HISTORY_PAGE_SIZE),
+		'history_max_depth': config.get('history_max_depth', None)
+	}
+	job_kwargs.update(fetch_options)
+	if engine == 'async':
+		from jeeves import aio
+		fetched_api_infos = aio.fetch_all(config, job_names, resilience=resilience, **job_kwargs)[0]
+	else:
+		fetched_api_infos = get_jenkins_jobs_info(
+			server,
+			job_names,
+			max_workers=config.get('max_workers', DEFAULT_MAX_WORKERS),
+			max_workers_per_host=config.get('max_workers_per_host', None),
+			**job_kwargs
+		)
+	jenkins_api_infos.update(fetched_api_infos)
+	if cache is not None:
+		print(instance['log_prefix'] + cache.stats())
+
+	# log jobs that could not be fetched despite retries, they are counted in the summary
+	print(instance['log_prefix'] + resilience.stats())
+	pool_stats = get_pool_stats(server)
+	if pool_stats is not None:
+		print(instance['log_prefix'] + pool_stats)
+	dropped_jobs = [job_name for job_name in job_names if not fetched_api_infos[job_name]]
+	if len(dropped_jobs) > 0:
+		print("{}Dropped {} jobs after Jenkins API errors: {}".format(instance['log_prefix'], len(dropped_jobs), ', '.join(dropped_jobs)))
+	instance['dropped_jobs'] = dropped_jobs
+
+	# save job info for the next incremental run
+	state = instance['state']
+	if state is not None:
+		state_file = config['state_file']
+		state['jobs'] = {}
+		for job_name, osp_version in instance['job_versions']:
+			set_saved_job_info(state, job_name, instance['last_completed_builds'][job_name], jenkins_api_infos[job_name])
+		try:
+			save_state(state_file, state)
+		except Exception as e:
+			print("Error saving state file {}: {}".format(state_file, e))
+
+
+def run_report(config, blockers, preamble_file, template_file, no_email, test_email, server, header, engine='sync', archive=True):
+
+	# the async engine depends on the optional aiohttp package
+	if engine == 'async':
+		from jeeves import aio
+
+	# jobs are collected from every configured jenkins instance in parallel - see jenkins_instances config field
+	# retry failed jenkins requests of each instance, backing off if it is overloaded
+	instances = []
+	for instance_config, instance_server in get_instance_servers(config, server):
+		resilience = get_jenkins_resilience(instance_config)
+		install_jenkins_resilience(instance_server, resilience)
+		instrument_jenkins_server(instance_server)
+
+		# caches are kept for the lifetime of the process, but their stats are reported per run
+		cache = get_build_cache(instance_config)
+		if cache is not None:
+			cache.reset_stats()
+		name = instance_config.get('name', None)
+		instances.append({
+			'name': name,
+			'config': instance_config,
+			'server': instance_server,
+			'resilience': resilience,
+			'log_prefix': '[{}] '.format(name) if name is not None else ''
+		})
+
+	get_blocker_cache(config).reset_stats()
+
+	# only fetch the stages of failed builds and the recent builds of jobs not passing if the template shows them
+	template_fields = get_template_fields(config, template_file)
+	fetch_options = get_fetch_options(config, template_fields)
+
+	# fetch all relevant jobs of every instance with a single job listing each
+	run_profile.start_phase('list jobs')
+	run_parallel([partial(list_instance_jobs, instance, fetch_options, engine) for instance in instances])
 
 	# log and exit if no jobs found - no reason to send empty report
-	num_jobs_fetched = len(jobs)
+	num_jobs_fetched = sum(len(instance['jobs']) for instance in instances)
 	if num_jobs_fetched == 0:
 		print("No jobs found with given search field. Exiting...")
 		return None
@@ -28,22 +197,29 @@ def run_report(config, blockers, preamble_file, template_file, no_email, test_em
 	# Get set from the list of all bugs in all jobs
 	all_bugs_set = get_bugs_set(blockers) if blockers else {}
 
-	# Create dictionary the set of all bugs with bug id as key and name and link as value
-	all_bugs_dict = get_bugs_dict(all_bugs_set, config)
-
 	# Get set from the list of all jira-tickets in all jobs
 	all_tickets_set = get_tickets_set(blockers) if blockers else {}
 
-	# Create dictionary from the set of all jira tickets with ticket id as key and name and link as value
-	all_tickets_dict = get_tickets_dict(all_tickets_set, config)
-
-	# fetch optional config options, return None if not present
-	fpn = config.get('filter_param_name', None)
-	fpv = config.get('filter_param_value', None)
-	cac = config.get('cause_action_class', None)
-	filter_version = config.get('filter_version')
+	# get job info from jenkins API for all jobs of every instance concurrently
+	# create dictionaries from the sets of all bugs and jira tickets with their ids as keys and name and link as values
+	fetch_jobs = [partial(fetch_instance_jobs, instance, fetch_options, engine) for instance in instances]
+	if engine == 'async':
+		run_profile.start_phase('fetch jobs and blockers')
+		all_bugs_dict, all_tickets_dict = run_parallel(
+			[lambda: aio.fetch_all(config, bug_ids=all_bugs_set, ticket_ids=all_tickets_set)[1:]] + fetch_jobs
+		)[0]
+	else:
+		run_profile.start_phase('fetch blockers')
+		all_bugs_dict = get_bugs_dict(all_bugs_set, config)
+		all_tickets_dict = get_tickets_dict(all_tickets_set, config)
+		run_profile.start_phase('fetch jobs')
+		run_parallel(fetch_jobs)
+	print(get_blocker_cache(config).stats())
+	dropped_jobs = [job_name for instance in instances for job_name in instance['dropped_jobs']]
+	num_retries = sum(instance['resilience'].num_retries for instance in instances)
 
 	# iterate through all relevant jobs and build report rows
+	run_profile.start_phase('build rows')
 	num_success = 0
 	num_unstable = 0
 	num_failure = 0
@@ -55,141 +231,139 @@ def run_report(config, blockers, preamble_file, template_file, no_email, test_em
 	all_bugs = []
 	all_tickets = []
 	stats_per_version = {}
-	for job in jobs:
+	for instance in instances:
+		for job_name, osp_version in instance['job_versions']:
+
+			# with several jenkins instances the summary has a section per version and instance
+			summary_version = osp_version if instance['name'] is None else '{} ({})'.format(osp_version, instance['name'])
+			if summary_version not in stats_per_version:
+				stats_per_version[summary_version] = {
+					'num_jobs': 0,
+					'num_success': 0,
+					'num_unstable': 0,
+					'num_failure': 0,
+					'num_missing': 0,
+					'num_aborted': 0,
+					'num_error': 0
+				}
 
-		# get name and osp version from job object
-		job_name = job['name']
-		osp_version = get_osp_version(job_name, filter_version)
+			jenkins_api_info = instance['jenkins_api_infos'][job_name]
 
-		# skip if no OSP version could be found
-		if osp_version is None:
-			print('No OSP version could be found in job {}. Skipping...'.format(job_name))
-			continue
+			# if jeeves was unable to collect any good jenkins api info, skip job
+			if jenkins_api_info:
+				stats_per_version[summary_version]['num_jobs'] += 1
 
-		if osp_version not in stats_per_version:
-			stats_per_version[osp_version] = {
-				'num_jobs': 0,
-				'num_success': 0,
-				'num_unstable': 0,
-				'num_failure': 0,
-				'num_missing': 0,
-				'num_aborted': 0,
-				'num_error': 0
-			}
+				# take action based on last completed build result
+				if jenkins_api_info['lcb_result'] == "SUCCESS":
+					num_success += 1
+					stats_per_version[summary_version]['num_success'] += 1
+					bugs = []
+					tickets = []
+					other = []
 
-		# get job info from jenkins API - will return False if an unmanageable error occured
-		jenkins_api_info = get_jenkins_job_info(server, job_name, filter_param_name=fpn, filter_param_value=fpv, cause_action_class=cac)
-
-		# if jeeves was unable to collect any good jenkins api info, skip job
-		if jenkins_api_info:
-			stats_per_version[osp_version]['num_jobs'] += 1
-
-			# take action based on last completed build result
-			if jenkins_api_info['lcb_result'] == "SUCCESS":
-				num_success += 1
-				stats_per_version[osp_version]['num_success'] += 1
-				bugs = []
-				tickets = []
-				other = []
-
-			elif jenkins_api_info['lcb_result'] in ["UNSTABLE", "FAILURE", "ABORTED", "NO_KNOWN_BUILDS"]:
-				if jenkins_api_info['lcb_result'] == "UNSTABLE":
-					num_unstable += 1
-					stats_per_version[osp_version]['num_unstable'] += 1
-				elif jenkins_api_info['lcb_result'] == "FAILURE":
-					num_failure += 1
-					stats_per_version[osp_version]['num_failure'] += 1
-				elif jenkins_api_info['lcb_result'] == "ABORTED":
-					num_aborted += 1
-					stats_per_version[osp_version]['num_aborted'] += 1
+				elif jenkins_api_info['lcb_result'] in ["UNSTABLE", "FAILURE", "ABORTED", "NO_KNOWN_BUILDS"]:
+					if jenkins_api_info['lcb_result'] == "UNSTABLE":
+						num_unstable += 1
+						stats_per_version[summary_version]['num_unstable'] += 1
+					elif jenkins_api_info['lcb_result'] == "FAILURE":
+						num_failure += 1
+						stats_per_version[summary_version]['num_failure'] += 1
+					elif jenkins_api_info['lcb_result'] == "ABORTED":
+						num_aborted += 1
+						stats_per_version[summary_version]['num_aborted'] += 1
+					else:
+						num_missing += 1
+						stats_per_version[summary_version]['num_missing'] += 1
+
+					# get all related bugs to job
+					try:
+						bug_ids = blockers[job_name]['bz']
+						if 0 in bug_ids:
+							bug_ids.remove(0)
+						all_bugs.extend(bug_ids)
+						bugs = list(map(all_bugs_dict.get, bug_ids))
+					except Exception as e:
+						print("Error fetching bugs for job {}: {}".format(job_name, e))
+						bugs = []
+
+					# get all related tickets to job
+					try:
+						ticket_ids = blockers[job_name]['jira']
+						if 0 in ticket_ids:
+							ticket_ids.remove(0)
+						all_tickets.extend(ticket_ids)
+						tickets = list(map(all_tickets_dict.get, ticket_ids))
+					except Exception as e:
+						print("Error fetching tickets for job {}: {}".format(job_name, e))
+						tickets = []
+
+					# get any "other" artifact for job
+					try:
+						other = get_other_blockers(blockers, job_name)
+					except Exception as e:
+						print("Error fetching other blockers for job {}: {}".format(job_name, e))
+						other = []
+
+					# check if job is covered by any of jira/bz/other
+					if has_blockers(blockers, job_name):
+						num_covered += 1
 				else:
-					num_missing += 1
-					stats_per_version[osp_version]['num_missing'] += 1
-
-				# get all related bugs to job
-				try:
-					bug_ids = blockers[job_name]['bz']
-					if 0 in bug_ids:
-						bug_ids.remove(0)
-					all_bugs.extend(bug_ids)
-					bugs = list(map(all_bugs_dict.get, bug_ids))
-				except Exception as e:
-					print("Error fetching bugs for job {}: {}".format(job_name, e))
+					print("job {} had lcb_result {}: reporting as error job".format(job_name, jenkins_api_info['lcb_result']))
+					jenkins_api_info['lcb_result'] = "ERROR"
+					num_error += 1
+					stats_per_version[summary_version]['num_error'] += 1
 					bugs = []
-
-				# get all related tickets to job
-				try:
-					ticket_ids = blockers[job_name]['jira']
-					if 0 in ticket_ids:
-						ticket_ids.remove(0)
-					all_tickets.extend(ticket_ids)
-					tickets = list(map(all_tickets_dict.get, ticket_ids))
-				except Exception as e:
-					print("Error fetching tickets for job {}: {}".format(job_name, e))
 					tickets = []
-
-				# get any "other" artifact for job
-				try:
-					other = get_other_blockers(blockers, job_name)
-				except Exception as e:
-					print("Error fetching other blockers for job {}: {}".format(job_name, e))
 					other = []
 
-				# check if job is covered by any of jira/bz/other
-				if has_blockers(blockers, job_name):
-					num_covered += 1
-			else:
-				print("job {} had lcb_result {}: reporting as error job".format(job_name, jenkins_api_info['lcb_result']))
-				jenkins_api_info['lcb_result'] = "ERROR"
-				num_error += 1
-				stats_per_version[osp_version]['num_error'] += 1
-				bugs = []
-				tickets = []
-				other = []
-
-			# check if row contains any valid blockers for reporting
-			blocker_bool = True
-			if (len(bugs) == 0) and (len(tickets) == 0) and (len(other) == 0):
-				blocker_bool = False
-
-			# check if row contains build number information if blocker is added
-			builds = None
-			if blocker_bool and job_name in blockers and 'builds' in blockers[job_name]:
-				builds = blockers[job_name]['builds']
-
-			stage_urls = []
-			if jenkins_api_info['stage_failure'] != 'N/A':
-				stage_urls = generate_failure_stage_log_urls(
-					config,
-					jenkins_api_info['stage_failure'],
-					jenkins_api_info['job_url'],
-					jenkins_api_info['lcb_num']
-				)
-
-			# build row
-			row = {
-				'osp_version': osp_version,
-				'job_name': job_name,
-				'build_days_ago': jenkins_api_info['build_days_ago'],
-				'job_url': jenkins_api_info['job_url'],
-				'lcb_num': jenkins_api_info['lcb_num'],
-				'lcb_url': jenkins_api_info['lcb_url'],
-				'compose': jenkins_api_info['compose'],
-				'second_compose': jenkins_api_info['second_compose'],
-				'lcb_result': jenkins_api_info['lcb_result'],
-				'blocker_bool': blocker_bool,
-				'bugs': bugs,
-				'tickets': tickets,
-				'other': other,
-				'builds': builds,
-				'tempest_tests_failed': jenkins_api_info['tempest_tests_failed'],
-				'tempest_tests_url': jenkins_api_info['job_url'] + str(jenkins_api_info['lcb_num']) + '/testReport',
-				'stage_name': jenkins_api_info['stage_failure'],
-				'stage_urls': stage_urls
-			}
+				# check if row contains any valid blockers for reporting
+				blocker_bool = True
+				if (len(bugs) == 0) and (len(tickets) == 0) and (len(other) == 0):
+					blocker_bool = False
+
+				# check if row contains build number information if blocker is added
+				builds = None
+				if blocker_bool and job_name in blockers and 'builds' in blockers[job_name]:
+					builds = blockers[job_name]['builds']
+
+				stage_urls = []
+				if jenkins_api_info['stage_failure'] != 'N/A':
+					stage_urls = generate_failure_stage_log_urls(
+						instance['config'],
+						jenkins_api_info['stage_failure'],
+						jenkins_api_info['job_url'],
+						jenkins_api_info['lcb_num']
+					)
+
+				# build row
+				row = {
+					'osp_version': osp_version,
+					'jenkins_instance': instance['name'],
+					'job_name': job_name,
+					'build_days_ago': jenkins_api_info['build_days_ago'],
+					'job_url': jenkins_api_info['job_url'],
+					'lcb_num': jenkins_api_info['lcb_num'],
+					'lcb_url': jenkins_api_info['lcb_url'],
+					'compose': jenkins_api_info['compose'],
+					'second_compose': jenkins_api_info['second_compose'],
+					'lcb_result': jenkins_api_info['lcb_result'],
+					'blocker_bool': blocker_bool,
+					'bugs': bugs,
+					'tickets': tickets,
+					'other': other,
+					'builds': builds,
+					'tempest_tests_failed': jenkins_api_info['tempest_tests_failed'],
+					'tempest_tests_url': jenkins_api_info['job_url'] + str(jenkins_api_info['lcb_num']) + '/testReport',
+					'stage_name': jenkins_api_info['stage_failure'],
+					'stage_urls': stage_urls,
+					'failure_streak': jenkins_api_info.get('failure_streak'),
+					'last_success_num': jenkins_api_info.get('last_success_num'),
+					'last_success_url': jenkins_api_info.get('last_success_url'),
+					'last_success_days_ago': jenkins_api_info.get('last_success_days_ago')
+				}
 
-			# append row to rows
-			rows.append(row)
+				# append row to rows
+				rows.append(row)
 
 	# sort rows by descending OSP version
 	rows = sorted(rows, key=lambda row: row['osp_version'], reverse=True)
@@ -200,6 +374,19 @@ def run_report(config, blockers, preamble_file, template_file, no_email, test_em
 		print("No rows could be built with data for any of the jobs found with given search field. Exiting...")
 		return None
 
+	# record rows of archived reports in the history store and analyse results across runs - see history_file config field
+	history = None
+	history_store = get_history_store(config)
+	if history_store is not None:
+		run_profile.start_phase('history')
+		try:
+			if archive and not test_email:
+				history_store.record(rows)
+			history = history_store.analyse(rows, days=config.get('history_days', DEFAULT_HISTORY_DAYS))
+		except Exception as e:
+			print("Error updating history file {}: {}".format(history_store.path, e))
+		run_profile.start_phase('build rows')
+
 	# initialize job summary
 	summary = generate_summary(
 		num_success,
@@ -241,6 +428,12 @@ def run_report(config, blockers, preamble_file, template_file, no_email, test_em
 		unique_tickets = set(all_tickets)
 		summary['total_tickets'] = "Blocker Tickets: {} total, {} unique".format(len(all_tickets), len(unique_tickets))
 
+	# jenkins API error metrics
+	if len(dropped_jobs) > 0:
+		summary['total_dropped'] = "DROPPED: {} jobs could not be fetched from Jenkins ({} requests retried)".format(len(dropped_jobs), num_retries)
+	else:
+		summary['total_dropped'] = False
+
 	# blocker metrics
 	summary['total_coverage'] = "Total Blocker Coverage:  {}/{} = {}%".format(num_covered, num_jobs - num_success, percent(num_covered, num_jobs - num_success))
 
@@ -304,38 +497,54 @@ def run_report(config, blockers, preamble_file, template_file, no_email, test_em
 	summary['chart_url'] = f'https://quickchart.io/chart?c={encoded_config}'
 
 	# load a preamble for injection if specified
+	run_profile.start_phase('render')
 	preamble = None
 	if preamble_file:
 		with open(preamble_file, 'r') as file:
 			preamble = file.read()
 
-	# initialize jinja2 vars
-	loader = jinja2.FileSystemLoader('./templates')
-	env = jinja2.Environment(loader=loader)
+	# load compiled template
 	try:
-		template = env.get_template(template_file)
+		template = get_template(config, template_file)
 	except Exception as e:
 		print("Error loading template file: {}\n{}".format(template_file, e))
 		sys.exit(1)
 
 	# generate HTML report
-	htmlcode = template.render(
-		header=header,
-		preamble=preamble,
-		rows=rows,
-		summary=summary,
-		summary_per_version=summary_per_version
-	)
+	reset_render_stats()
+	context = {
+		'header': header,
+		'preamble': preamble,
+		'rows': rows,
+		'summary': summary,
+		'summary_per_version': summary_per_version,
+		'history': history
+	}
 
-	# save HTML report to file if not test run
-	if not test_email:
-		filename = generate_html_file(htmlcode)
+	# save HTML report to file if not test run - report is written as it is rendered
+	# if the report is not archived it is rendered in memory instead, e.g. to be served by serve mode or emailed
+	filename = None
+	report_html = None
+	if archive and not test_email:
+		filename = generate_html_file(generate_template(template, **context))
 		print('HTML file generated as {}'.format(filename))
+	elif not archive or not no_email:
+		report_html = render_template(template, **context)
 
 	# if "no email" flag has been passed, do not execute this block
 	if not no_email:
+		run_profile.start_phase('send email')
 		try:
 
+			# reuse the saved HTML file as email body if there is one
+			# SMTP needs the whole message, so emailing holds the report in memory several times over:
+			# as read or rendered, as encoded by MIMEText and as the message string sent by send_messages
+			if filename is not None:
+				with open(filename, 'r') as file:
+					htmlcode = file.read()
+			else:
+				htmlcode = report_html
+
 			# parse list of email addresses
 			if test_email:
 				recipients = config['email_to_test'].split(',')
@@ -348,24 +557,51 @@ def run_report(config, blockers, preamble_file, template_file, no_email, test_em
 			msg['Subject'] = config['email_subject']
 			msg['To'] = ", ".join(recipients)
 			msg.attach(MIMEText(htmlcode, 'html'))
+			del htmlcode
 
-			# create SMTP session
-			with SMTP(config['smtp_host']) as smtp:
-
-				# start TLS for security
-				smtp.starttls()
+			# send email to all addresses
+			result = send_emails(config, [(msg, recipients)])[0]
 
-				# use ehlo or helo if needed
-				smtp.ehlo_or_helo_if_needed()
-
-				# send email to all addresses
-				response = smtp.sendmail(msg['From'], recipients, msg.as_string())
-
-				# log success if all recipients recieved report, otherwise raise exception
-				if response == {}:
-					print("Report successfully accepted by mail server for delivery")
-				else:
-					raise Exception("Mail server cannot deliver report to following recipients: {}".format(response))
+			# log success if all recipients recieved report, otherwise raise exception
+			if result['error'] is not None:
+				raise result['error']
+			elif result['refused'] == {}:
+				print("Report successfully accepted by mail server for delivery")
+			else:
+				raise Exception("Mail server cannot deliver report to following recipients: {}".format(result['refused']))
 
 		except Exception as e:
 			print('Error sending email report: {}\nSee HTML file saved in "archive" folder'.format(e))
+
+	print(get_render_stats())
+
+	# return CI health stats for export as metrics, along with the report itself
+	return {
+		'report_file': filename,
+		'report_html': report_html,
+		'num_jobs': num_jobs,
+		'results': {
+			'success': num_success,
+			'unstable': num_unstable,
+			'failure': num_failure,
+			'aborted': num_aborted,
+			'missing': num_missing,
+			'error': num_error
+		},
+		'results_per_version': {
+			version: {
+				'success': stats['num_success'],
+				'unstable': stats['num_unstable'],
+				'failure': stats['num_failure'],
+				'aborted': stats['num_aborted'],
+				'missing': stats['num_missing'],
+				'error': stats['num_error']
+			}
+			for version, stats in stats_per_version.items()
+		},
+		'num_covered': num_covered,
+		'coverage': num_covered / (num_jobs - num_success) if num_jobs > num_success else 1.0,
+		'bugs': {'total': len(all_bugs), 'unique': len(set(all_bugs))},
+		'tickets': {'total': len(all_tickets), 'unique': len(set(all_tickets))},
+		'num_dropped': len(dropped_jobs)
+	}
@@ -0,0 +1,194 @@
+# library functions for retrying failed Jenkins requests and backing off an overloaded Jenkins server
+
+import time
+import random
+import datetime
+import threading
+import requests
+
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+
+DEFAULT_JENKINS_RETRIES = 3
+DEFAULT_JENKINS_RETRY_BACKOFF = 0.5
+DEFAULT_JENKINS_MAX_BACKOFF = 30
+DEFAULT_JENKINS_ERROR_BUDGET = 100
+DEFAULT_JENKINS_BREAKER_THRESHOLD = 10
+DEFAULT_JENKINS_BREAKER_COOLDOWN = 60
+
+# response statuses of overloaded or restarting Jenkins servers, worth retrying
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# only requests without side effects are retried
+RETRY_METHODS = ('GET', 'HEAD')
+
+
+class CircuitOpenError(Exception):
+	''' raised instead of making a request while the circuit breaker is open
+	'''
+
+
+class JenkinsResilience:
+	''' retry policy, error budget and circuit breaker shared by every Jenkins request made during a run
+		failed requests are retried up to retries times with jittered exponential backoff, so workers failing together
+		do not all retry at the same moment - a Retry-After header is honored as is, and the request given up if it asks
+		for a longer wait than max_backoff
+		no more than error_budget retries are made per run, so a broken server cannot stall a run indefinitely
+		after breaker_threshold consecutive failed requests the circuit breaker opens and requests fail immediately
+		for breaker_cooldown seconds, after which requests are let through again
+	'''
+
+	def __init__(
+		self,
+		retries=DEFAULT_JENKINS_RETRIES,
+		backoff=DEFAULT_JENKINS_RETRY_BACKOFF,
+		max_backoff=DEFAULT_JENKINS_MAX_BACKOFF,
+		error_budget=DEFAULT_JENKINS_ERROR_BUDGET,
+		breaker_threshold=DEFAULT_JENKINS_BREAKER_THRESHOLD,
+		breaker_cooldown=DEFAULT_JENKINS_BREAKER_COOLDOWN
+	):
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.error_budget = error_budget
+		self.breaker_threshold = breaker_threshold
+		self.breaker_cooldown = breaker_cooldown
+		self.lock = threading.Lock()
+		self.num_retries = 0
+		self.num_failures = 0
+		self.num_breaker_trips = 0
+		self.consecutive_failures = 0
+		self.open_until = 0.0
+
+	def check_circuit(self):
+		''' raises CircuitOpenError if the circuit breaker is open
+		'''
+		with self.lock:
+			if time.monotonic() < self.open_until:
+				raise CircuitOpenError("Jenkins circuit breaker is open after {} consecutive failed requests".format(self.breaker_threshold))
+
+	def get_retry_delay(self, attempt, retry_after=None):
+		''' takes in number of retries already made for a request and optional Retry-After header of its response
+			returns seconds to wait before retrying the request, or None if it should not be retried
+		'''
+		delay = get_retry_after_seconds(retry_after)
+		if delay is not None and delay > self.max_backoff:
+			return None
+		if delay is None:
+			# equal jitter - wait at least half of the exponential backoff, and a random part of the other half
+			delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+			delay = delay / 2 + random.uniform(0, delay / 2)
+
+		with self.lock:
+			if attempt >= self.retries or self.num_retries >= self.error_budget or time.monotonic() < self.open_until:
+				return None
+			self.num_retries += 1
+		return delay
+
+	def record_success(self):
+		with self.lock:
+			self.consecutive_failures = 0
+
+	def record_failure(self):
+		''' counts a request that failed after all retries, opening the circuit breaker after breaker_threshold in a row
+		'''
+		with self.lock:
+			self.num_failures += 1
+			self.consecutive_failures += 1
+			if self.consecutive_failures >= self.breaker_threshold:
+				self.consecutive_failures = 0
+				self.open_until = time.monotonic() + self.breaker_cooldown
+				self.num_breaker_trips += 1
+				print("Jenkins circuit breaker opened for {}s after {} consecutive failed requests".format(self.breaker_cooldown, self.breaker_threshold))
+
+	def stats(self):
+		''' returns string summarizing retries and failed requests
+		'''
+		return "Jenkins requests: {} retries, {} failed, circuit breaker opened {} times".format(
+			self.num_retries,
+			self.num_failures,
+			self.num_breaker_trips
+		)
+
+
+class RetryingAdapter(HTTPAdapter):
+	''' requests transport adapter retrying failed requests according to a JenkinsResilience
+	'''
+
+	def __init__(self, resilience, **kwargs):
+		self.resilience = resilience
+		super().__init__(**kwargs)
+
+	def send(self, request, **kwargs):
+		if request.method not in RETRY_METHODS:
+			return super().send(request, **kwargs)
+
+		attempt = 0
+		while True:
+			self.resilience.check_circuit()
+			try:
+				response = super().send(request, **kwargs)
+			except (requests.ConnectionError, requests.Timeout):
+				delay = self.resilience.get_retry_delay(attempt)
+				if delay is None:
+					self.resilience.record_failure()
+					raise
+			else:
+				if response.status_code not in RETRY_STATUSES:
+					self.resilience.record_success()
+					return response
+				delay = self.resilience.get_retry_delay(attempt, response.headers.get('Retry-After'))
+				if delay is None:
+					self.resilience.record_failure()
+					return response
+				response.close()
+			time.sleep(delay)
+			attempt += 1
+
+
+def get_retry_after_seconds(retry_after):
+	''' takes in value of a Retry-After header, either in seconds or an HTTP date
+		returns number of seconds to wait or None if the header is missing or invalid
+	'''
+	if not retry_after:
+		return None
+	try:
+		return max(0.0, float(retry_after))
+	except ValueError:
+		pass
+	try:
+		retry_at = parsedate_to_datetime(retry_after)
+		return max(0.0, (retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds())
+	except (TypeError, ValueError):
+		return None
+
+
+def get_jenkins_resilience(config):
+	''' takes in config dict
+		returns new JenkinsResilience for a run, configured by the optional jenkins_* retry and circuit breaker fields
+	'''
+	return JenkinsResilience(
+		retries=config.get('jenkins_retries', DEFAULT_JENKINS_RETRIES),
+		backoff=config.get('jenkins_retry_backoff', DEFAULT_JENKINS_RETRY_BACKOFF),
+		max_backoff=config.get('jenkins_max_backoff', DEFAULT_JENKINS_MAX_BACKOFF),
+		error_budget=config.get('jenkins_error_budget', DEFAULT_JENKINS_ERROR_BUDGET),
+		breaker_threshold=config.get('jenkins_breaker_threshold', DEFAULT_JENKINS_BREAKER_THRESHOLD),
+		breaker_cooldown=config.get('jenkins_breaker_cooldown', DEFAULT_JENKINS_BREAKER_COOLDOWN)
+	)
+
+
+def install_jenkins_resilience(server, resilience):
+	''' takes in jenkins server object and JenkinsResilience
+		routes every request of the server's HTTP session through a RetryingAdapter
+		a RetryingAdapter already mounted is reused, keeping its pool of open connections
+	'''
+	session = getattr(server, '_session', None)
+	if session is None:
+		return
+	adapter = session.get_adapter('https://')
+	if isinstance(adapter, RetryingAdapter) and session.get_adapter('http://') is adapter:
+		adapter.resilience = resilience
+		return
+	adapter = RetryingAdapter(resilience)
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
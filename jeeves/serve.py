@@ -0,0 +1,344 @@
+# library functions for running jeeves as a long-running service
+# keeping connections, caches and compiled templates warm between scheduled runs
+
+import os
+import sys
+import json
+import time
+import yaml
+import datetime
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse
+
+from jeeves.blockers import close_connections
+from jeeves.common import generate_header
+from jeeves.connection import get_job_search_fields
+from jeeves.instrumentation import record_run
+from jeeves.metrics import export_metrics, generate_metrics
+from jeeves.remind import run_remind
+from jeeves.report import run_report
+
+DEFAULT_SERVE_HOST = '127.0.0.1'
+DEFAULT_SERVE_PORT = 8080
+DEFAULT_REFRESH_SCHEDULE = '*/15 * * * *'
+DEFAULT_FULL_REFRESH_SCHEDULE = '0 0 * * *'
+
+# service job run once when the service starts, before any scheduled job
+STARTUP_JOB = 'startup'
+
+
+class CronSchedule:
+	''' cron-like schedule with minute, hour, day of month, month and day of week fields
+		fields take *, numbers, ranges, lists and steps, e.g. '*/15 8-18 * * 1-5'
+		as in cron, days of week are numbered from 0 (Sunday) to 7 (Sunday again), and if both day fields are
+		restricted a day matching either of them matches the schedule
+	'''
+
+	FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+	def __init__(self, expression):
+		fields = expression.split()
+		if len(fields) != 5:
+			raise ValueError("Invalid schedule '{}': expected 5 fields".format(expression))
+		self.expression = expression
+		self.minutes, self.hours, self.days, self.months, self.weekdays = [
+			parse_cron_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)
+		]
+		if 7 in self.weekdays:
+			self.weekdays.add(0)
+		self.any_day = fields[2] == '*'
+		self.any_weekday = fields[4] == '*'
+
+	def matches_day(self, moment):
+		day = moment.day in self.days
+		weekday = (moment.weekday() + 1) % 7 in self.weekdays
+		if self.any_day or self.any_weekday:
+			return day and weekday
+		return day or weekday
+
+	def matches(self, moment):
+		''' returns True if the schedule is due in the minute of the given datetime
+		'''
+		return moment.minute in self.minutes and moment.hour in self.hours and moment.month in self.months and self.matches_day(moment)
+
+	def get_next_run(self, after):
+		''' takes in datetime
+			returns start of the first minute after it in which the schedule is due, or None if there is none within a year
+		'''
+		moment = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+		end = moment + datetime.timedelta(days=366)
+		while moment < end:
+			if moment.month not in self.months or not self.matches_day(moment):
+				moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+			elif moment.hour not in self.hours:
+				moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+			elif moment.minute not in self.minutes:
+				moment += datetime.timedelta(minutes=1)
+			else:
+				return moment
+		return None
+
+
+def parse_cron_field(field, low, high):
+	''' takes in field of a cron-like schedule and the lowest and highest values it accepts
+		returns set of values matched by the field
+	'''
+	values = set()
+	for part in field.split(','):
+		value_range, _, step = part.partition('/')
+		if value_range == '*':
+			start, end = low, high
+		elif '-' in value_range:
+			start, end = map(int, value_range.split('-', 1))
+		else:
+			start = end = int(value_range)
+			if step:
+				end = high
+		if not low <= start <= end <= high:
+			raise ValueError("Invalid schedule field '{}': values must be between {} and {}".format(field, low, high))
+		values.update(range(start, end + 1, int(step) if step else 1))
+	return values
+
+
+class JeevesService:
+	''' long-running jeeves service refreshing the report and reminders on schedule
+		the latest report, reminders and metrics are kept in memory to be served over HTTP
+	'''
+
+	def __init__(self, config, blocker_file, server, engine='sync', preamble_file=False, template_file='report_template.html'):
+		self.config = config
+		self.blocker_file = blocker_file
+		self.server = server
+		self.engine = engine
+		self.preamble_file = preamble_file
+		self.template_file = template_file
+		self.run_lock = threading.Lock()
+		self.lock = threading.Lock()
+		self.blockers = {}
+		self.blockers_mtime = None
+		self.report_html = None
+		self.reminders = {}
+		self.runs = {}
+		self.status = {}
+		self.next_runs = {}
+
+	def load_blockers(self):
+		''' returns blockers loaded from blocker file, reloading it if it changed since the previous run
+			if the blocker file cannot be loaded, the previously loaded blockers are kept
+		'''
+		try:
+			mtime = os.path.getmtime(self.blocker_file)
+			if mtime != self.blockers_mtime:
+				with open(self.blocker_file, 'r') as file:
+					self.blockers = yaml.safe_load(file)
+				self.blockers_mtime = mtime
+		except Exception as e:
+			print("Error loading blocker configuration data, keeping previous blockers: ", e)
+		return self.blockers
+
+	def run(self, mode, send_email=False, full=False):
+		''' takes in run mode and whether to email the results
+			runs jeeves once in the given mode, optionally refetching every job even if incremental mode is configured
+			and revalidating every cached bug and ticket
+			any error is logged, so a failed run never stops the service
+		'''
+		config = dict(self.config, incremental=False, refresh_blockers=True) if full else self.config
+		fpn = config.get('filter_param_name', None)
+		fpv = config.get('filter_param_value', None)
+		started_at = time.time()
+		error = None
+		print("Starting {}{} run{}".format('full ' if full else '', mode, ' with email' if send_email else ''))
+		with self.run_lock:
+			blockers = self.load_blockers()
+			try:
+				with record_run(config, mode) as profile:
+					if mode == 'report':
+						header = generate_header(get_job_search_fields(config), filter_param_name=fpn, filter_param_value=fpv)
+						run_stats = run_report(
+							config, blockers, self.preamble_file, self.template_file, not send_email, False,
+							self.server, header, self.engine, archive=send_email
+						)
+					else:
+						header = generate_header(self.blocker_file, filter_param_name=fpn, filter_param_value=fpv, remind=True)
+						run_stats = run_remind(config, blockers, self.server, header, self.engine, no_email=not send_email)
+				run_profile = profile.to_dict()
+				export_metrics(config, mode, run_stats, run_profile)
+				self.publish(mode, run_stats, run_profile)
+			# a run ends the process with SystemExit on fatal errors such as an invalid template, which must not stop the service
+			except (Exception, SystemExit) as e:
+				print("Error during {} run: {}".format(mode, e))
+				error = str(e)
+
+		with self.lock:
+			self.status[mode] = {
+				'started_at': datetime.datetime.fromtimestamp(started_at).isoformat(),
+				'seconds': round(time.time() - started_at, 3),
+				'full': full,
+				'email': send_email,
+				'error': error
+			}
+
+	def publish(self, mode, run_stats, run_profile):
+		''' takes in run mode, stats returned by run_report or run_remind and run profile dict
+			makes the results of the run available to HTTP clients
+		'''
+		report_html = None
+		if mode == 'report' and run_stats is not None:
+			report_html = run_stats['report_html']
+			if report_html is None and run_stats['report_file'] is not None:
+				with open(run_stats['report_file'], 'r') as file:
+					report_html = file.read()
+		with self.lock:
+			self.runs[mode] = (run_stats, run_profile)
+			if mode == 'report':
+				self.report_html = report_html
+			else:
+				self.reminders = run_stats['reminders'] if run_stats is not None else {}
+
+	def get_metrics(self):
+		''' returns metrics of the latest run of each mode in the OpenMetrics text format
+		'''
+		with self.lock:
+			return generate_metrics(dict(self.runs))
+
+	def get_status(self):
+		''' returns dict of the latest run of each mode, the next scheduled runs and the owners with reminders
+		'''
+		with self.lock:
+			return {
+				'runs': dict(self.status),
+				'next_runs': {name: next_run.isoformat() for name, next_run in self.next_runs.items()},
+				'owners': sorted(self.reminders)
+			}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+	''' serves the latest report at /, reminders at /remind/<owner>, metrics at /metrics and run status at /status
+	'''
+
+	def log_message(self, format, *args):
+		pass
+
+	def send(self, body, content_type='text/html; charset=utf-8', status=200):
+		body = body.encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(body)
+
+	def do_HEAD(self):
+		self.do_GET()
+
+	def do_GET(self):
+		service = self.server.service
+		path = urlparse(self.path).path.rstrip('/')
+
+		if path in ('', '/report'):
+			if service.report_html is None:
+				return self.send('No report generated yet', 'text/plain; charset=utf-8', status=503)
+			return self.send(service.report_html)
+
+		if path == '/remind':
+			links = ''.join('<li><a href="/remind/{0}">{0}</a></li>'.format(quote(owner)) for owner in sorted(service.reminders))
+			return self.send('<html><body><h1>Reminders</h1><ul>{}</ul></body></html>'.format(links))
+
+		if path.startswith('/remind/'):
+			reminder = service.reminders.get(unquote(path[len('/remind/'):]))
+			if reminder is None:
+				return self.send('No reminder for this owner', 'text/plain; charset=utf-8', status=404)
+			return self.send(reminder)
+
+		if path == '/metrics':
+			return self.send(service.get_metrics(), 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+
+		if path == '/status':
+			return self.send(json.dumps(service.get_status()), 'application/json')
+
+		self.send('Not found', 'text/plain; charset=utf-8', status=404)
+
+
+def get_schedules(config):
+	''' takes in config dict
+		returns dict of CronSchedules of the configured service jobs keyed by job name
+	'''
+	schedules = {
+		'refresh': CronSchedule(config.get('serve_refresh_schedule', DEFAULT_REFRESH_SCHEDULE)),
+		'full refresh': CronSchedule(config.get('serve_full_refresh_schedule', DEFAULT_FULL_REFRESH_SCHEDULE))
+	}
+	if config.get('report_schedule', None):
+		schedules['report'] = CronSchedule(config['report_schedule'])
+	if config.get('remind_schedule', None):
+		schedules['remind'] = CronSchedule(config['remind_schedule'])
+	return schedules
+
+
+def get_due_runs(jobs):
+	''' takes in names of service jobs due at the same time
+		returns list of (mode, send_email, full) runs covering all of them, running each mode at most once
+		refreshes only run the report, as a remind run fetches every owned job from Jenkins again - served reminders
+		are refreshed at startup and whenever reminders are due
+	'''
+	runs = []
+	full = 'full refresh' in jobs or STARTUP_JOB in jobs
+	if 'report' in jobs or 'refresh' in jobs or full:
+		runs.append(('report', 'report' in jobs, full))
+	if 'remind' in jobs or STARTUP_JOB in jobs:
+		runs.append(('remind', 'remind' in jobs, full))
+	return runs
+
+
+def start_http_server(service, host, port):
+	''' takes in JeevesService and address to listen on
+		returns HTTP server serving the service in a background thread
+	'''
+	httpd = ThreadingHTTPServer((host, port), ServiceHandler)
+	httpd.daemon_threads = True
+	httpd.service = service
+	threading.Thread(target=httpd.serve_forever, daemon=True).start()
+	return httpd
+
+
+def run_serve(config, blocker_file, server, engine='sync', preamble_file=False, template_file='report_template.html'):
+	''' takes in config dict, path of blocker file, jenkins server object and engine
+		runs jeeves as a service until interrupted: a full report and remind run is made at startup, after which report
+		refreshes, emailed reports and reminders run on their schedules while the latest results are served over HTTP
+	'''
+	try:
+		schedules = get_schedules(config)
+	except ValueError as e:
+		print("Error loading schedules: ", e)
+		sys.exit(1)
+	service = JeevesService(config, blocker_file, server, engine, preamble_file, template_file)
+	host = config.get('serve_host', DEFAULT_SERVE_HOST)
+	port = int(config.get('serve_port', DEFAULT_SERVE_PORT))
+	httpd = start_http_server(service, host, port)
+	print("Serving report, reminders and metrics on http://{}:{}/".format(host, port))
+
+	try:
+		for mode, send_email, full in get_due_runs([STARTUP_JOB]):
+			service.run(mode, send_email, full)
+
+		while True:
+			now = datetime.datetime.now()
+			next_runs = {name: schedule.get_next_run(now) for name, schedule in schedules.items()}
+			next_runs = {name: next_run for name, next_run in next_runs.items() if next_run is not None}
+			with service.lock:
+				service.next_runs = next_runs
+			if not next_runs:
+				print("No scheduled runs left. Exiting...")
+				break
+			next_run = min(next_runs.values())
+			jobs = [name for name, job_run in next_runs.items() if job_run == next_run]
+			print("Next run at {:%Y-%m-%d %H:%M}: {}".format(next_run, ', '.join(jobs)))
+			time.sleep(max(0.0, (next_run - datetime.datetime.now()).total_seconds()))
+			for mode, send_email, full in get_due_runs(jobs):
+				service.run(mode, send_email, full)
+	except KeyboardInterrupt:
+		print("Stopping service")
+	finally:
+		httpd.shutdown()
+		close_connections()
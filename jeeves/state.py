@@ -0,0 +1,79 @@
+# library functions for persisting report state between runs
+
+import os
+import copy
+import json
+
+from jeeves.jobs import get_build_days_ago
+
+
+def get_last_completed_build(job_info):
+	''' takes in job info dict as returned by any Jenkins job listing
+		returns number of the last completed build of the job or None if it has none
+	'''
+	return (job_info.get('lastCompletedBuild') or {}).get('number')
+
+
+def load_state(state_file, filters):
+	''' takes in path of state file and dict of build filters in effect
+		returns state saved by the previous run, or an empty state if there is none or it was saved with different filters
+	'''
+	state = {'filters': filters, 'jobs': {}}
+	if not os.path.exists(state_file):
+		return state
+
+	try:
+		with open(state_file, 'r') as file:
+			saved_state = json.load(file)
+	except Exception as e:
+		print("Error loading state file {}: {} - refetching all jobs".format(state_file, e))
+		return state
+
+	if saved_state.get('filters') != filters:
+		print("Build filters changed since state file {} was saved - refetching all jobs".format(state_file))
+		return state
+	state['jobs'] = saved_state.get('jobs', {})
+	return state
+
+
+def save_state(state_file, state):
+	''' takes in path of state file and state dict
+		writes state to a temporary file first, so an interrupted run never leaves a truncated state file behind
+	'''
+	state_dir = os.path.dirname(state_file)
+	if state_dir:
+		os.makedirs(state_dir, exist_ok=True)
+	tmp_file = state_file + '.tmp'
+	with open(tmp_file, 'w') as file:
+		json.dump(state, file)
+	os.replace(tmp_file, state_file)
+
+
+def get_saved_job_info(state, job_name, last_completed_build):
+	''' takes in state dict, job name and number of the job's current last completed build
+		returns copy of the saved jenkins API info with build_days_ago and last_success_days_ago brought up to date
+		returns None if the job was not saved or has completed a build since
+	'''
+	saved_job = state['jobs'].get(job_name)
+	if saved_job is None or saved_job['last_completed_build'] != last_completed_build:
+		return None
+
+	jenkins_api_info = copy.deepcopy(saved_job['jenkins_api_info'])
+	if jenkins_api_info.get('lcb_timestamp') is not None:
+		jenkins_api_info['build_days_ago'] = get_build_days_ago(jenkins_api_info['lcb_timestamp'])
+	if jenkins_api_info.get('last_success_timestamp') is not None:
+		jenkins_api_info['last_success_days_ago'] = get_build_days_ago(jenkins_api_info['last_success_timestamp'])
+	return jenkins_api_info
+
+
+def set_saved_job_info(state, job_name, last_completed_build, jenkins_api_info):
+	''' takes in state dict, job name, number of the job's last completed build and its jenkins API info
+		stores job info in state, jobs whose info could not be fetched are dropped so they are refetched next run
+	'''
+	if not jenkins_api_info:
+		state['jobs'].pop(job_name, None)
+		return
+	state['jobs'][job_name] = {
+		'last_completed_build': last_completed_build,
+		'jenkins_api_info': jenkins_api_info
+	}
@@ -1,8 +1,87 @@
 from jeeves.blockers import *
 
 
-def test_get_bugs_dict():
-	pass
+class MockResponse:
+	def __init__(self, bugs):
+		self.bugs = bugs
+
+	def raise_for_status(self):
+		pass
+
+	def json(self):
+		return {'bugs': self.bugs, 'faults': []}
+
+
+class MockSession:
+	''' stand-in for a Bugzilla REST API session failing any request for bug 666
+	'''
+	def __init__(self):
+		self.calls = []
+
+	def get(self, url, params=None, **kwargs):
+		self.calls.append(params['id'])
+		self.last_change_time = params.get('last_change_time')
+		ids = [int(bug_id) for bug_id in params['id'].split(',')]
+		if 666 in ids:
+			raise Exception('Service Unavailable')
+		return MockResponse([{'id': bug_id, 'status': 'NEW', 'summary': 'summary of {}'.format(bug_id)} for bug_id in ids])
+
+
+class UnchangedSession(MockSession):
+	''' stand-in for a Bugzilla REST API session of a Bugzilla where no bug changed since the cache was filled
+	'''
+	def get(self, url, params=None, **kwargs):
+		response = super().get(url, params, **kwargs)
+		return MockResponse([]) if params.get('last_change_time') else response
+
+
+def test_get_bugs_dict(monkeypatch):
+	mock_session = MockSession()
+	monkeypatch.setattr('jeeves.blockers.get_bugzilla_connection', lambda config: mock_session)
+	monkeypatch.setattr('jeeves.blockers.blocker_caches', {})
+	config = {'bz_url': 'https://bugzilla.example.com', 'bz_chunk_size': 2}
+
+	# bugs are fetched in chunks, a failing chunk only affects its own bugs
+	bugs = get_bugs_dict([0, 1, 2, 3, 666], config)
+	assert 0 not in bugs
+	assert bugs[1] == {'bug_name': '[NEW] summary of 1', 'bug_url': 'https://bugzilla.example.com/show_bug.cgi?id=1'}
+	assert bugs[2]['bug_name'] == '[NEW] summary of 2'
+	assert bugs[3]['bug_name'] == 'BZ#3'
+	assert bugs[666]['bug_name'] == 'BZ#666'
+	assert sorted(mock_session.calls) == ['1,2', '3,666']
+
+	# bugs fetched before are taken from the cache until it expires
+	mock_session.calls = []
+	assert get_bugs_dict([1, 2, 3], config)[3]['bug_name'] == '[NEW] summary of 3'
+	assert mock_session.calls == ['3']
+	mock_session.calls = []
+	get_bugs_dict([1], dict(config, bz_cache_ttl=0))
+	assert mock_session.calls == ['1']
+	assert mock_session.last_change_time is not None
+
+
+def test_get_bugs_dict_cache_file(monkeypatch, tmp_path):
+	mock_session = UnchangedSession()
+	monkeypatch.setattr('jeeves.blockers.get_bugzilla_connection', lambda config: mock_session)
+	monkeypatch.setattr('jeeves.blockers.blocker_caches', {})
+	config = {'bz_url': 'https://bugzilla.example.com', 'blocker_cache_file': str(tmp_path / 'blockers.sqlite')}
+	get_bugs_dict([1, 2], config)
+
+	# cached bugs are shared with later processes through the cache file
+	monkeypatch.setattr('jeeves.blockers.blocker_caches', {})
+	mock_session.calls = []
+	assert get_bugs_dict([1, 2], config)[1]['bug_name'] == '[NEW] summary of 1'
+	assert mock_session.calls == []
+
+	# refreshing only asks for bugs changed since they were cached, keeping unchanged ones
+	bugs = get_bugs_dict([1, 2], dict(config, refresh_blockers=True))
+	assert mock_session.calls == ['1,2']
+	assert bugs[2]['bug_name'] == '[NEW] summary of 2'
+
+	# stale bugs are shown as cached if Bugzilla cannot be reached, unless they are too old
+	monkeypatch.setattr('jeeves.blockers.get_bugzilla_connection', lambda config: MockSession())
+	assert get_bugs_dict([1, 666], dict(config, refresh_blockers=True))[1]['bug_name'] == '[NEW] summary of 1'
+	assert get_bugs_dict([1, 666], dict(config, bz_cache_ttl=0, blocker_cache_max_stale=0))[1]['bug_name'] == 'BZ#1'
 
 
 def test_get_bugs_set():
@@ -14,8 +93,58 @@ def test_get_bugs_set():
 	assert get_bugs_set(mockers) == {123456, 789123}
 
 
-def test_get_tickets_dict():
-	pass
+class MockIssue:
+	def __init__(self, key, status, summary):
+		self.key = key
+		self.fields = type('Fields', (), {'status': status, 'summary': summary})
+
+
+class MockJira:
+	''' stand-in for a JIRA connection which only finds tickets of the RHOSINFRA project via search
+	'''
+	def __init__(self):
+		self.calls = []
+
+	def search_issues(self, jql, **kwargs):
+		self.calls.append(('search_issues', jql))
+		keys = [key.strip('"') for key in jql.split('(')[1].rstrip(')').split(',')]
+		return [MockIssue(key, 'New', 'summary of ' + key) for key in keys if key.startswith('RHOSINFRA')]
+
+	def issue(self, key, **kwargs):
+		self.calls.append(('issue', key))
+		if key == 'MISSING-1':
+			raise Exception('Issue does not exist')
+		return MockIssue(key, 'Closed', 'summary of ' + key)
+
+	def close(self):
+		pass
+
+
+def test_get_tickets_dict(monkeypatch):
+	mock_jira = MockJira()
+	monkeypatch.setattr('jeeves.blockers.get_jira_connection', lambda config: mock_jira)
+	monkeypatch.setattr('jeeves.blockers.blocker_caches', {})
+	config = {'jira_url': 'https://jira.example.com', 'jira_chunk_size': 2}
+
+	tickets = get_tickets_dict({0, 'RHOSINFRA-1', 'RHOSINFRA-2', 'RHOSINFRA-3', 'OTHER-1', 'MISSING-1'}, config)
+	assert 0 not in tickets
+	assert tickets['RHOSINFRA-1'] == {'ticket_name': '[NEW] summary of RHOSINFRA-1', 'ticket_url': 'https://jira.example.com/browse/RHOSINFRA-1'}
+	assert tickets['OTHER-1']['ticket_name'] == '[CLOSED] summary of OTHER-1'
+	assert tickets['MISSING-1']['ticket_name'] == 'MISSING-1'
+	assert len([call for call in mock_jira.calls if call[0] == 'search_issues']) == 3
+	assert sorted(call[1] for call in mock_jira.calls if call[0] == 'issue') == ['MISSING-1', 'OTHER-1']
+
+	# cached tickets are not fetched again, stale tickets are shown as cached if Jira cannot be reached
+	mock_jira.calls = []
+	assert get_tickets_dict({'RHOSINFRA-1', 'OTHER-1'}, config)['OTHER-1']['ticket_name'] == '[CLOSED] summary of OTHER-1'
+	assert mock_jira.calls == []
+
+	def fail(config):
+		raise Exception('Service Unavailable')
+	monkeypatch.setattr('jeeves.blockers.get_jira_connection', fail)
+	tickets = get_tickets_dict({'RHOSINFRA-1', 'MISSING-1'}, dict(config, jira_cache_ttl=0))
+	assert tickets['RHOSINFRA-1']['ticket_name'] == '[NEW] summary of RHOSINFRA-1'
+	assert tickets['MISSING-1']['ticket_name'] == 'MISSING-1'
 
 
 def test_get_tickets_set():
@@ -0,0 +1,34 @@
+from jeeves.cache import *
+
+
+def test_build_cache(tmp_path):
+	cache = BuildCache(str(tmp_path))
+	assert cache.get('job1', 1, 'build_info') is None
+	cache.set('job1', 1, 'build_info', {'result': 'SUCCESS'})
+	assert cache.get('job1', 1, 'build_info') == {'result': 'SUCCESS'}
+	assert cache.get('job1', 1, 'build_stages') is None
+	assert (cache.hits, cache.misses) == (1, 2)
+	cache.reset_stats()
+	assert cache.stats() == 'Build cache: 0 hits, 0 misses'
+	cache.close()
+
+	# entries persist across instances
+	cache = BuildCache(str(tmp_path))
+	assert cache.get('job1', 1, 'build_info') == {'result': 'SUCCESS'}
+	cache.close()
+
+
+def test_build_cache_eviction(tmp_path):
+	cache = BuildCache(str(tmp_path), max_entries=2)
+	for number in range(4):
+		cache.set('job1', number, 'build_info', {'number': number})
+	cache.evict()
+	assert cache.get('job1', 0, 'build_info') is None
+	assert cache.get('job1', 3, 'build_info') == {'number': 3}
+	cache.close()
+
+
+def test_get_build_cache(tmp_path):
+	assert get_build_cache({}) is None
+	config = {'cache_dir': str(tmp_path)}
+	assert get_build_cache(config) is get_build_cache(config)
@@ -1,3 +1,5 @@
+import pytest
+
 from jeeves.common import *
 
 
@@ -5,8 +7,16 @@ def test_generate_header():
 	pass
 
 
-def test_generate_html_file():
-	pass
+def test_generate_html_file(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	filename = generate_html_file('<p>report</p>')
+	with open(filename) as file:
+		assert file.read() == '<p>report</p>'
+
+	filename = generate_html_file(iter(['<p>', 'reminder', '</p>']), remind=True, owner='foo@bar.com')
+	assert 'reminder_for_foo_' in filename
+	with open(filename) as file:
+		assert file.read() == '<p>reminder</p>'
 
 
 def test_percent_func():
@@ -16,4 +26,21 @@ def test_percent_func():
 
 
 def test_validate_config():
-	pass
+	config = {'jenkins_url': 'https://jenkins.example.com', 'job_search_fields': 'DFG', 'bz_url': 'bz', 'jira_url': 'jira', 'certificate': False}
+	validate_config(config, True, False)
+	with pytest.raises(Exception):
+		validate_config(dict(config, job_search_fields=None), True, False)
+
+	# jenkins fields may be set per jenkins instance instead
+	instances = [{'name': 'a', 'jenkins_url': 'https://a.example.com'}, {'name': 'b', 'jenkins_url': 'https://b.example.com'}]
+	validate_config(dict(config, jenkins_url=None, jenkins_instances=instances), True, False)
+	with pytest.raises(Exception):
+		validate_config(dict(config, job_search_fields=None, jenkins_instances=instances), True, False)
+	with pytest.raises(Exception):
+		validate_config(dict(config, jenkins_instances=[{'name': 'a'}, {'name': 'a'}]), True, False)
+
+
+def test_run_parallel():
+	assert run_parallel([]) == []
+	assert run_parallel([lambda: 1]) == [1]
+	assert run_parallel([lambda: 1, lambda: 2, lambda: 3]) == [1, 2, 3]
@@ -0,0 +1,57 @@
+from benchmarks.simulator import Dataset, start_servers, stop_servers
+from jeeves.connection import *
+from jeeves.resilience import JenkinsResilience, install_jenkins_resilience
+
+
+def test_get_pool_size():
+	assert get_pool_size({}) == DEFAULT_MAX_WORKERS
+	assert get_pool_size({'max_workers': 16}) == 16
+	assert get_pool_size({'max_workers': 16, 'max_workers_per_host': 4}) == 4
+
+
+def test_get_jenkins_server():
+	servers = start_servers(Dataset(num_jobs=3))
+	try:
+		server = get_jenkins_server({'jenkins_url': servers['jenkins'].base_url, 'max_workers': 4, 'jenkins_timeout': 5})
+		assert server.timeout == 5
+		adapter = server._session.get_adapter(servers['jenkins'].base_url)
+		assert adapter._pool_maxsize == 4
+
+		# installing resilience for a run keeps the pool of open connections
+		resilience = JenkinsResilience()
+		install_jenkins_resilience(server, resilience)
+		assert server._session.get_adapter(servers['jenkins'].base_url) is adapter
+		assert adapter.resilience is resilience
+
+		for i in range(3):
+			server.get_job_info(servers['jenkins'].dataset.job_names[i])
+		assert get_pool_stats(server).startswith("Jenkins connections: 1 opened for ")
+	finally:
+		stop_servers(servers)
+
+
+def test_get_jenkins_instances():
+	config = {'jenkins_url': 'https://jenkins.example.com', 'job_search_fields': 'DFG', 'max_workers': 8}
+	assert get_jenkins_instances(config) == [config]
+
+	config = dict(config, state_file='cache/state.json', cache_dir='cache', jenkins_instances=[
+		{'name': 'a', 'job_search_fields': 'DFG-a'},
+		{'jenkins_url': 'https://other.example.com', 'max_workers': 2, 'cache_dir': 'other'}
+	])
+	first, second = get_jenkins_instances(config)
+	assert 'jenkins_instances' not in first
+	assert first['name'] == 'a'
+	assert first['jenkins_url'] == 'https://jenkins.example.com'
+	assert first['job_search_fields'] == 'DFG-a'
+	assert first['state_file'] == 'cache/state.a.json'
+	assert first['cache_dir'] == 'cache/a'
+	assert second['name'] == 'other.example.com'
+	assert second['job_search_fields'] == 'DFG'
+	assert second['max_workers'] == 2
+	assert second['cache_dir'] == 'other'
+	assert get_job_search_fields(config) == 'a: DFG-a; other.example.com: DFG'
+
+	# servers of instances are kept for the lifetime of the process
+	servers = get_instance_servers(config, None)
+	assert [instance_config['name'] for instance_config, server in servers] == ['a', 'other.example.com']
+	assert servers[0][1] is get_instance_servers(config, None)[0][1]
@@ -0,0 +1,59 @@
+from jeeves.history import *
+
+DAY = 86400
+NOW = 1700000000.0
+
+
+def generate_row(job_name, lcb_num, lcb_result, osp_version='16.2', jenkins_instance=None):
+	return {
+		'jenkins_instance': jenkins_instance,
+		'job_name': job_name,
+		'osp_version': osp_version,
+		'lcb_num': lcb_num,
+		'lcb_result': lcb_result,
+		'compose': 'N/A',
+		'stage_name': 'N/A',
+		'tempest_tests_failed': None
+	}
+
+
+def test_history_store(tmp_path):
+	store = HistoryStore(str(tmp_path / 'history' / 'history.sqlite'))
+
+	# nightly runs of the last 6 days, one job failing since build 3, one flipping every build
+	results = {
+		'job-streak': ['SUCCESS', 'SUCCESS', 'FAILURE', 'FAILURE', 'UNSTABLE', 'FAILURE'],
+		'job-flaky': ['SUCCESS', 'FAILURE', 'SUCCESS', 'FAILURE', 'SUCCESS', 'FAILURE'],
+		'job-passing': ['SUCCESS'] * 6
+	}
+	for i in range(6):
+		run_at = NOW - (5 - i) * DAY
+		rows = [generate_row(job_name, i + 1, job_results[i]) for job_name, job_results in results.items()]
+		rows.append(generate_row('job-missing', None, 'NO_KNOWN_BUILDS', osp_version='13'))
+		store.record(rows, run_at=run_at)
+
+		# a second run on the same day with no new builds does not change the trend
+		store.record(rows, run_at=run_at + 60)
+
+	history = store.analyse(rows, days=30, trend_days=2.5, now=NOW)
+	assert len(history['dates']) == 3
+	assert history['trends'][0] == {'osp_version': '16.2', 'pass_rates': [33.3, 66.7, 33.3]}
+	assert history['trends'][1] == {'osp_version': '13', 'pass_rates': [0.0, 0.0, 0.0]}
+	assert history['streaks'] == [{'jenkins_instance': None, 'job_name': 'job-streak', 'num_builds': 4, 'since_build': 3}]
+	assert history['flaky'] == [{'jenkins_instance': None, 'job_name': 'job-flaky', 'num_builds': 6, 'num_flips': 5}]
+
+	# only builds of the analysed window count
+	history = store.analyse(rows, days=1.5, now=NOW)
+	assert history['streaks'] == []
+	assert history['flaky'] == []
+
+	# only reported jobs are listed
+	history = store.analyse(rows[2:], days=30, now=NOW)
+	assert history['streaks'] == []
+	assert history['flaky'] == []
+
+
+def test_get_history_store(tmp_path):
+	assert get_history_store({}) is None
+	config = {'history_file': str(tmp_path / 'history.sqlite')}
+	assert get_history_store(config) is get_history_store(config)
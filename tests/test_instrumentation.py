@@ -0,0 +1,52 @@
+import json
+import time
+
+from jeeves.instrumentation import *
+
+
+def test_get_endpoint():
+	assert get_endpoint('https://jenkins.example.com/job/DFG-compute-16.2/42/api/json?depth=0') == '/job/*/N/api/json'
+	assert get_endpoint('https://jenkins.example.com/api/json?tree=jobs[name]{0,500}') == '/api/json?tree'
+	assert get_endpoint('https://jira.example.com/rest/api/2/issue/OSP-123') == '/rest/api/N/issue/*'
+
+
+def test_get_cumulative_buckets():
+	buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+	for seconds in [0.001, 0.02, 0.02, 60]:
+		buckets[get_bucket(seconds)] += 1
+	cumulative = get_cumulative_buckets(buckets)
+	assert cumulative['0.01'] == 1
+	assert cumulative['0.025'] == 3
+	assert cumulative['10.0'] == 3
+	assert cumulative['+Inf'] == 4
+
+
+def test_record_run(tmp_path):
+	profile_file = str(tmp_path / 'profile' / 'profile.json')
+	with record_run({'profile_file': profile_file}, 'report', profile_functions=True) as profile:
+		profile.start_phase('fetch jobs')
+		profile.record_request('jenkins', '/job/*/api/json', 0.02, 100)
+		profile.record_request('jenkins', '/job/*/api/json', 0.2, 50, error=True)
+		profile.record_job('job1', 0.2)
+		profile.start_phase('render')
+		time.sleep(0.01)
+
+	with open(profile_file) as file:
+		saved_profile = json.load(file)
+	assert saved_profile['mode'] == 'report'
+	assert list(saved_profile['phases']) == ['fetch jobs', 'render']
+	assert saved_profile['phases']['render'] >= 0.01
+	assert saved_profile['services']['jenkins']['requests'] == 2
+	assert saved_profile['services']['jenkins']['errors'] == 1
+	assert saved_profile['services']['jenkins']['bytes'] == 150
+	assert saved_profile['services']['jenkins']['endpoints']['/job/*/api/json']['latency_buckets']['0.025'] == 1
+	assert saved_profile['slowest_jobs'] == [{'job_name': 'job1', 'seconds': 0.2}]
+	assert len(saved_profile['functions']) > 0
+
+
+def test_get_profile_filenames():
+	assert get_profile_filenames({}, 'report') == []
+	assert get_profile_filenames({}, 'report', profile_functions=True) == ['profile.json']
+	filenames = get_profile_filenames({'profile_file': 'cache/profile.json', 'archive_profile': True}, 'remind')
+	assert filenames[0] == 'cache/profile.json'
+	assert filenames[1].startswith('./archive/profile_remind_')
@@ -1,12 +1,213 @@
 from jeeves.jobs import *
 
 
+class MockServer:
+	''' minimal stand-in for a jenkins.Jenkins server object
+	'''
+	server = 'https://jenkins.example.com/'
+
+	def __init__(self, jobs, builds=None):
+		self.jobs = jobs
+		self.builds = builds or []
+		self.calls = []
+
+	def get_info(self, item='', query=None):
+		self.calls.append(('get_info', item, query))
+		if item:
+			# like Jenkins, builds only lists the newest 100 builds while allBuilds lists every build
+			field = query.split('=', 1)[1].split('[', 1)[0]
+			builds = self.builds if field == 'allBuilds' else self.builds[:100]
+			start, end = map(int, query.rsplit('{', 1)[1].rstrip('}').split(','))
+			return {field: builds[start:end]}
+		return {'jobs': self.jobs}
+
+	def get_job_info(self, job_name):
+		self.calls.append(('get_job_info', job_name))
+		return [job for job in self.jobs if job['name'] == job_name][0]
+
+	def get_build_info(self, job_name, number):
+		self.calls.append(('get_build_info', job_name, number))
+		return [job for job in self.jobs if job['name'] == job_name][0]['lastCompletedBuild']
+
+	def get_build_stages(self, job_name, number):
+		self.calls.append(('get_build_stages', job_name, number))
+		return {'stages': [{'name': 'Overcloud', 'status': 'FAILED'}]}
+
+
+def mock_job(name, result='SUCCESS'):
+	return {
+		'name': name,
+		'url': 'https://jenkins.example.com/job/{}/'.format(name),
+		'builds': [{'number': 2}, {'number': 1}],
+		'lastCompletedBuild': {
+			'number': 2,
+			'result': result,
+			'timestamp': 0,
+			'url': 'https://jenkins.example.com/job/{}/2/'.format(name),
+			'previousBuild': {'number': 1},
+			'actions': [
+				{'_class': 'hudson.model.ParametersAction', 'parameters': [{'name': 'PUBLISH', 'value': True}]},
+				{'_class': 'hudson.model.CauseAction', 'causes': [{'_class': 'hudson.triggers.TimerTrigger$TimerTriggerCause'}]},
+				{'_class': 'hudson.tasks.junit.TestResultAction', 'failCount': 3},
+				{'html': 'core_puddle: RHOS-16.2-RHEL-8-20220101.n.1<br>'}
+			]
+		}
+	}
+
+
 def test_get_jenkins_job_info():
-	pass
+	server = MockServer([mock_job('job1'), mock_job('job2', 'FAILURE')])
+
+	info = get_jenkins_job_info(server, 'job1', job_info=server.jobs[0])
+	assert info['lcb_num'] == 2
+	assert info['lcb_result'] == 'SUCCESS'
+	assert info['compose'] == 'RHOS-16.2-RHEL-8-20220101.n.1'
+	assert info['tempest_tests_failed'] == 3
+	assert server.calls == []
+
+	info = get_jenkins_job_info(server, 'job2')
+	assert info['stage_failure'] == 'Overcloud'
+	assert [call[0] for call in server.calls] == ['get_job_info', 'get_build_stages']
+
+
+def test_get_build_info_cache(tmp_path):
+	from jeeves.cache import BuildCache
+	cache = BuildCache(str(tmp_path))
+	server = MockServer([mock_job('job1')])
+	assert get_build_info(server, 'job1', 2, cache)['result'] == 'SUCCESS'
+	assert get_build_info(server, 'job1', 2, cache)['result'] == 'SUCCESS'
+	assert len(server.calls) == 1
+	cache.close()
+
+
+def test_get_filtered_build():
+	builds = [{'number': number, 'result': 'SUCCESS', 'actions': []} for number in range(10, 0, -1)]
+	builds[0]['building'] = True
+	builds[7]['actions'] = [{'_class': 'hudson.model.CauseAction', 'causes': [{'_class': 'hudson.triggers.TimerTrigger$TimerTriggerCause'}]}]
+	server = MockServer([], builds)
+
+	assert get_filtered_build(server, 'job1', 10, cause_action_class='timer', page_size=3)['number'] == 3
+	assert len(server.calls) == 3
+
+	try:
+		get_filtered_build(server, 'job1', 10, cause_action_class='timer', page_size=3, max_depth=5)
+		assert False
+	except Exception as e:
+		assert str(e) == 'No filter match'
+
+	try:
+		get_filtered_build(server, 'job1', 3, cause_action_class='timer', page_size=3)
+		assert False
+	except Exception as e:
+		assert str(e) == 'No filter match'
+
+	# builds older than the newest 100, which Jenkins leaves out of builds, are searched too
+	builds = [{'number': number, 'result': 'SUCCESS', 'actions': []} for number in range(150, 0, -1)]
+	builds[130]['actions'] = [{'_class': 'hudson.model.CauseAction', 'causes': [{'_class': 'hudson.triggers.TimerTrigger$TimerTriggerCause'}]}]
+	assert get_filtered_build(MockServer([], builds), 'job1', 150, cause_action_class='timer')['number'] == 20
+
+
+def test_get_failure_streak():
+	results = ['FAILURE', 'FAILURE', 'UNSTABLE', 'ABORTED', 'SUCCESS', 'FAILURE', 'SUCCESS']
+	builds = [{'number': 8, 'result': None, 'building': True}]
+	builds += [{'number': 7 - i, 'result': result, 'timestamp': 0, 'url': 'url/{}'.format(7 - i)} for i, result in enumerate(results)]
+	server = MockServer([], builds)
+
+	# one windowed request gives the streak and the last passing build
+	failure_streak, last_success = run_requests(server, get_failure_streak_requests('job1', 7, window=10))
+	assert failure_streak == 4
+	assert last_success['number'] == 3
+	assert len(server.calls) == 1
+	assert server.calls[0][2] == '?tree=allBuilds[number,result,building,timestamp,url]{0,10}'
+
+	# builds newer than the reported build are ignored
+	assert run_requests(server, get_failure_streak_requests('job1', 5, window=10))[0] == 2
+
+	# streaks longer than the window have no last passing build
+	assert run_requests(server, get_failure_streak_requests('job1', 7, window=3)) == (2, None)
+
+	# windows longer than the newest 100 builds see every build of the window
+	long_builds = [{'number': number, 'result': 'FAILURE', 'timestamp': 0, 'url': 'url'} for number in range(150, 0, -1)]
+	long_builds[140]['result'] = 'SUCCESS'
+	failure_streak, last_success = run_requests(MockServer([], long_builds), get_failure_streak_requests('job1', 150, window=200))
+	assert (failure_streak, last_success['number']) == (140, 10)
+
+	# jobs not passing fetch their streak only if asked to
+	server = MockServer([mock_job('job1', 'FAILURE')], builds)
+	info = get_jenkins_job_info(server, 'job1', job_info=server.jobs[0], fetch_stages=False)
+	assert info['failure_streak'] is None
+	assert server.calls == []
+	info = get_jenkins_job_info(server, 'job1', job_info=server.jobs[0], fetch_stages=False, fetch_streaks=True)
+	assert info['failure_streak'] == 1
+	assert info['last_success_num'] == 1
+	assert info['last_success_days_ago'] > 0
+
+
+def test_get_job_item():
+	assert get_job_item('job1') == 'job/job1'
+	assert get_job_item('folder/job1') == 'job/folder/job/job1'
+
+
+def test_get_build_actions_info():
+	actions = mock_job('job1')['lastCompletedBuild']['actions']
+	assert get_build_actions_info(actions) == ([{'name': 'PUBLISH', 'value': True}], 'hudson.triggers.TimerTrigger$TimerTriggerCause', 3)
+	assert get_build_actions_info([]) == ([], '', None)
+
+
+def test_build_matches_filter():
+	parameters = [{'name': 'PUBLISH', 'value': True}]
+	assert build_matches_filter(parameters, '', filter_param_name='PUBLISH', filter_param_value='true')
+	assert not build_matches_filter(parameters, '', filter_param_name='PUBLISH', filter_param_value='false')
+	assert not build_matches_filter([], '', filter_param_name='PUBLISH', filter_param_value='true')
+	assert build_matches_filter([], 'hudson.model.Cause$UserIdCause', cause_action_class='user')
+	assert not build_matches_filter([], 'hudson.model.Cause$UserIdCause', cause_action_class='timer')
+
+
+def test_get_composes():
+	assert get_composes([]) == ('Could not find compose', None)
+	assert get_composes([{'html': 'core_puddle: A<br>'}]) == ('A', None)
+	assert get_composes([{'html': 'core_puddle: A<br>'}, {'html': 'core_puddle: B<br>'}]) == ('A', 'B')
 
 
 def test_get_jenkins_jobs():
-	pass
+	server = MockServer([mock_job('DFG-ceph-16.2'), mock_job('DFG-ceph-17'), mock_job('DFG-compute-13')])
+	jobs = get_jenkins_jobs(server, 'DFG-ceph', ['13', '16.2'], bulk=True)
+	assert [job['name'] for job in jobs] == ['DFG-ceph-16.2']
+	assert len(server.calls) == 1
+
+	# overlapping and invalid fields are matched against a single job listing
+	server.calls = []
+	jobs = get_jenkins_jobs(server, 'DFG, ceph-16,[invalid', ['13', '16.2'])
+	assert [job['name'] for job in jobs] == ['DFG-ceph-16.2', 'DFG-compute-13']
+	assert server.calls == [('get_info', '', JOBS_SUMMARY_TREE_QUERY.format(start=0, end=DEFAULT_BULK_PAGE_SIZE))]
+
+
+def test_get_job_name_matcher():
+	assert get_job_name_matcher(['^DFG-ceph', 'rgw$'])('DFG-ceph-16')
+	assert get_job_name_matcher(['^DFG-ceph', 'rgw$'])('DFG-storage-rgw')
+	assert not get_job_name_matcher(['^DFG-ceph', 'rgw$'])('DFG-compute')
+	assert get_job_name_matcher(['(?P<dfg>ceph)', '(?P<dfg>rgw)'])('DFG-storage-rgw')
+	assert not get_job_name_matcher(['['])('DFG-ceph')
+
+
+def test_get_jenkins_job_info_listed_job():
+	listed_job = {'name': 'job1', 'url': 'https://jenkins.example.com/job/job1/', 'lastCompletedBuild': {'number': 2}}
+	server = MockServer([mock_job('job1')])
+	assert get_jenkins_job_info(server, 'job1', job_info=listed_job)['lcb_result'] == 'SUCCESS'
+	assert server.calls == [('get_job_info', 'job1')]
+
+
+def test_get_host_semaphore():
+	semaphore = get_host_semaphore('https://jenkins.example.com/', 2)
+	assert get_host_semaphore('https://jenkins.example.com/job/foo', 2) is semaphore
+	assert get_host_semaphore('https://other.example.com/', 2) is not semaphore
+
+	# a different limit for the same host is applied rather than ignored
+	other_semaphore = get_host_semaphore('https://jenkins.example.com/', 3)
+	assert other_semaphore is not semaphore
+	assert all(other_semaphore.acquire(blocking=False) for i in range(3))
+	for i in range(3):
+		other_semaphore.release()
 
 
 def test_get_osp_version():
@@ -37,3 +238,27 @@ def test_get_osp_version():
 	assert get_osp_version('DFG-enterprise-baremetal-13.0_director-3control_2compute-titancluster', filter_version) == '13'
 	assert get_osp_version('DFG-upgrades-updates-from-osp13.0-to-osp16.2-passed_phase1-HA-ipv4', filter_version) == '16.2'
 	assert get_osp_version('DFG-all-unified-weekly-multijob', filter_version) is None
+
+
+def test_get_osp_versions():
+	job_names = [
+		'DFG-ceph-rhos-16.1_director-rhel-virthost-3cont_2comp_3ceph-ipv4-geneve-monolithic',
+		'DFG-upgrades-updates-from-13-to-16.2-passed_phase1-HA-ipv4',
+		'DFG-all-unified-weekly-multijob'
+	]
+	assert get_osp_versions(job_names) == {job_names[0]: '16.1', job_names[1]: '16.2', job_names[2]: None}
+	assert get_osp_versions(job_names, r'13') == {job_names[0]: None, job_names[1]: '13', job_names[2]: None}
+	assert get_osp_versions([]) == {}
+
+
+def test_run_requests():
+	def requests():
+		job_info = yield ('get_job_info', 'job1')
+		try:
+			yield ('get_job_info', 'missing')
+		except IndexError:
+			return job_info['name']
+
+	server = MockServer([mock_job('job1')])
+	assert run_requests(server, requests()) == 'job1'
+	assert server.calls == [('get_job_info', 'job1'), ('get_job_info', 'missing')]
@@ -0,0 +1,72 @@
+from email.mime.text import MIMEText
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+
+from jeeves.mail import *
+
+
+class MockSMTP:
+	''' stand-in for smtplib.SMTP which drops the connection on the message to fail@example.com once
+		and after handing over the message to drop@example.com, and refuses bad@example.com for good
+	'''
+	connections = 0
+	failed = False
+	sent = []
+
+	def __init__(self, host):
+		MockSMTP.connections += 1
+
+	def starttls(self):
+		pass
+
+	def ehlo_or_helo_if_needed(self):
+		pass
+
+	def sendmail(self, from_addr, to_addrs, msg):
+		if to_addrs == ['fail@example.com'] and not MockSMTP.failed:
+			MockSMTP.failed = True
+			raise SMTPServerDisconnected('Connection unexpectedly closed')
+		if to_addrs == ['bad@example.com']:
+			raise SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')})
+		if to_addrs == ['refused@example.com']:
+			return {'refused@example.com': (550, b'No such user')}
+		self.data(msg)
+		MockSMTP.sent.append(to_addrs)
+		if to_addrs == ['drop@example.com']:
+			raise SMTPServerDisconnected('Connection unexpectedly closed')
+		return {}
+
+	def data(self, msg):
+		pass
+
+	def quit(self):
+		pass
+
+
+def mock_message(recipient):
+	msg = MIMEText('body')
+	msg['From'] = 'jeeves@example.com'
+	msg['To'] = recipient
+	return (msg, [recipient])
+
+
+def test_send_emails(monkeypatch):
+	monkeypatch.setattr('jeeves.mail.SMTP', MockSMTP)
+	config = {'smtp_host': 'localhost', 'smtp_max_messages_per_connection': 2}
+	recipients = ['a@example.com', 'fail@example.com', 'refused@example.com', 'b@example.com']
+
+	results = send_emails(config, [mock_message(recipient) for recipient in recipients])
+	assert [result['recipients'] for result in results] == [[recipient] for recipient in recipients]
+	assert [is_delivered(result) for result in results] == [True, True, False, True]
+	assert MockSMTP.connections == 3
+	assert send_emails(config, []) == []
+
+
+def test_send_messages_not_retried(monkeypatch):
+	monkeypatch.setattr('jeeves.mail.SMTP', MockSMTP)
+	MockSMTP.sent = []
+
+	# messages the server may have accepted and permanent failures are not sent again
+	results = send_messages({'smtp_host': 'localhost'}, [mock_message('drop@example.com'), mock_message('bad@example.com')])
+	assert [is_delivered(result) for result in results] == [False, False]
+	assert isinstance(results[1]['error'], SMTPRecipientsRefused)
+	assert MockSMTP.sent == [['drop@example.com']]
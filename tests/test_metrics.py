@@ -0,0 +1,63 @@
+from jeeves.metrics import *
+
+REPORT_STATS = {
+	'num_jobs': 4,
+	'results': {'success': 2, 'unstable': 1, 'failure': 1, 'aborted': 0, 'missing': 0, 'error': 0},
+	'results_per_version': {'16.2': {'success': 2, 'unstable': 1, 'failure': 1, 'aborted': 0, 'missing': 0, 'error': 0}},
+	'num_covered': 1,
+	'coverage': 0.5,
+	'bugs': {'total': 2, 'unique': 1},
+	'tickets': {'total': 0, 'unique': 0},
+	'num_dropped': 0
+}
+
+PROFILE = {
+	'started_at': '2024-01-01T08:00:00',
+	'seconds': 1.5,
+	'phases': {'fetch jobs': 1.0},
+	'services': {
+		'jenkins': {
+			'endpoints': {
+				'/job/*/api/json': {'count': 3, 'errors': 1, 'seconds': 0.3, 'bytes': 300, 'latency_buckets': {'0.1': 2, '+Inf': 3}}
+			}
+		}
+	}
+}
+
+
+def test_escape_label_value():
+	assert escape_label_value('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_generate_metrics():
+	metrics = generate_metrics({'report': (REPORT_STATS, PROFILE)}).splitlines()
+	assert metrics[0] == '# TYPE jeeves_jobs gauge'
+	assert metrics[-1] == '# EOF'
+	assert 'jeeves_jobs{result="unstable"} 1' in metrics
+	assert 'jeeves_version_jobs{osp_version="16.2",result="success"} 2' in metrics
+	assert 'jeeves_blocker_coverage_ratio 0.5' in metrics
+	assert 'jeeves_phase_duration_seconds{mode="report",phase="fetch jobs"} 1.0' in metrics
+	assert 'jeeves_api_requests{mode="report",service="jenkins",endpoint="/job/*/api/json"} 3' in metrics
+	assert 'jeeves_api_request_duration_seconds_bucket{le="+Inf",mode="report",service="jenkins",endpoint="/job/*/api/json"} 3' in metrics
+
+	# every family is declared once, before its samples
+	types = [line for line in metrics if line.startswith('# TYPE')]
+	assert len(types) == len(set(types))
+
+	# runs ending early only export run metrics
+	metrics = generate_metrics({'remind': (None, PROFILE)})
+	assert 'jeeves_reminders' not in metrics
+	assert 'jeeves_run_duration_seconds{mode="remind"} 1.5' in metrics
+
+	# runs of both modes share metric families
+	metrics = generate_metrics({'report': (REPORT_STATS, PROFILE), 'remind': (None, PROFILE)}).splitlines()
+	assert metrics.count('# TYPE jeeves_run_duration_seconds gauge') == 1
+	assert 'jeeves_run_duration_seconds{mode="remind"} 1.5' in metrics
+
+
+def test_export_metrics(tmp_path):
+	config = {'metrics_file': str(tmp_path / 'metrics' / 'jeeves_{mode}.prom')}
+	export_metrics(config, 'remind', {'num_owners': 2, 'num_failing_jobs': 1, 'num_reminders': 1, 'num_delivered': 1}, PROFILE)
+	with open(str(tmp_path / 'metrics' / 'jeeves_remind.prom')) as file:
+		assert 'jeeves_delivered_reminders 1' in file.read()
+	assert not (tmp_path / 'metrics' / 'jeeves_remind.prom.tmp').exists()
@@ -1,5 +1,100 @@
+from benchmarks.simulator import Dataset, start_servers, stop_servers
 from jeeves.remind import *
 
 
-def test_run_remind():
-    pass
+class MockSMTP:
+    ''' stand-in for smtplib.SMTP recording every message sent
+    '''
+    sent = []
+
+    def __init__(self, host):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def starttls(self):
+        pass
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def data(self, msg):
+        pass
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        MockSMTP.sent.append(to_addrs)
+        return {}
+
+
+def test_run_remind(monkeypatch):
+    fetched = []
+
+    def mock_get_jenkins_job_info(server, job_name, **kwargs):
+        fetched.append(job_name)
+        return {
+            'job_url': 'https://jenkins.example.com/job/{}/'.format(job_name),
+            'lcb_num': 1,
+            'lcb_url': 'https://jenkins.example.com/job/{}/1/'.format(job_name),
+            'compose': 'N/A',
+            'second_compose': None,
+            'lcb_result': 'SUCCESS' if job_name == 'job-16.2-passing' else 'FAILURE',
+            'build_days_ago': 0,
+            'tempest_tests_failed': None,
+            'stage_failure': 'N/A'
+        }
+
+    monkeypatch.setattr('jeeves.jobs.get_jenkins_job_info', mock_get_jenkins_job_info)
+    monkeypatch.setattr('jeeves.remind.get_bugs_dict', lambda bug_ids, config: {})
+    monkeypatch.setattr('jeeves.remind.get_tickets_dict', lambda ticket_ids, config: {})
+    monkeypatch.setattr('jeeves.mail.SMTP', MockSMTP)
+
+    blockers = {
+        'job-16.2-shared': {'owners': ['a@example.com', 'b@example.com']},
+        'job-16.2-passing': {'owners': ['b@example.com']},
+        'job-13-failing': {'owners': ['a@example.com']},
+        'job-13-unowned': {}
+    }
+    config = {'email_from': 'jeeves@example.com', 'smtp_host': 'localhost'}
+    header = {'date': '', 'source': 'blockers.yaml', 'fpn': None, 'fpv': None}
+    run_remind(config, blockers, None, header)
+
+    assert sorted(fetched) == ['job-13-failing', 'job-16.2-passing', 'job-16.2-shared']
+    assert sorted(MockSMTP.sent) == [['a@example.com'], ['b@example.com']]
+
+
+def test_run_remind_instances():
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset)
+    other_servers = start_servers(dataset)
+    try:
+        config = {
+            'bz_url': servers['bugzilla'].base_url,
+            'jira_url': servers['jira'].base_url,
+            'jira_token': 'token',
+            'certificate': False,
+            'job_search_fields': 'DFG-bench',
+            'jenkins_instances': [
+                {'name': 'a', 'jenkins_url': servers['jenkins'].base_url},
+                {'name': 'b', 'jenkins_url': other_servers['jenkins'].base_url}
+            ]
+        }
+        header = {'date': '', 'source': 'blockers.yaml', 'fpn': None, 'fpv': None}
+        remind_stats = run_remind(config, dataset.blockers(), None, header, no_email=True)
+    finally:
+        stop_servers(servers)
+        stop_servers(other_servers)
+
+    # owned jobs listed by both instances are fetched from both, each getting its own row
+    for server in (servers['jenkins'], other_servers['jenkins']):
+        assert server.stats.requests['jobs tree'] == 1
+        assert server.stats.requests['job info'] == 6
+    assert remind_stats['num_failing_jobs'] % 2 == 0
+    assert remind_stats['num_failing_jobs'] > 0
+    assert remind_stats['num_reminders'] > 0
@@ -0,0 +1,63 @@
+from jeeves.render import *
+
+
+def mock_row():
+	return {
+		'job_url': 'https://jenkins.example.com/job/job1/',
+		'builds': [1, 3],
+		'bugs': [{'bug_name': '[NEW] bug summary', 'bug_url': 'https://bugzilla.example.com/show_bug.cgi?id=1'}],
+		'tickets': [{'ticket_name': 'RHOSINFRA-1', 'ticket_url': 'https://jira.example.com/browse/RHOSINFRA-1'}],
+		'other': [{'other_name': 'Link', 'other_url': None}]
+	}
+
+
+def test_cached_blockers():
+	env = get_environment({})
+	assert get_environment({}) is env
+	reset_render_stats()
+
+	template = env.from_string("{% from 'macros.html' import blockers %}{{ blockers(row) }}|{{ cached_blockers(row) }}|{{ cached_blockers(row) }}")
+	uncached, cached, cached_again = render_template(template, row=mock_row()).split('|')
+	assert cached == uncached
+	assert cached_again == uncached
+	assert render_blockers.cache_info().hits == 1
+	assert render_stats['renders'] == 1
+
+
+def test_get_blockers_key():
+	row = mock_row()
+	assert get_blockers_key(row) == get_blockers_key(mock_row())
+	row['builds'] = None
+	assert get_blockers_key(row) != get_blockers_key(mock_row())
+
+
+def test_generate_template():
+	template = get_environment({}).from_string("{% for row in rows %}<p>{{ row }}</p>{% endfor %}")
+	reset_render_stats()
+	assert ''.join(generate_template(template, rows=range(3))) == render_template(template, rows=range(3))
+	assert render_stats['renders'] == 2
+
+
+def test_get_template_fields(tmp_path, monkeypatch):
+	monkeypatch.setattr('jeeves.render.TEMPLATES_DIR', str(tmp_path))
+	monkeypatch.setattr('jeeves.render.environments', {})
+	templates = {
+		'plain.html': "{% from 'macros.html' import result %}{% for row in rows %}{{ row.job_name }}{{ result(row) }}{% endfor %}",
+		'macros.html': "{% macro result(row) %}{{ row['lcb_result'] }}{% endmacro %}",
+		'summary.html': "{% for key, value in summary.items() %}{{ key }}{% endfor %}{% for job in rows|reverse %}{{ job.job_name }}{% endfor %}",
+		'dynamic.html': "{% for job in rows|sort(attribute='job_name') %}{% for key, value in job.items() %}{{ value }}{% endfor %}{% endfor %}",
+		'subscript.html': "{% for field in fields %}{% for row in rows %}{{ row[field] }}{% endfor %}{% endfor %}"
+	}
+	for name, source in templates.items():
+		(tmp_path / name).write_text(source)
+
+	fields = get_template_fields({}, 'plain.html')
+	assert {'job_name', 'lcb_result'} <= fields
+	assert not uses_fields(fields, ['stage_name', 'stage_urls'])
+	assert not uses_fields(get_template_fields({}, 'summary.html'), ['stage_name'])
+
+	# fields of rows accessed dynamically or missing templates mean any field may be used
+	assert get_template_fields({}, 'dynamic.html') is None
+	assert get_template_fields({}, 'subscript.html') is None
+	assert get_template_fields({}, 'missing.html') is None
+	assert uses_fields(None, ['stage_name'])
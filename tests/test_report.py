@@ -1,5 +1,259 @@
+import os
+import pytest
+import jenkins
+import jeeves.render
+
+from benchmarks.simulator import Dataset, start_servers, stop_servers
+from jeeves.common import generate_header
+from jeeves.connection import get_job_search_fields
+from jeeves.history import get_history_store
+from jeeves.instrumentation import record_run
 from jeeves.report import *
 
 
-def test_run_report():
-    pass
+def generate_config(servers, **kwargs):
+    config = {
+        'jenkins_url': servers['jenkins'].base_url,
+        'job_search_fields': 'DFG-bench',
+        'bz_url': servers['bugzilla'].base_url,
+        'jira_url': servers['jira'].base_url,
+        'jira_token': 'token',
+        'certificate': False,
+        'supported_versions': ['13', '16.1', '16.2']
+    }
+    config.update(kwargs)
+    return config
+
+
+def test_run_report(tmp_path, monkeypatch):
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset)
+    try:
+        config = generate_config(servers)
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        server = jenkins.Jenkins(config['jenkins_url'])
+        header = generate_header(config['job_search_fields'])
+        report_stats = run_report(config, dataset.blockers(), False, 'report_template.html', True, False, server, header)
+    finally:
+        stop_servers(servers)
+
+    assert report_stats['num_jobs'] == 6
+    assert sum(report_stats['results'].values()) == 6
+    archive = [os.path.join(root, name) for root, dirs, files in os.walk(tmp_path / 'archive') for name in files]
+    assert len(archive) == 1
+    with open(archive[0]) as file:
+        htmlcode = file.read()
+    for job_name in dataset.job_names:
+        assert job_name in htmlcode
+    assert servers['jenkins'].stats.requests['jobs tree'] == 1
+    assert 'job list' not in servers['jenkins'].stats.requests
+
+    # the recent builds of every job not passing are fetched with one request each
+    assert servers['jenkins'].stats.requests['job tree'] == 6 - report_stats['results']['success']
+    assert 'builds not passing' in htmlcode
+
+
+def test_run_report_incremental(tmp_path, monkeypatch, capsys):
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset)
+    try:
+        config = generate_config(servers, state_file=str(tmp_path / 'state.json'), incremental=True)
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        server = jenkins.Jenkins(config['jenkins_url'])
+        header = generate_header(config['job_search_fields'])
+
+        # first run fetches every job, second run only lists jobs
+        run_report(config, dataset.blockers(), False, 'report_template.html', True, False, server, header)
+        servers['jenkins'].stats.reset()
+        run_report(config, dataset.blockers(), False, 'report_template.html', True, False, server, header)
+    finally:
+        stop_servers(servers)
+
+    assert 'reusing 6 unchanged jobs, fetching 0' in capsys.readouterr().out
+    assert servers['jenkins'].stats.requests == {'jobs tree': 1}
+
+
+def test_run_report_engines(tmp_path, monkeypatch):
+    pytest.importorskip('aiohttp')
+    dataset = Dataset(num_jobs=12, history=4, filter_every=2)
+    servers = start_servers(dataset)
+    reports = {}
+    try:
+        config = generate_config(servers, filter_param_name='PUBLISH_TO_POLARION', filter_param_value=True, cause_action_class='timer')
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        server = jenkins.Jenkins(config['jenkins_url'])
+        header = generate_header(config['job_search_fields'])
+        for engine in ['sync', 'async']:
+            os.makedirs(str(tmp_path / engine))
+            monkeypatch.chdir(tmp_path / engine)
+            run_report(config, dataset.blockers(), False, 'report_template.html', True, False, server, header, engine)
+            archive = [os.path.join(root, name) for root, dirs, files in os.walk('archive') for name in files]
+            with open(archive[0]) as file:
+                reports[engine] = file.read()
+    finally:
+        stop_servers(servers)
+
+    # both engines produce byte-identical reports
+    assert 'Simulated ticket' in reports['sync']
+    assert reports['sync'] == reports['async']
+
+
+def test_run_report_profile(tmp_path, monkeypatch):
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset)
+    try:
+        config = generate_config(servers)
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        server = jenkins.Jenkins(config['jenkins_url'])
+        header = generate_header(config['job_search_fields'])
+        with record_run(config, 'report', profile_functions=True) as profile:
+            run_report(config, dataset.blockers(), False, 'report_template.html', True, False, server, header)
+        run_profile = profile.to_dict()
+    finally:
+        stop_servers(servers)
+
+    # calls made by worker threads are profiled along with those of the main thread
+    assert any(function['function'].endswith('(get_jenkins_job_info)') for function in run_profile['functions'])
+
+    # every request received by the simulated servers is recorded, except those made while connecting to Jira
+    assert run_profile['services']['jenkins']['requests'] == servers['jenkins'].stats.total()
+    assert run_profile['services']['bugzilla']['requests'] == servers['bugzilla'].stats.total()
+    jira_stats = servers['jira'].stats
+    assert run_profile['services']['jira']['requests'] == jira_stats.total() - jira_stats.requests['server info']
+    assert 'fetch jobs' in run_profile['phases']
+    assert len(run_profile['slowest_jobs']) == 6
+
+
+def test_run_report_template_fields(tmp_path, monkeypatch):
+    dataset = Dataset(num_jobs=12, history=3)
+    servers = start_servers(dataset)
+    try:
+        config = generate_config(servers)
+        templates_dir = tmp_path / 'templates'
+        templates_dir.mkdir()
+        (templates_dir / 'plain_template.html').write_text("{% for row in rows %}{{ row.job_name }}: {{ row.lcb_result }}\n{% endfor %}")
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', str(templates_dir))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        server = jenkins.Jenkins(config['jenkins_url'])
+        header = generate_header(config['job_search_fields'])
+        report_stats = run_report(config, dataset.blockers(), False, 'plain_template.html', True, False, server, header)
+    finally:
+        stop_servers(servers)
+
+    # stages of failed builds and recent builds of jobs not passing are not fetched for templates not showing them
+    assert report_stats['results']['failure'] > 0
+    assert 'build stages' not in servers['jenkins'].stats.requests
+    assert 'job tree' not in servers['jenkins'].stats.requests
+    with open(report_stats['report_file']) as file:
+        htmlcode = file.read()
+    for job_name in dataset.job_names:
+        assert job_name in htmlcode
+
+
+def test_run_report_dropped_jobs(tmp_path, monkeypatch):
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset, error_every=3)
+    try:
+        config = generate_config(servers, jenkins_retries=0)
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        server = jenkins.Jenkins(config['jenkins_url'])
+        header = generate_header(config['job_search_fields'])
+        run_report(config, dataset.blockers(), False, 'report_template.html', True, False, server, header)
+    finally:
+        stop_servers(servers)
+
+    archive = [os.path.join(root, name) for root, dirs, files in os.walk(tmp_path / 'archive') for name in files]
+    with open(archive[0]) as file:
+        htmlcode = file.read()
+    assert 'jobs could not be fetched from Jenkins (0 requests retried)' in htmlcode
+
+
+@pytest.mark.parametrize('engine', ['sync', 'async'])
+def test_run_report_instance_listing_error(tmp_path, monkeypatch, engine, capsys):
+    if engine == 'async':
+        pytest.importorskip('aiohttp')
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset)
+    try:
+        config = generate_config(servers, jenkins_url=None, jenkins_retries=0, jenkins_instances=[
+            {'name': 'a', 'jenkins_url': servers['jenkins'].base_url},
+            {'name': 'b', 'jenkins_url': servers['jenkins'].base_url + '/missing/'}
+        ])
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        header = generate_header(get_job_search_fields(config))
+        report_stats = run_report(config, dataset.blockers(), False, 'report_template.html', True, False, None, header, engine)
+    finally:
+        stop_servers(servers)
+
+    # an instance whose job listing fails is logged and has no jobs, the other instances are still reported
+    assert '[b] Error listing Jenkins jobs' in capsys.readouterr().out
+    assert report_stats['num_jobs'] == 6
+
+
+@pytest.mark.parametrize('engine', ['sync', 'async'])
+def test_run_report_instances(tmp_path, monkeypatch, engine):
+    if engine == 'async':
+        pytest.importorskip('aiohttp')
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset)
+    other_servers = start_servers(dataset)
+    try:
+        config = generate_config(servers, jenkins_url=None, state_file=str(tmp_path / 'state.json'), jenkins_instances=[
+            {'name': 'a', 'jenkins_url': servers['jenkins'].base_url, 'job_search_fields': 'DFG-bench-0000[0-2]'},
+            {'name': 'b', 'jenkins_url': other_servers['jenkins'].base_url, 'job_search_fields': 'DFG-bench-0000[3-5]', 'max_workers': 2}
+        ])
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        header = generate_header(get_job_search_fields(config))
+        report_stats = run_report(config, dataset.blockers(), False, 'report_template.html', True, False, None, header, engine)
+    finally:
+        stop_servers(servers)
+        stop_servers(other_servers)
+
+    # jobs of both instances are merged into one report, with a summary section per version and instance
+    assert report_stats['num_jobs'] == 6
+    assert sorted(report_stats['results_per_version']) == ['13 (a)', '13 (b)', '16.1 (a)', '16.1 (b)', '16.2 (a)', '16.2 (b)']
+    with open(report_stats['report_file']) as file:
+        htmlcode = file.read()
+    assert 'Summary for 16.2 (a)' in htmlcode
+    assert 'a: DFG-bench-0000[0-2]; b: DFG-bench-0000[3-5]' in htmlcode
+    for server in (servers['jenkins'], other_servers['jenkins']):
+        assert server.stats.requests['jobs tree'] == 1
+        assert server.stats.requests['job info'] == 3
+    assert os.path.exists(tmp_path / 'state.a.json')
+    assert os.path.exists(tmp_path / 'state.b.json')
+
+
+def test_run_report_history(tmp_path, monkeypatch):
+    dataset = Dataset(num_jobs=6, history=3)
+    servers = start_servers(dataset)
+    try:
+        config = generate_config(servers, history_file=str(tmp_path / 'history.sqlite'))
+        monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+        monkeypatch.setattr(jeeves.render, 'environments', {})
+        monkeypatch.chdir(tmp_path)
+        server = jenkins.Jenkins(config['jenkins_url'])
+        header = generate_header(config['job_search_fields'])
+        report_stats = run_report(config, dataset.blockers(), False, 'report_template.html', True, False, server, header)
+    finally:
+        stop_servers(servers)
+
+    # rows of the report are recorded and the report shows trends computed from them
+    with open(report_stats['report_file']) as file:
+        htmlcode = file.read()
+    assert 'Pass Rate Trends' in htmlcode
+    store = get_history_store(config)
+    assert store.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0] == 6
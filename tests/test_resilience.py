@@ -0,0 +1,62 @@
+import requests
+
+from benchmarks.simulator import Dataset, start_servers, stop_servers
+from jeeves.resilience import *
+
+
+def test_get_retry_after_seconds():
+	assert get_retry_after_seconds(None) is None
+	assert get_retry_after_seconds('2') == 2.0
+	assert get_retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+	assert get_retry_after_seconds('soon') is None
+
+
+def test_get_retry_delay():
+	resilience = JenkinsResilience(retries=2, backoff=1, max_backoff=3, error_budget=3)
+	assert 0.5 <= resilience.get_retry_delay(0) <= 1
+	assert 1 <= resilience.get_retry_delay(1) <= 2
+	assert resilience.get_retry_delay(2) is None
+
+	# requests asked to wait longer than max_backoff are given up rather than retried early
+	assert resilience.get_retry_delay(0, retry_after='120') is None
+	assert resilience.num_retries == 2
+	assert resilience.get_retry_delay(1, retry_after='2.5') == 2.5
+
+	# error budget is exhausted
+	assert resilience.get_retry_delay(0) is None
+	assert resilience.num_retries == 3
+
+
+def test_circuit_breaker():
+	resilience = JenkinsResilience(breaker_threshold=2, breaker_cooldown=60)
+	resilience.record_failure()
+	resilience.record_success()
+	resilience.record_failure()
+	resilience.check_circuit()
+	resilience.record_failure()
+	try:
+		resilience.check_circuit()
+		assert False
+	except CircuitOpenError:
+		pass
+	assert resilience.get_retry_delay(0) is None
+	assert (resilience.num_failures, resilience.num_breaker_trips) == (3, 1)
+
+
+def test_retrying_adapter():
+	servers = start_servers(Dataset(num_jobs=1), error_every=2)
+	try:
+		resilience = JenkinsResilience(backoff=0)
+		session = requests.Session()
+		session.mount('http://', RetryingAdapter(resilience))
+		for i in range(3):
+			assert session.get(servers['jenkins'].base_url + '/api/json').status_code == 200
+		assert resilience.num_retries == 2
+
+		# requests failing after all retries are returned as is
+		resilience = JenkinsResilience(retries=0)
+		session.mount('http://', RetryingAdapter(resilience))
+		assert [session.get(servers['jenkins'].base_url + '/api/json').status_code for i in range(2)] == [503, 200]
+		assert resilience.num_failures == 1
+	finally:
+		stop_servers(servers)
@@ -0,0 +1,94 @@
+import os
+import json
+import yaml
+import datetime
+import jenkins
+import requests
+import jeeves.render
+
+from benchmarks.simulator import Dataset, start_servers, stop_servers
+from jeeves.serve import *
+
+
+def test_cron_schedule():
+	schedule = CronSchedule('*/15 8-18 * * 1-5')
+	assert schedule.minutes == {0, 15, 30, 45}
+	assert schedule.matches(datetime.datetime(2024, 1, 5, 8, 30))
+	assert not schedule.matches(datetime.datetime(2024, 1, 6, 8, 30))
+
+	# friday evening to monday morning
+	assert schedule.get_next_run(datetime.datetime(2024, 1, 5, 18, 45, 10)) == datetime.datetime(2024, 1, 8, 8, 0)
+	assert CronSchedule('0 9 * * 1').get_next_run(datetime.datetime(2024, 1, 1, 9, 0)) == datetime.datetime(2024, 1, 8, 9, 0)
+
+	# either day field matches if both are restricted
+	schedule = CronSchedule('0 0 1 * 0')
+	assert schedule.matches(datetime.datetime(2024, 1, 1, 0, 0))
+	assert schedule.matches(datetime.datetime(2024, 1, 7, 0, 0))
+	assert not schedule.matches(datetime.datetime(2024, 1, 8, 0, 0))
+
+	for expression in ['* * * *', '60 * * * *', '5-1 * * * *']:
+		try:
+			CronSchedule(expression)
+			assert False, expression
+		except ValueError:
+			pass
+
+
+def test_get_due_runs():
+	assert get_due_runs([STARTUP_JOB]) == [('report', False, True), ('remind', False, True)]
+	assert get_due_runs(['refresh', 'full refresh', 'remind']) == [('report', False, True), ('remind', True, True)]
+	assert get_due_runs(['report']) == [('report', True, False)]
+
+	# refreshes do not fetch owned jobs again for reminders which are not due
+	assert get_due_runs(['refresh']) == [('report', False, False)]
+	assert get_due_runs(['full refresh']) == [('report', False, True)]
+	assert get_due_runs(['remind']) == [('remind', True, False)]
+
+
+def test_service(tmp_path, monkeypatch):
+	dataset = Dataset(num_jobs=6, history=3, num_owners=2)
+	servers = start_servers(dataset)
+	httpd = None
+	try:
+		config = {
+			'jenkins_url': servers['jenkins'].base_url,
+			'job_search_fields': 'DFG-bench',
+			'bz_url': servers['bugzilla'].base_url,
+			'jira_url': servers['jira'].base_url,
+			'jira_token': 'token',
+			'certificate': False,
+			'supported_versions': ['13', '16.1', '16.2']
+		}
+		monkeypatch.setattr(jeeves.render, 'TEMPLATES_DIR', os.path.abspath('templates'))
+		monkeypatch.setattr(jeeves.render, 'environments', {})
+		monkeypatch.chdir(tmp_path)
+		with open('blockers.yaml', 'w') as file:
+			yaml.safe_dump(dataset.blockers(), file)
+
+		service = JeevesService(config, 'blockers.yaml', jenkins.Jenkins(config['jenkins_url']))
+		httpd = start_http_server(service, '127.0.0.1', 0)
+		url = 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+		assert requests.get(url).status_code == 503
+
+		for mode, send_email, full in get_due_runs([STARTUP_JOB]):
+			service.run(mode, send_email, full)
+
+		response = requests.get(url)
+		assert response.status_code == 200
+		assert dataset.job_names[0] in response.text
+		status = requests.get(url + '/status').json()
+		assert status['runs']['report']['error'] is None
+		assert len(status['owners']) > 0
+		assert status['owners'][0] in requests.get(url + '/remind/' + status['owners'][0]).text
+		assert requests.get(url + '/remind/nobody').status_code == 404
+		metrics = requests.get(url + '/metrics').text
+		assert 'jeeves_run_duration_seconds{mode="report"}' in metrics
+		assert 'jeeves_run_duration_seconds{mode="remind"}' in metrics
+	finally:
+		if httpd is not None:
+			httpd.shutdown()
+		stop_servers(servers)
+
+	# refreshes neither email nor archive anything
+	assert not os.path.exists(str(tmp_path / 'archive'))
+	assert servers['smtp'].stats.total() == 0
@@ -0,0 +1,30 @@
+import time
+
+from jeeves.state import *
+
+
+def test_get_last_completed_build():
+	assert get_last_completed_build({'lastCompletedBuild': {'number': 5}}) == 5
+	assert get_last_completed_build({'lastCompletedBuild': None}) is None
+	assert get_last_completed_build({}) is None
+
+
+def test_state_roundtrip(tmp_path):
+	state_file = str(tmp_path / 'state' / 'state.json')
+	filters = {'filter_param_name': None, 'filter_param_value': None, 'cause_action_class': 'timer'}
+	state = load_state(state_file, filters)
+	assert state['jobs'] == {}
+
+	two_days_ago = (time.time() - 2 * 86400 - 60) * 1000
+	set_saved_job_info(state, 'job1', 5, {'lcb_num': 5, 'build_days_ago': 0, 'lcb_timestamp': two_days_ago})
+	set_saved_job_info(state, 'job2', 3, False)
+	save_state(state_file, state)
+
+	state = load_state(state_file, filters)
+	assert list(state['jobs']) == ['job1']
+	assert get_saved_job_info(state, 'job1', 5) == {'lcb_num': 5, 'build_days_ago': 2, 'lcb_timestamp': two_days_ago}
+	assert get_saved_job_info(state, 'job1', 6) is None
+	assert get_saved_job_info(state, 'job2', 3) is None
+
+	# state saved with other build filters is discarded
+	assert load_state(state_file, dict(filters, cause_action_class='user'))['jobs'] == {}